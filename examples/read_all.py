@@ -9,10 +9,10 @@ def main():
     time.sleep(2)
 
     while True:
-        data_buffer = pipower5.read_all()
+        data_buffer = pipower5.read_snapshot()
 
-        shutdown_request = pipower5.read_shutdown_request()
-        button_state = pipower5.read_power_btn()
+        shutdown_request = data_buffer['shutdown_request']
+        button_state = data_buffer['power_btn']
 
         print(f'''
 Input:
@@ -35,9 +35,9 @@ Battery:
 Internal:
     shutdown request: {int(shutdown_request)} - {shutdown_request.name}
     button state: {int(button_state)} - {button_state.name}
-    max charging current: {pipower5.get_max_charge_current()} mA
-    default on: {'on' if pipower5.read_default_on() else 'off'}
-    shutdown percentage: {pipower5.read_shutdown_percentage()} %
+    max charging current: {data_buffer['max_charge_current']} mA
+    default on: {'on' if data_buffer['default_on'] else 'off'}
+    shutdown percentage: {data_buffer['shutdown_percentage']} %
 ''')
         print('')
         print('')
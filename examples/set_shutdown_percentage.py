@@ -17,7 +17,7 @@ def test(value):
     print(f"Setting shutdown percentage to {value}%")
     pipower5.write_shutdown_percentage(value)
     time.sleep(2) # Wait for the shutdown percentage to be updated
-    current_shutdown_battery_percentage = pipower5.read_shutdown_percentage()
+    current_shutdown_battery_percentage = pipower5.read_shutdown_percentage(cached=False)
     print(f"Shutdown percentage: {current_shutdown_battery_percentage}%")
     if current_shutdown_battery_percentage == value:
         print("Success")
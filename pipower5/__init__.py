@@ -55,26 +55,19 @@ def main():
     parser.add_argument("-cp", "--config-path", nargs='?', default='', help="Config path")
 
     parser.add_argument('-sp', '--shutdown-percentage', nargs='?', default='', help='Set shutdown percentage, leave empty to read')
-    parser.add_argument('-iv', '--input-voltage', action='store_true', help='Read input voltage')
-    parser.add_argument('-ic', '--input-current', action='store_true', help='Read input current')
-    parser.add_argument('-ov', '--output-voltage', action='store_true', help='Read output voltage')
-    parser.add_argument('-oc', '--output-current', action='store_true', help='Read output current')
-    parser.add_argument('-bv', '--battery-voltage', action='store_true', help='Read battery voltage')
-    if BOARD_VERSION == '50':
-        parser.add_argument('-b1v', '--battery-1-voltage', action='store_true', help='Read battery 1 voltage')
-        parser.add_argument('-b2v', '--battery-2-voltage', action='store_true', help='Read battery 2 voltage')
-    parser.add_argument('-bc', '--battery-current', action='store_true', help='Read battery current')
-    parser.add_argument('-bp', '--battery-percentage', action='store_true', help='Read battery percentage')
-    parser.add_argument('-bs', '--battery-source', action='store_true', help='Read battery source')
-    parser.add_argument('-ii', '--is-input-plugged_in', action='store_true', help='Read is input plugged in')
-    parser.add_argument('-ichg', '--is-charging', action='store_true', help='Read is charging')
-    parser.add_argument('-do', '--default-on', action='store_true', help='Read default on')
-    parser.add_argument('-sr', '--shutdown-request', action='store_true', help='Read shutdown request')
-    parser.add_argument('-pb', '--power-btn', action='store_true', help='Read power button')
-    parser.add_argument('-cc', '--charging-current', action='store_true', help='Max charging current')
+    # Register read flags, from the register map
+    for name, register in PiPower5.REGISTERS.items():
+        if register.flags and register.is_available(BOARD_VERSION):
+            parser.add_argument(*register.flags, dest=name, action='store_true', help=f'Read {register.label.lower()}')
     parser.add_argument('-a', '--all', action='store_true', help='Show all status')
-    parser.add_argument('-fv', '--firmware', action='store_true', help='PiPower5 firmware version')
+    parser.add_argument('-bst', '--bus-stats', action='store_true', help='Show I2C bus stats of the running service')
     parser.add_argument('-pfs', '--power-failure-simulation', nargs='?', default='', help='Power failure simulation')
+    parser.add_argument('-ie', '--input-enable', choices=['on', 'off'], help='Enable or disable input')
+    parser.add_argument('-be', '--battery-enable', choices=['on', 'off'], help='Enable or disable battery')
+    parser.add_argument('-oe', '--output-enable', choices=['on', 'off'], help='Enable or disable output, off powers off the Raspberry Pi')
+    parser.add_argument('-rb', '--reset-board', action='store_true', help='Reset PiPower5')
+    parser.add_argument('--enter-iap', action='store_true', help='Enter PiPower5 firmware update mode')
+    parser.add_argument('-y', '--yes', action='store_true', help='Do not ask to confirm disabling input, battery or output, reset or firmware update mode')
     parser.add_argument("-seo", '--send-email-on', nargs='?', default='', help=f"Send email on: {AVAILABLE_EVENTS}")
     parser.add_argument("-set", '--send-email-to', nargs='?', default='', help="Email address to send email to")
     parser.add_argument("-ss", '--smtp-server', nargs='?', default='', help="SMTP server")
@@ -200,77 +193,144 @@ def main():
             else:
                 pipower5.write_shutdown_percentage(int(args.shutdown_percentage))
                 time.sleep(0.5)
-                if pipower5.read_shutdown_percentage() == int(args.shutdown_percentage):
+                if pipower5.read_shutdown_percentage(cached=False) == int(args.shutdown_percentage):
                     print(f"Success, shutdown battery percentage: {pipower5.read_shutdown_percentage()}%")
     
-    if args.input_voltage:
-        print(f"Input voltage: {pipower5.read_input_voltage()} mV")
-    if args.input_current:
-        print(f"Input current: {pipower5.read_input_current()} mA")
-    if args.output_voltage:
-        print(f"Output voltage: {pipower5.read_output_voltage()} mV")
-    if args.output_current:
-        print(f"Output current: {pipower5.read_output_current()} mA")
-    if args.battery_voltage:
-        print(f"Battery voltage: {pipower5.read_battery_voltage()} mV")
-    if BOARD_VERSION == '50':
-        if args.battery_1_voltage:
-            print(f"Battery 1 voltage: {pipower5.read_battery_1_voltage()} mV")
-        if args.battery_2_voltage:
-            print(f"Battery 2 voltage: {pipower5.read_battery_2_voltage()} mV")
-    if args.battery_current:
-        print(f"Battery current: {pipower5.read_battery_current()} mA")
-    if args.battery_percentage:
-        print(f"Battery percentage: {pipower5.read_battery_percentage()} %")
-    if args.battery_source:
-        power_source = pipower5.read_power_source()
-        print(f"Power source: {power_source} ({'Battery' if power_source == pipower5.BATTERY else 'External'})")
-    if args.is_input_plugged_in:
-        print(f"Input plugged in: {pipower5.read_is_input_plugged_in()}")
-    if args.is_charging:
-        print(f"Charging: {pipower5.read_is_charging()}")
-    if args.default_on:
-        print(f"Default on: {'on' if pipower5.read_default_on() else 'off'}")
-    if args.shutdown_request:
-        shutdown_request = pipower5.read_shutdown_request()
-        print(f"Shutdown request: {int(shutdown_request)} - {shutdown_request.name}")
-    if args.power_btn:
-        button_state = pipower5.read_power_btn()
-        print(f"Power button: {int(button_state)} - {button_state.name}")
-    if args.charging_current:
-        print(f"Max charging current: {pipower5.get_max_charge_current()} mA")
+    read_names = [name for name, register in PiPower5.REGISTERS.items()
+                  if register.flags and register.is_available(BOARD_VERSION) and getattr(args, name)]
+    if len(read_names) > 0:
+        # Reading the button clears its latch, keep it a separate read
+        values = pipower5.read_fields([name for name in read_names if name != 'power_btn'])
+        if 'power_btn' in read_names:
+            values['power_btn'] = pipower5.read_power_btn()
+        for name in read_names:
+            register = PiPower5.REGISTERS[name]
+            print(f"{register.label}: {register.format_value(values[name])}")
     if args.all:
-        data_buffer = pipower5.read_all()
-        #
-        shutdown_request = pipower5.read_shutdown_request()
-        button_state = pipower5.read_power_btn()
+        data_buffer = pipower5.read_snapshot()
+
+        def show(name, format=str):
+            # Fields of a block that failed to read are marked instead of printing a stale value
+            value = getattr(data_buffer, name)
+            if value is None or name in data_buffer.stale:
+                return 'n/a (stale)'
+            return format(value)
+
+        def power(group):
+            names = [f'{group}_voltage', f'{group}_current']
+            if any(getattr(data_buffer, name) is None or name in data_buffer.stale for name in names):
+                return 'n/a (stale)'
+            return f'{getattr(data_buffer, names[0]) * getattr(data_buffer, names[1]) * 0.000001:.3f} W'
+
         print(f'''
 Input:
-    voltage: {data_buffer['input_voltage']} mV
-    current: {data_buffer['input_current']} mA
-    power: {data_buffer['input_voltage'] * data_buffer['input_current'] * 0.000001:.3f} W
-    plugged in: {data_buffer['is_input_plugged_in']}
+    voltage: {show('input_voltage', lambda v: f'{v} mV')}
+    current: {show('input_current', lambda v: f'{v} mA')}
+    power: {power('input')}
+    plugged in: {show('is_input_plugged_in')}
 Output: 
-    voltage: {data_buffer['output_voltage']} mV
-    current: {data_buffer['output_current']} mA
-    power: {data_buffer['output_voltage'] * data_buffer['output_current'] * 0.000001:.3f} W
+    voltage: {show('output_voltage', lambda v: f'{v} mV')}
+    current: {show('output_current', lambda v: f'{v} mA')}
+    power: {power('output')}
 Battery:
-    voltage: {data_buffer['battery_voltage']} mV
-    current: {data_buffer['battery_current']} mA
-    power: {data_buffer['battery_voltage'] * data_buffer['battery_current'] * 0.000001:.3f} W
-    percentage: {data_buffer['battery_percentage']} %
-    source: {data_buffer['power_source']} - {'Battery' if data_buffer['power_source'] == pipower5.BATTERY else 'External'}
-    charging: {data_buffer['is_charging']}
+    voltage: {show('battery_voltage', lambda v: f'{v} mV')}
+    current: {show('battery_current', lambda v: f'{v} mA')}
+    power: {power('battery')}
+    percentage: {show('battery_percentage', lambda v: f'{v} %')}
+    source: {show('power_source', lambda v: f"{int(v)} - {'Battery' if v == pipower5.BATTERY else 'External'}")}
+    charging: {show('is_charging')}
 
 Internal:
-    shutdown request: {int(shutdown_request)} - {shutdown_request.name}
-    power button: {int(button_state)} - {button_state.name}
-    max charging current: {pipower5.get_max_charge_current()} mA
-    default on: {'on' if pipower5.read_default_on() else 'off'}
-    shutdown percentage: {pipower5.read_shutdown_percentage()} %
+    shutdown request: {show('shutdown_request', lambda v: f'{int(v)} - {v.name}')}
+    power button: {show('power_btn', lambda v: f'{int(v)} - {v.name}')}
+    max charging current: {show('max_charge_current', lambda v: f'{v} mA')}
+    default on: {show('default_on', lambda v: 'on' if v else 'off')}
+    shutdown percentage: {show('shutdown_percentage', lambda v: f'{v} %')}
 ''')
-    if args.firmware:
-        print(f"Pipower5 firmware version: {pipower5.read_firmware_version()}")
+
+    if args.bus_stats:
+        from .instrumented_bus import get_stats_path
+        stats_path = get_stats_path()
+        if not os.path.exists(stats_path):
+            print(f"No bus stats in {stats_path}, is PiPower5 service running?")
+            quit()
+        with open(stats_path, 'r') as f:
+            stats = json.load(f)
+        print(f"Bus stats, {time.time() - stats['time']:.0f} s old:")
+        print(f"    {'method':<17} {'register':<26} {'count':>8} {'bytes':>10} {'errors':>6} {'retries':>7} {'avg ms':>7} {'max ms':>7}")
+        for method, by_register in stats['i2c'].items():
+            if method == 'total':
+                continue
+            for register, item in by_register.items():
+                latency = item['latency']
+                print(f"    {method:<17} {register:<26} {item['transactions']:>8} {item['bytes']:>10} {item['errors']:>6} {item['retries']:>7} {latency['avg'] * 1000:>7.2f} {latency['max'] * 1000:>7.2f}")
+        total = stats['i2c']['total']
+        print(f"    total: {total['transactions']} transactions, {total['bytes']} bytes, {total['errors']} errors, {total['retries']} retries, {total['time']:.3f} s on the bus")
+        faults = stats['faults']
+        print(f"    faults: circuit {faults['state']}, {faults['errors']} errors, {faults['retries']} retries, {faults['budget_exhausted']} retries over budget, {faults['rejected']} rejected, {faults['trips']} trips, {faults['recoveries']} recoveries")
+        bus_lock = stats['bus_lock']
+        print(f"    bus lock: {bus_lock['acquisitions']} acquisitions, {bus_lock['contended']} contended, {bus_lock['timeouts']} timeouts, max wait {bus_lock['wait_max'] * 1000:.2f} ms")
+        cache = stats['cache']
+        print(f"    cache: {cache['hits']} hits, {cache['misses']} misses")
+        ticks = stats.get('ticks')
+        if ticks:
+            print(f"    ticks: {ticks['ticks']} ticks, {ticks['woken']} woken early, {ticks['skipped']} skipped, {ticks.get('errors', 0)} failed, duration avg {ticks['duration']['avg'] * 1000:.2f} ms, max {ticks['duration']['max'] * 1000:.2f} ms, lateness avg {ticks['lateness']['avg'] * 1000:.2f} ms, max {ticks['lateness']['max'] * 1000:.2f} ms")
+        email = stats.get('email')
+        if email:
+            print(f"    email: {email['pending']} pending, {email['sent']} sent, {email['failed_attempts']} failed attempts, {email['dropped']} dropped, {email['connections']} connections")
+        power_loss = stats.get('power_loss')
+        if power_loss:
+            print(f"    power loss hooks: {power_loss['losses']} losses, {power_loss['false_alarms']} false alarms")
+            for name, hook in power_loss['hooks'].items():
+                latency = hook['latency']
+                print(f"        {name}: {hook['fired']} fired, {hook['cancelled']} cancelled, {hook['errors']} errors, latency avg {latency['avg'] * 1000:.2f} ms, max {latency['max'] * 1000:.2f} ms, duration max {hook['duration']['max'] * 1000:.2f} ms")
+        for name, subscriber in stats.get('subscribers', {}).items():
+            lag = subscriber['lag']
+            print(f"    subscriber {name}: {subscriber['delivered']} delivered, {subscriber['dropped']} dropped, {subscriber['errors']} errors, {subscriber['pending']} pending, lag avg {lag['avg'] * 1000:.2f} ms, max {lag['max'] * 1000:.2f} ms")
+        events = stats.get('events')
+        if events:
+            print(f"    events: evaluated in {events['evaluate_time']['avg'] * 1000000:.1f} us avg, {events['evaluate_time']['max'] * 1000000:.1f} us max")
+            for region, item in events['regions'].items():
+                counts = ', '.join(f"{key} {transition['count']}" for key, transition in item['transitions'].items() if transition['count'] > 0)
+                print(f"        {region}: {item['state']} for {item['time_in_state']:.0f} s, {counts}")
+
+    # advanced commands
+    def confirm(action):
+        # Destructive commands act on the board right away, ask first unless --yes
+        if args.yes:
+            return True
+        if not sys.stdin.isatty():
+            print(f"{action}: skipped, confirm with --yes")
+            return False
+        while True:
+            yesno = input(f"{action}, are you sure? (y/n) ")
+            if yesno.lower() == 'y':
+                return True
+            elif yesno.lower() == 'n':
+                print(f"{action}: cancelled")
+                return False
+            else:
+                print("Invalid input, please enter y or n")
+
+    if args.input_enable is not None:
+        enable = args.input_enable == 'on'
+        if enable or confirm("Disable input"):
+            result = pipower5.enable_input() if enable else pipower5.disable_input()
+            print(f"{'Enable' if enable else 'Disable'} input: {'OK' if result else 'Failed'}")
+    if args.battery_enable is not None:
+        enable = args.battery_enable == 'on'
+        if enable or confirm("Disable battery"):
+            result = pipower5.enable_battery() if enable else pipower5.disable_battery()
+            print(f"{'Enable' if enable else 'Disable'} battery: {'OK' if result else 'Failed'}")
+    if args.output_enable is not None:
+        enable = args.output_enable == 'on'
+        if enable or confirm("Disable output, this powers off the Raspberry Pi"):
+            result = pipower5.enable_output() if enable else pipower5.disable_output()
+            print(f"{'Enable' if enable else 'Disable'} output: {'OK' if result else 'Failed'}")
+    if args.reset_board and confirm("Reset PiPower5"):
+        print(f"Reset PiPower5: {'OK' if pipower5.reset() else 'Failed'}")
+    if args.enter_iap and confirm("Enter firmware update mode"):
+        print(f"Enter firmware update mode: {'OK' if pipower5.enter_iap() else 'Failed'}")
 
     # send email on
     if args.send_email_on != '':
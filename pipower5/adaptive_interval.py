@@ -0,0 +1,131 @@
+import time
+from enum import StrEnum
+
+class PollState(StrEnum):
+    MAINS = 'mains'
+    BATTERY = 'battery'
+    LOW_BATTERY = 'low_battery'
+    SHUTDOWN_PENDING = 'shutdown_pending'
+
+# Poll interval in seconds for each state, clamped to the configured bounds
+DEFAULT_INTERVALS = {
+    PollState.MAINS: 5,
+    PollState.BATTERY: 1,
+    PollState.LOW_BATTERY: 0.5,
+    PollState.SHUTDOWN_PENDING: 0.2,
+}
+DEFAULT_MIN_INTERVAL = 0.2 # seconds
+DEFAULT_MAX_INTERVAL = 5 # seconds
+
+class AdaptiveInterval():
+    def __init__(self,
+                 intervals=None,
+                 min_interval=DEFAULT_MIN_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL,
+                 low_battery_margin=10,
+                 hysteresis=5,
+                 hold_time=10):
+        '''
+        Pick the poll interval from the power state.
+
+        Faster states take effect right away, and any change of a monitored
+        signal drops to the min interval. Slowing down waits until nothing
+        changed for hold_time. Without interrupt edges an unplug is only seen
+        by polling, so on mains the interval stays at the battery interval
+        unless interrupt_enabled is set.
+
+        Args:
+            intervals (dict, optional): Interval by PollState. Defaults to DEFAULT_INTERVALS.
+            min_interval (float, optional): Lower bound in seconds. Defaults to 0.2.
+            max_interval (float, optional): Upper bound in seconds. Defaults to 5.
+            low_battery_margin (int, optional): Low battery state starts this many
+                percent above the shutdown percentage. Defaults to 10.
+            hysteresis (int, optional): Percent above the low battery threshold to
+                leave the low battery state. Defaults to 5.
+            hold_time (float, optional): Seconds without changes before slowing down. Defaults to 10.
+        '''
+        self.intervals = dict(DEFAULT_INTERVALS)
+        if intervals:
+            self.intervals.update(intervals)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.low_battery_margin = low_battery_margin
+        self.hysteresis = hysteresis
+        self.hold_time = hold_time
+
+        # Set when input edges wake the poll loop, see InterruptSource
+        self.interrupt_enabled = False
+
+        self.state = PollState.MAINS
+        self.interval = self.min_interval
+        self.last_signals = None
+        self.last_change = time.monotonic()
+
+    def check_bounds(self, min_interval=None, max_interval=None):
+        '''
+        Check bounds without applying them.
+
+        Args:
+            min_interval (float, optional): New lower bound, None keeps the current one.
+            max_interval (float, optional): New upper bound, None keeps the current one.
+
+        Returns:
+            tuple: (min_interval, max_interval) the bounds would be.
+
+        Raises:
+            ValueError: If a bound isn't positive or min is greater than max.
+        '''
+        min_interval = self.min_interval if min_interval is None else min_interval
+        max_interval = self.max_interval if max_interval is None else max_interval
+        if min_interval <= 0:
+            raise ValueError(f"Min interval {min_interval} is not positive")
+        if min_interval > max_interval:
+            raise ValueError(f"Min interval {min_interval} is greater than max interval {max_interval}")
+        return min_interval, max_interval
+
+    def set_bounds(self, min_interval=None, max_interval=None):
+        self.min_interval, self.max_interval = self.check_bounds(min_interval, max_interval)
+
+    def _get_state(self, data, shutdown_request):
+        if shutdown_request:
+            return PollState.SHUTDOWN_PENDING
+        if data['is_input_plugged_in'] and not data['power_source']:
+            return PollState.MAINS
+        low_threshold = data['shutdown_percentage'] + self.low_battery_margin
+        if self.state == PollState.LOW_BATTERY:
+            low_threshold += self.hysteresis
+        if data['battery_percentage'] < low_threshold:
+            return PollState.LOW_BATTERY
+        return PollState.BATTERY
+
+    def update(self, data, shutdown_request, button_state):
+        '''
+        Update with a new sample.
+
+        Args:
+            data (dict): Snapshot data.
+            shutdown_request (ShutdownRequest): Shutdown request.
+            button_state (ButtonState): Button state.
+
+        Returns:
+            float: Interval until the next poll in seconds.
+        '''
+        now = time.monotonic()
+        signals = (
+            data['is_input_plugged_in'],
+            data['power_source'],
+            data['is_charging'],
+            shutdown_request,
+        )
+        if signals != self.last_signals or button_state:
+            self.last_change = now
+        self.last_signals = signals
+
+        self.state = self._get_state(data, shutdown_request)
+        interval = self.intervals[self.state]
+        if self.state == PollState.MAINS and not self.interrupt_enabled:
+            interval = min(interval, self.intervals[PollState.BATTERY])
+        if now - self.last_change < self.hold_time:
+            interval = self.min_interval
+        self.interval = max(self.min_interval, min(self.max_interval, interval))
+        return self.interval
@@ -0,0 +1,101 @@
+import time
+import threading
+from .metrics import Histogram
+
+ATTEMPT_BUCKETS = [1, 2, 3, 5, 10, 20, 50]
+
+class AdvancedCommandExecutor():
+    def __init__(self, device, retries=50, backoff=0.002, max_backoff=0.1, timeout=5):
+        '''
+        Run advanced commands with a retry budget and backoff.
+
+        Each attempt holds the bus lock from the command write to its status
+        read, so no other process can read in between and steal the status.
+        That makes it safe to back off between attempts instead of spinning.
+
+        Args:
+            device (PiPower5): Device, provides i2c, bus_lock and ADV_CMD_* constants.
+            retries (int, optional): Max attempts per command. Defaults to 50.
+            backoff (float, optional): First backoff in seconds, doubled after each failed attempt. Defaults to 0.002.
+            max_backoff (float, optional): Max backoff in seconds. Defaults to 0.1.
+            timeout (float, optional): Max time per command in seconds. Defaults to 5.
+        '''
+        self.device = device
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.names = {
+            device.ADV_CMD_RST: 'rst',
+            device.ADV_CMD_VBUS_EN: 'vbus_en',
+            device.ADV_CMD_BAT_EN: 'bat_en',
+            device.ADV_CMD_OUPUT_EN: 'output_en',
+            device.ADV_CMD_ENTER_IAP: 'enter_iap',
+        }
+        self.stats = {}
+        for name in self.names.values():
+            self.stats[name] = {
+                'ok': 0,
+                'failed': 0,
+                'latency': Histogram(),
+                'attempts': Histogram(ATTEMPT_BUCKETS),
+            }
+        self.lock = threading.Lock()
+
+    def _attempt(self, command, arg):
+        with self.device.bus_lock:
+            self.device.i2c.write_block_data(self.device.ADV_CMD_START, [command, arg, self.device.ADV_CMD_END])
+            return self.device.i2c.read_byte()
+
+    def execute(self, command, arg=0):
+        '''
+        Run an advanced command until the board acknowledges it or the retry budget runs out.
+
+        Args:
+            command (int): One of ADV_CMD_RST, ADV_CMD_VBUS_EN, ADV_CMD_BAT_EN, ADV_CMD_OUPUT_EN, ADV_CMD_ENTER_IAP.
+            arg (int, optional): Command argument. Defaults to 0.
+
+        Returns:
+            bool: True if the board acknowledged the command.
+        '''
+        if command not in self.names:
+            raise ValueError(f"Invalid advanced command: {command}")
+        start = time.monotonic()
+        deadline = start + self.timeout
+        backoff = self.backoff
+        attempts = 0
+        ok = False
+        while attempts < self.retries:
+            attempts += 1
+            if self._attempt(command, int(arg)) == self.device.ADV_CMD_OK:
+                ok = True
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or attempts >= self.retries:
+                break
+            self.device.i2c.record_retry('write_block_data', self.device.ADV_CMD_START)
+            time.sleep(min(backoff, remaining))
+            backoff = min(backoff * 2, self.max_backoff)
+
+        stats = self.stats[self.names[command]]
+        with self.lock:
+            stats['ok' if ok else 'failed'] += 1
+            stats['latency'].observe(time.monotonic() - start)
+            stats['attempts'].observe(attempts)
+        return ok
+
+    def get_stats(self):
+        '''
+        Get per command counters, latency and attempt histograms.
+
+        Returns:
+            dict: Stats by command name.
+        '''
+        with self.lock:
+            return {name: {
+                'ok': stats['ok'],
+                'failed': stats['failed'],
+                'latency': stats['latency'].to_dict(),
+                'attempts': stats['attempts'].to_dict(),
+            } for name, stats in self.stats.items()}
@@ -0,0 +1,174 @@
+import time
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from .pipower5 import PiPower5
+from .metrics import Histogram
+
+class TickStats():
+    def __init__(self):
+        '''
+        Stream tick counters and histograms.
+        '''
+        self.ticks = 0
+        self.woken = 0
+        self.skipped = 0
+        # Ticks whose snapshot failed, yielded all stale
+        self.errors = 0
+        # Read and handling time of a tick
+        self.duration = Histogram()
+        # Start of a scheduled tick after its deadline
+        self.lateness = Histogram()
+
+    def to_dict(self):
+        return {
+            'ticks': self.ticks,
+            'woken': self.woken,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'duration': self.duration.to_dict(),
+            'lateness': self.lateness.to_dict(),
+        }
+
+class AsyncPiPower5():
+    # PiPower5 methods that touch the bus, exposed as coroutines
+    BUS_METHOD_PREFIXES = ('read_', 'write_', 'get_', 'enable_', 'disable_')
+    BUS_METHODS = ['send_advanced_command', 'reset', 'enter_iap', 'buzz_sequence']
+
+    def __init__(self, pipower5=None, log=None, **kwargs):
+        '''
+        asyncio facade of PiPower5.
+
+        Bus I/O runs on a dedicated single thread executor, so it never blocks
+        the event loop and calls reach the bus in the order they are awaited.
+        Every bus method of PiPower5 is available as a coroutine, for example
+        await board.read_snapshot(), other attributes are passed through.
+
+        Args:
+            pipower5 (PiPower5, optional): Device to wrap. Defaults to PiPower5(**kwargs).
+        '''
+        self.log = log or logging.getLogger(__name__)
+        self.pipower5 = pipower5 or PiPower5(**kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pipower5-bus')
+        self.tick_stats = TickStats()
+
+    async def run(self, func, *args, **kwargs):
+        '''
+        Run a blocking function on the bus executor.
+
+        Args:
+            func (function): Function to run.
+
+        Returns:
+            Any: The return value of the function.
+        '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def submit(self, func, *args, **kwargs):
+        '''
+        Queue a blocking function on the bus executor without waiting, from
+        any thread.
+
+        Args:
+            func (function): Function to run.
+
+        Returns:
+            concurrent.futures.Future: Future of the return value.
+        '''
+        return self.executor.submit(func, *args, **kwargs)
+
+    def __getattr__(self, name):
+        attr = getattr(self.pipower5, name)
+        if not callable(attr):
+            return attr
+        if not (name.startswith(self.BUS_METHOD_PREFIXES) or name in self.BUS_METHODS):
+            return attr
+
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        method.__name__ = name
+        method.__doc__ = attr.__doc__
+        return method
+
+    async def stream(self, interval=1, wake=None):
+        '''
+        Stream snapshots at a steady cadence.
+
+        Ticks are scheduled on monotonic deadlines, so the time spent reading
+        and handling doesn't add up. Missed ticks are skipped rather than
+        bunched up, the next tick keeps the phase of the schedule. Tick
+        duration, lateness and skipped ticks are counted, see get_tick_stats.
+        A tick whose snapshot fails is logged and counted, and yields the
+        last snapshot with every field stale, so the stream goes on.
+
+        Args:
+            interval (float|function, optional): Interval in seconds, or a function
+                returning it, called after each snapshot is handled. Defaults to 1.
+            wake (asyncio.Event, optional): Setting it yields a snapshot right
+                away, without moving the next scheduled deadline.
+
+        Yields:
+            PowerSample: Snapshot, see PiPower5.read_snapshot, the same record
+                refilled on every tick.
+        '''
+        stats = self.tick_stats
+        deadline = time.monotonic()
+        woken = False
+        while True:
+            start = time.monotonic()
+            stats.ticks += 1
+            if woken:
+                stats.woken += 1
+            else:
+                stats.lateness.observe(start - deadline)
+            try:
+                sample = await self.run(self.pipower5.read_snapshot)
+            except Exception as e:
+                stats.errors += 1
+                self.log.error(f"Failed to read snapshot: {e}")
+                sample = self.pipower5.get_stale_snapshot()
+            yield sample
+            now = time.monotonic()
+            stats.duration.observe(now - start)
+            period = interval() if callable(interval) else interval
+            if deadline <= now:
+                # Next deadline in the future, skipping any missed ones
+                missed = int((now - deadline) / period)
+                stats.skipped += missed
+                deadline += (missed + 1) * period
+            elif deadline > now + period:
+                # Interval got shorter after an early wake up
+                deadline = now + period
+            woken = False
+            if wake is None:
+                await asyncio.sleep(deadline - now)
+                continue
+            try:
+                await asyncio.wait_for(wake.wait(), deadline - now)
+                woken = True
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+
+    def get_tick_stats(self):
+        '''
+        Get stream tick stats.
+
+        Returns:
+            dict: ticks, ticks woken early, skipped ticks, and tick duration
+                and lateness histograms.
+        '''
+        return self.tick_stats.to_dict()
+
+    def reset_executor(self):
+        '''
+        Replace the bus executor, like when its thread is stuck in a call.
+        The stuck call finishes on its own thread, later calls go to a new one.
+        '''
+        self.executor.shutdown(wait=False)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pipower5-bus')
+
+    def close(self):
+        self.executor.shutdown(wait=False)
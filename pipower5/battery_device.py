@@ -3,6 +3,7 @@ import sys
 import logging
 import fcntl
 import ctypes
+import math
 
 # Kernel constant definitions
 _IOC_NONE = 0
@@ -76,12 +77,25 @@ POWER_SUPPLY_TYPE_USB_CDP = 6
 POWER_SUPPLY_TYPE_USB_ACA = 7
 
 class BatteryDevice:
-    def __init__(self, log=None):
+    def __init__(self, log=None, simulated=False, estimator=None):
         self.log = log or logging.getLogger('BatteryDevice')
-        self.device_path = self.find_device()
-        self.device_fd = self.open_device()
+        # BatteryEstimator shared with the service, updated by it every tick
+        self.estimator = estimator
+        # A simulated device keeps the properties up to date without the kernel module
+        self.simulated = simulated
+        if self.simulated:
+            self.device_path = None
+            self.device_fd = None
+        else:
+            self.device_path = self.find_device()
+            self.device_fd = self.open_device()
         self.props = PowerSupplyProperties()
         self.register_battery()
+
+    def ioctl(self, request, arg):
+        if self.simulated:
+            return
+        fcntl.ioctl(self.device_fd, request, arg)
         
     def find_device(self):
         # Possible device paths
@@ -137,7 +151,7 @@ class BatteryDevice:
         
         
         try:
-            fcntl.ioctl(self.device_fd, PIPOWER_5_REGISTER, self.props)
+            self.ioctl(PIPOWER_5_REGISTER, self.props)
             self.log.info("Battery device registered successfully")
         except OSError as e:
             self.log.exception(f"Battery device registration failed: {e}")
@@ -147,7 +161,7 @@ class BatteryDevice:
         try:
             # Use any non-zero value to unregister
             unreg = ctypes.c_int(1)
-            fcntl.ioctl(self.device_fd, PIPOWER_5_UNREGISTER, unreg)
+            self.ioctl(PIPOWER_5_UNREGISTER, unreg)
             self.log.info("Virtual battery unregistered")
         except OSError as e:
             self.log.error(f"Failed to unregister battery: {e}")
@@ -190,17 +204,14 @@ class BatteryDevice:
         power_now = int(round(power_now))
         charge_now = energy_now
 
+        # In seconds, 0 if unknown
         time_to_empty = 0
-        if data['battery_current'] > 0:
-            time_to_empty = int(round(energy_now / power_now))
-        else:
-            time_to_empty = 0
-
         time_to_full = 0
-        if data['battery_current'] < 0:
-            time_to_full = int(round((self.props.energy_full_design - energy_now) / -data['battery_current']))
-        else:
-            time_to_full = 0
+        if self.estimator is not None:
+            hours = self.estimator.time_to_empty(data['battery_percentage'])[0]
+            time_to_empty = 0 if math.isinf(hours) else int(round(hours * 3600))
+            hours = self.estimator.time_to_full(data['battery_percentage'])[0]
+            time_to_full = 0 if math.isinf(hours) else int(round(hours * 3600))
 
         # Update properties
         self.props.present = present
@@ -217,6 +228,6 @@ class BatteryDevice:
         self.props.time_to_full = time_to_full
 
         try:
-            fcntl.ioctl(self.device_fd, PIPOWER_5_UPDATE, self.props)
+            self.ioctl(PIPOWER_5_UPDATE, self.props)
         except OSError as e:
             self.log.error(f"Failed to update battery status: {e}")
@@ -0,0 +1,121 @@
+import math
+import time
+
+DEFAULT_TIME_CONSTANT = 60 # seconds
+IDLE_CURRENT = 20 # mA, below this the battery is neither charging nor discharging
+Z_95 = 1.96
+
+class BatteryEstimator():
+    def __init__(self, capacity, time_constant=DEFAULT_TIME_CONSTANT, idle_current=IDLE_CURRENT, z=Z_95):
+        '''
+        Time to empty and time to full estimator from the battery current.
+
+        The current is smoothed with an exponentially weighted mean and
+        variance. The weight of a sample follows the time since the previous
+        one, so irregular poll intervals weigh the same per second. An update
+        is O(1) and keeps no history. When the current changes direction,
+        like on unplug, the filter restarts from the new sample instead of
+        averaging across the edge.
+
+        Args:
+            capacity (float): Battery capacity in mAh.
+            time_constant (float, optional): Smoothing time constant in seconds. Defaults to 60.
+            idle_current (float, optional): Current in mA below which the battery
+                is considered idle. Defaults to 20.
+            z (float, optional): Confidence interval width in standard deviations.
+                Defaults to 1.96, 95%.
+        '''
+        self.capacity = capacity
+        self.time_constant = time_constant
+        self.idle_current = idle_current
+        self.z = z
+        self.reset()
+
+    def reset(self):
+        self.mean = None
+        self.variance = 0
+        self.last_time = None
+        self.samples = 0
+
+    def _direction(self, current):
+        if current > self.idle_current:
+            return 1
+        if current < -self.idle_current:
+            return -1
+        return 0
+
+    def update(self, current, now=None):
+        '''
+        Add a current sample.
+
+        Args:
+            current (float): Battery current in mA, positive when charging.
+            now (float, optional): Monotonic time of the sample. Defaults to now.
+
+        Returns:
+            float: Filtered current in mA.
+        '''
+        now = time.monotonic() if now is None else now
+        direction = self._direction(current)
+        if self.mean is None or (direction != 0 and direction == -self._direction(self.mean)):
+            self.mean = current
+            self.variance = 0
+        else:
+            dt = max(0, now - self.last_time)
+            alpha = 1 - math.exp(-dt / self.time_constant)
+            diff = current - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.variance = (1 - alpha) * (self.variance + diff * increment)
+        self.last_time = now
+        self.samples += 1
+        return self.mean
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def _hours(self, charge, current):
+        # Hours to move charge mAh at current mA, inf if it doesn't move
+        if current <= self.idle_current:
+            return math.inf
+        return max(0, charge) / current
+
+    def time_to_empty(self, percentage, floor=0):
+        '''
+        Estimate the time until the battery drains down to floor.
+
+        Args:
+            percentage (float): Battery percentage.
+            floor (float, optional): Percentage counted as empty, like the
+                shutdown percentage. Defaults to 0.
+
+        Returns:
+            tuple: (estimate, low, high) in hours, inf when not discharging.
+        '''
+        if self.mean is None:
+            return math.inf, math.inf, math.inf
+        charge = self.capacity * (percentage - floor) / 100
+        current = -self.mean
+        margin = self.z * self.std
+        return (self._hours(charge, current),
+                self._hours(charge, current + margin),
+                self._hours(charge, current - margin))
+
+    def time_to_full(self, percentage):
+        '''
+        Estimate the time until the battery is full.
+
+        Args:
+            percentage (float): Battery percentage.
+
+        Returns:
+            tuple: (estimate, low, high) in hours, inf when not charging.
+        '''
+        if self.mean is None:
+            return math.inf, math.inf, math.inf
+        charge = self.capacity * (100 - percentage) / 100
+        margin = self.z * self.std
+        return (self._hours(charge, self.mean),
+                self._hours(charge, self.mean + margin),
+                self._hours(charge, self.mean - margin))
@@ -0,0 +1,301 @@
+import os
+import time
+import logging
+import threading
+from array import array
+from datetime import datetime
+from .metrics import Histogram
+from .registers import RegisterDecoder
+
+# Fields sampled in a burst, input, output and battery voltage and current
+BURST_FIELDS = [
+    'input_voltage',
+    'input_current',
+    'output_voltage',
+    'output_current',
+    'battery_voltage',
+    'battery_current',
+]
+BURST_DIR = '/opt/pipower5/burst/'
+DEFAULT_PERIOD = 0.01 # seconds, 0 samples as fast as the bus allows
+DEFAULT_SIZE = 600 # samples
+DEFAULT_POST_SAMPLES = 200 # samples
+DEFAULT_MAX_FILES = 20
+DEFAULT_UNPLUG_VOLTAGE = 4000 # mV, input voltage below it is an unplug
+UNPLUG_REASON = 'power_disconnected' # same as Event.POWER_DISCONNECTED
+
+class BurstCapture():
+    def __init__(self, device, period=DEFAULT_PERIOD, size=DEFAULT_SIZE,
+                 post_samples=DEFAULT_POST_SAMPLES, thresholds=None,
+                 unplug_voltage=DEFAULT_UNPLUG_VOLTAGE, log=None):
+        '''
+        High rate capture of voltages and currents around power events.
+
+        A sampler thread keeps reading the telemetry block into a preallocated
+        ring buffer. On a trigger it keeps sampling for post_samples, then
+        hands over the whole window, so the samples before the trigger are
+        kept too. The sampler triggers itself on an unplug, input voltage
+        falling below unplug_voltage, so the trigger isn't late by a poll
+        interval and the window holds the samples before the edge.
+
+        Args:
+            device (PiPower5): Device, provides i2c, bus_lock and REGISTERS.
+            period (float, optional): Sample period in seconds, 0 for as fast as
+                the bus allows. Defaults to 0.01.
+            size (int, optional): Ring buffer size in samples. Defaults to 600.
+            post_samples (int, optional): Samples taken after a trigger. Defaults to 200.
+            thresholds (dict, optional): {field: [min, max]}, a sample out of
+                range triggers a capture, either bound may be None.
+            unplug_voltage (int, optional): Input voltage in mV below which a
+                sample triggers an UNPLUG_REASON capture, None to not trigger
+                on unplugs. Defaults to 4000.
+        '''
+        if post_samples >= size:
+            raise ValueError(f"Post trigger samples {post_samples} must be less than size {size}")
+        self.device = device
+        self.period = period
+        self.size = size
+        self.post_samples = post_samples
+        self.log = log or logging.getLogger(__name__)
+        self.thresholds = []
+        self.set_thresholds(thresholds or {})
+
+        # Burst fields are plain integers, the raw unpack is the value
+        self.decoder = RegisterDecoder(device.REGISTERS, BURST_FIELDS)
+        self.width = len(BURST_FIELDS)
+
+        self.times = array('d', bytes(8 * size))
+        self.values = array('i', bytes(4 * size * self.width))
+        self.index = 0
+        self.count = 0
+
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+        self.callback = None
+
+        self.trigger_reason = None
+        self.trigger_time = None
+        self.trigger_index = None
+        self.remaining = 0
+        self.out_of_range = False
+        self.unplug_voltage = unplug_voltage
+        self.input_voltage_index = BURST_FIELDS.index('input_voltage')
+        # Unknown until the first sample, an unplugged start doesn't trigger
+        self.plugged = None
+
+        self.captures = 0
+        self.dropped_triggers = 0
+        self.errors = 0
+        self.read_latency = Histogram()
+        self.started_at = None
+
+    @property
+    def pending_reason(self):
+        return self.trigger_reason
+
+    def set_thresholds(self, thresholds):
+        '''
+        Set the trigger thresholds, invalid entries are logged and skipped.
+
+        Args:
+            thresholds (dict): {field: [min, max]}, either bound may be None.
+        '''
+        if not isinstance(thresholds, dict):
+            self.log.warning(f"Burst thresholds must be a dict of field: [min, max], ignored: {thresholds}")
+            thresholds = {}
+        checked = []
+        for name, bounds in thresholds.items():
+            if name not in BURST_FIELDS:
+                self.log.warning(f"Invalid burst threshold field, skipped: {name}")
+                continue
+            if not isinstance(bounds, (list, tuple)) or len(bounds) != 2 \
+                    or any(bound is not None and not isinstance(bound, (int, float)) for bound in bounds):
+                self.log.warning(f"Burst threshold of {name} must be [min, max], skipped: {bounds}")
+                continue
+            low, high = bounds
+            if low is not None and high is not None and low > high:
+                self.log.warning(f"Burst threshold of {name} has min above max, skipped: {bounds}")
+                continue
+            checked.append((name, BURST_FIELDS.index(name), low, high))
+        self.thresholds = checked
+
+    def start(self, callback):
+        '''
+        Start sampling.
+
+        Args:
+            callback (function): Called with the capture dict when a window is
+                complete, from the sampler thread.
+        '''
+        if self.running:
+            return
+        self.callback = callback
+        self.running = True
+        self.started_at = time.monotonic()
+        self.thread = threading.Thread(target=self._loop, name='pipower5-burst', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        self.thread = None
+        self.plugged = None
+        # A capture cut short by the stop doesn't block the next start
+        with self.lock:
+            self.trigger_reason = None
+            self.remaining = 0
+        self.out_of_range = False
+
+    def trigger(self, reason):
+        '''
+        Capture the window around now. Ignored while another capture is in progress.
+
+        Args:
+            reason (str): Reason, kept in the capture, like the event name.
+
+        Returns:
+            bool: True if a capture started.
+        '''
+        if not self.running:
+            return False
+        with self.lock:
+            if self.trigger_reason is not None:
+                self.dropped_triggers += 1
+                return False
+            self.trigger_reason = str(reason)
+            self.trigger_time = time.time()
+            self.trigger_index = self.count
+            self.remaining = self.post_samples
+        self.log.debug(f'Burst capture triggered: {reason}')
+        return True
+
+    def _sample(self):
+        start = time.monotonic()
+        with self.device.bus_lock:
+            buffer = bytes(self.device.i2c.read_block_data(self.decoder.start, self.decoder.length))
+        self.read_latency.observe(time.monotonic() - start)
+        base = self.index * self.width
+        self.times[self.index] = start
+        for i, value in enumerate(self.decoder.struct.unpack(buffer)):
+            self.values[base + i] = value
+
+    def _check_thresholds(self):
+        base = self.index * self.width
+        reason = None
+        for name, offset, low, high in self.thresholds:
+            value = self.values[base + offset]
+            if (low is not None and value < low) or (high is not None and value > high):
+                reason = f'{name}_threshold'
+                break
+        # Trigger on the edge only, a value staying out of range doesn't retrigger
+        if reason is not None and not self.out_of_range:
+            self.trigger(reason)
+        self.out_of_range = reason is not None
+
+        if self.unplug_voltage is not None:
+            plugged = self.values[base + self.input_voltage_index] >= self.unplug_voltage
+            if self.plugged and not plugged:
+                self.trigger(UNPLUG_REASON)
+            self.plugged = plugged
+
+    def _loop(self):
+        deadline = time.monotonic()
+        while self.running:
+            try:
+                self._sample()
+            except Exception as e:
+                self.errors += 1
+                self.log.debug(f'Burst sample failed: {e}')
+                time.sleep(0.1)
+                deadline = time.monotonic()
+                continue
+            self._check_thresholds()
+
+            capture = None
+            with self.lock:
+                self.index = (self.index + 1) % self.size
+                self.count += 1
+                if self.trigger_reason is not None:
+                    self.remaining -= 1
+                    if self.remaining <= 0:
+                        capture = self._get_window()
+                        self.trigger_reason = None
+                        self.captures += 1
+            if capture is not None and self.callback:
+                try:
+                    self.callback(capture)
+                except Exception as e:
+                    self.log.exception(e)
+
+            if self.period > 0:
+                now = time.monotonic()
+                deadline += self.period
+                if deadline <= now:
+                    deadline = now
+                else:
+                    time.sleep(deadline - now)
+
+    def _get_window(self):
+        total = min(self.count, self.size)
+        first = self.count - total
+        trigger = self.trigger_index
+        trigger_time = self.times[trigger % self.size] if trigger >= first else self.times[first % self.size]
+        samples = []
+        for n in range(first, self.count):
+            i = n % self.size
+            base = i * self.width
+            samples.append([round(self.times[i] - trigger_time, 4)] + list(self.values[base:base + self.width]))
+        return {
+            'reason': self.trigger_reason,
+            'time': self.trigger_time,
+            'period': self.period,
+            'fields': ['time'] + BURST_FIELDS,
+            'pre_samples': max(0, trigger - first),
+            'samples': samples,
+        }
+
+    def get_stats(self):
+        '''
+        Get sampler stats.
+
+        Returns:
+            dict: running, samples, achieved rate in Hz, captures, dropped
+                triggers, errors and bus read latency histogram.
+        '''
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        return {
+            'running': self.running,
+            'samples': self.count,
+            'rate': self.count / elapsed if elapsed > 0 else 0,
+            'captures': self.captures,
+            'dropped_triggers': self.dropped_triggers,
+            'errors': self.errors,
+            'read_latency': self.read_latency.to_dict(),
+        }
+
+def save_capture(capture, directory=BURST_DIR, max_files=DEFAULT_MAX_FILES):
+    '''
+    Save a capture as CSV, oldest captures beyond max_files are removed.
+
+    Args:
+        capture (dict): Capture, see BurstCapture.
+        directory (str, optional): Directory. Defaults to BURST_DIR.
+        max_files (int, optional): Captures to keep. Defaults to 20.
+
+    Returns:
+        str: File path.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    timestamp = datetime.fromtimestamp(capture['time']).strftime('%Y%m%d-%H%M%S-%f')[:-3]
+    path = os.path.join(directory, f"burst_{timestamp}_{capture['reason']}.csv")
+    with open(path, 'w') as f:
+        f.write(','.join(capture['fields']) + '\n')
+        for sample in capture['samples']:
+            f.write(','.join(str(value) for value in sample) + '\n')
+
+    files = sorted(name for name in os.listdir(directory) if name.startswith('burst_') and name.endswith('.csv'))
+    for name in files[:-max_files]:
+        os.remove(os.path.join(directory, name))
+    return path
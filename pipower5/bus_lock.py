@@ -0,0 +1,169 @@
+import os
+import stat
+import time
+import fcntl
+import tempfile
+import threading
+
+BUS_LOCK_ENV = 'PIPOWER5_BUS_LOCK'
+BUS_LOCK_NAME = 'pipower5-i2c.lock'
+DEFAULT_TIMEOUT = 1.0 # seconds
+MIN_BACKOFF = 0.0001 # seconds
+MAX_BACKOFF = 0.005 # seconds
+
+def get_default_lock_path():
+    '''
+    Get bus lock file path, shared by every process using the board.
+
+    Returns:
+        str: PIPOWER5_BUS_LOCK if set, else /run/lock or the temp directory.
+    '''
+    path = os.getenv(BUS_LOCK_ENV)
+    if path:
+        return path
+    if os.access('/run/lock', os.W_OK):
+        return os.path.join('/run/lock', BUS_LOCK_NAME)
+    return os.path.join(tempfile.gettempdir(), BUS_LOCK_NAME)
+
+class BusLock():
+    def __init__(self, path=None, timeout=DEFAULT_TIMEOUT):
+        '''
+        Cross-process I2C bus lock based on advisory file locks.
+
+        A gate lock is taken before the bus lock and dropped right after, so
+        only the gate holder polls the bus lock, and a process releasing the
+        bus has to get through the gate again before taking the bus. Both
+        are polled with non-blocking flock and a growing backoff. The lock is reentrant within a thread, so nested
+        transaction groups only lock the files once.
+
+        Args:
+            path (str, optional): Lock file path. Defaults to get_default_lock_path().
+            timeout (float, optional): Max wait in seconds. Defaults to 1.
+        '''
+        self.path = path or get_default_lock_path()
+        self.gate_path = self.path + '.gate'
+        self.timeout = timeout
+        self.local_lock = threading.RLock()
+        self.depth = 0
+        self.fd = self._open(self.path)
+        self.gate_fd = self._open(self.gate_path)
+
+        self.acquisitions = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _open(self, path):
+        # The lock directory is world writable, don't follow a planted symlink
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o666)
+        if not stat.S_ISREG(os.fstat(fd).st_mode):
+            os.close(fd)
+            raise OSError(f"I2C bus lock {path} is not a regular file")
+        try:
+            # Let non-root processes share a lock file created by the daemon
+            os.fchmod(fd, 0o666)
+        except OSError:
+            pass
+        return fd
+
+    def _flock(self, fd, deadline):
+        backoff = MIN_BACKOFF
+        contended = False
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return contended
+            except BlockingIOError:
+                contended = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Timeout waiting for I2C bus lock {self.path}")
+                time.sleep(min(backoff, remaining))
+                backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def acquire(self, timeout=None):
+        '''
+        Acquire the bus.
+
+        Args:
+            timeout (float, optional): Max wait in seconds. Defaults to self.timeout.
+
+        Raises:
+            TimeoutError: If the bus is not available before the timeout.
+        '''
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        if not self.local_lock.acquire(timeout=timeout):
+            self.timeouts += 1
+            raise TimeoutError(f"Timeout waiting for I2C bus lock {self.path}")
+        if self.depth > 0:
+            self.depth += 1
+            return
+        if self.fd is None:
+            self.local_lock.release()
+            raise ValueError(f"I2C bus lock {self.path} is closed")
+        try:
+            contended = self._flock(self.gate_fd, deadline)
+            try:
+                contended = self._flock(self.fd, deadline) or contended
+            finally:
+                fcntl.flock(self.gate_fd, fcntl.LOCK_UN)
+        except TimeoutError:
+            self.timeouts += 1
+            self.local_lock.release()
+            raise
+        except BaseException:
+            self.local_lock.release()
+            raise
+        self.depth = 1
+
+        wait = time.monotonic() - start
+        self.acquisitions += 1
+        if contended:
+            self.contended += 1
+        self.wait_total += wait
+        if wait > self.wait_max:
+            self.wait_max = wait
+
+    def release(self):
+        '''
+        Release the bus.
+        '''
+        self.depth -= 1
+        if self.depth == 0:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.local_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def get_stats(self):
+        '''
+        Get contention stats.
+
+        Returns:
+            dict: Acquisitions, contended acquisitions, timeouts and wait times in seconds.
+        '''
+        return {
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'timeouts': self.timeouts,
+            'wait_total': self.wait_total,
+            'wait_avg': self.wait_total / self.acquisitions if self.acquisitions else 0.0,
+            'wait_max': self.wait_max,
+        }
+
+    def close(self):
+        with self.local_lock:
+            if self.fd is None:
+                return
+            os.close(self.fd)
+            os.close(self.gate_fd)
+            self.fd = None
+            self.gate_fd = None
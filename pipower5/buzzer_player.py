@@ -0,0 +1,159 @@
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from .metrics import Histogram
+
+DEFAULT_MAX_QUEUE = 8 # sequences
+DEFAULT_GAP = 0.5 # seconds between queued sequences
+DRAIN_TIMEOUT = 10 # seconds waited at exit for queued sequences
+
+class BuzzerPlayer():
+    def __init__(self, play, silence, max_queue=DEFAULT_MAX_QUEUE, gap=DEFAULT_GAP, log=None):
+        '''
+        Buzzer player, one long-lived thread playing queued sequences.
+
+        Notes are timed against monotonic deadlines from the start of the
+        sequence, so a slow bus write shortens the note instead of delaying
+        the rest. When the queue is full the oldest sequence is dropped.
+        Queued sequences are still played at interpreter exit, up to
+        DRAIN_TIMEOUT, so a CLI test buzz isn't cut short.
+
+        Args:
+            play (function): Called with an action, writes it to the board.
+            silence (function): Stops the buzzer.
+            max_queue (int, optional): Max queued sequences. Defaults to 8.
+            gap (float, optional): Silence between sequences in seconds. Defaults to 0.5.
+        '''
+        self.play = play
+        self.silence = silence
+        self.gap = gap
+        self.log = log or logging.getLogger(__name__)
+
+        self.queue = deque(maxlen=max_queue)
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.playing = False
+
+        self.played = 0
+        self.dropped = 0
+        self.errors = 0
+        # How late notes start against their deadline
+        self.lateness = Histogram()
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._loop, name='pipower5-buzzer', daemon=True)
+        self.thread.start()
+        atexit.register(self.drain)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.queue.clear()
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        self.thread = None
+        atexit.unregister(self.drain)
+
+    def put(self, sequence):
+        '''
+        Queue a sequence, starts the player on first use.
+
+        Args:
+            sequence (list): A list of [action, duration in ms].
+        '''
+        self.start()
+        with self.condition:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(sequence)
+            self.condition.notify_all()
+
+    def drain(self, timeout=DRAIN_TIMEOUT):
+        '''
+        Wait until queued sequences are played.
+
+        Args:
+            timeout (float, optional): Max wait in seconds. Defaults to DRAIN_TIMEOUT.
+
+        Returns:
+            bool: True if everything was played.
+        '''
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.running and (len(self.queue) > 0 or self.playing):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def _wait_until(self, deadline):
+        # Sleep until the deadline, stop cuts it short
+        with self.condition:
+            while self.running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return True
+                self.condition.wait(remaining)
+        return False
+
+    def _play(self, sequence):
+        deadline = time.monotonic()
+        try:
+            for action, duration in sequence:
+                self.lateness.observe(max(0, time.monotonic() - deadline))
+                self.play(action)
+                deadline += duration / 1000
+                if not self._wait_until(deadline):
+                    break
+        finally:
+            self.silence()
+
+    def _loop(self):
+        while True:
+            with self.condition:
+                while self.running and len(self.queue) == 0:
+                    self.condition.wait()
+                if not self.running:
+                    break
+                sequence = self.queue.popleft()
+                self.playing = True
+            try:
+                self._play(sequence)
+                self.played += 1
+            except OSError as e:
+                # Bus failure, drop the sequence, the queue goes on
+                self.errors += 1
+                self.log.debug(f"Buzzer sequence failed: {e}")
+            except Exception as e:
+                self.errors += 1
+                self.log.warning(f"Invalid buzzer sequence {sequence}: {e}")
+            if len(self.queue) > 0:
+                self._wait_until(time.monotonic() + self.gap)
+            with self.condition:
+                self.playing = False
+                self.condition.notify_all()
+
+    def get_stats(self):
+        '''
+        Get player stats.
+
+        Returns:
+            dict: queued, played, dropped and failed sequences, and the
+                note start lateness histogram.
+        '''
+        return {
+            'queued': len(self.queue),
+            'played': self.played,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'lateness': self.lateness.to_dict(),
+        }
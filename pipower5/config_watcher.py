@@ -0,0 +1,135 @@
+import os
+import time
+import errno
+import select
+import struct
+import logging
+import threading
+import ctypes
+import ctypes.util
+
+# inotify constants, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+EVENT_HEADER = struct.Struct('iIII') # wd, mask, cookie, len
+
+SETTLE_TIME = 0.1 # seconds without events before reloading, writers may close the file more than once
+POLL_INTERVAL = 2 # seconds between mtime checks without inotify
+
+def _open_inotify(directory):
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    # Watch the directory, a file replaced by rename gets a new inode
+    wd = libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+    if wd < 0:
+        error = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(error, os.strerror(error))
+    return fd
+
+class ConfigWatcher():
+    def __init__(self, path, callback, log=None):
+        '''
+        Config file watcher, calls back when the file is written.
+
+        Uses inotify on the directory of the file, falls back to checking
+        the modification time every POLL_INTERVAL seconds.
+
+        Args:
+            path (str): Config file path.
+            callback (function): Called from the watcher thread, with the
+                monotonic time the change was seen.
+        '''
+        self.path = os.path.abspath(path)
+        self.directory = os.path.dirname(self.path)
+        self.name = os.fsencode(os.path.basename(self.path))
+        self.callback = callback
+        self.log = log or logging.getLogger(__name__)
+        self.fd = None
+        self.thread = None
+        self.running = False
+        self.mtime = self._get_mtime()
+        self.changes = 0
+
+    def _get_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def start(self):
+        if self.running:
+            return
+        try:
+            self.fd = _open_inotify(self.directory)
+        except (OSError, AttributeError) as e:
+            self.log.warning(f"inotify unavailable ({e}), checking {self.path} every {POLL_INTERVAL} s")
+            self.fd = None
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, name='pipower5-config-watcher', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
+        self.thread = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _read_events(self):
+        # Returns True if an event concerns the config file
+        matched = False
+        while True:
+            try:
+                buffer = os.read(self.fd, 4096)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    return matched
+                raise
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(buffer):
+                _, _, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+                offset += EVENT_HEADER.size
+                name = buffer[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if name == self.name:
+                    matched = True
+
+    def _wait_change(self):
+        # Block until the file changed, or up to one second to check running
+        if self.fd is None:
+            time.sleep(POLL_INTERVAL)
+            mtime = self._get_mtime()
+            changed = mtime != self.mtime
+            self.mtime = mtime
+            return changed
+        readable, _, _ = select.select([self.fd], [], [], 1.0)
+        if not readable or not self._read_events():
+            return False
+        # Let the writer finish, further events are part of the same change
+        while select.select([self.fd], [], [], SETTLE_TIME)[0]:
+            self._read_events()
+        return True
+
+    def _loop(self):
+        while self.running:
+            try:
+                if not self._wait_change():
+                    continue
+            except OSError as e:
+                self.log.error(f"Config watcher failed: {e}")
+                time.sleep(POLL_INTERVAL)
+                continue
+            if not self.running:
+                break
+            self.changes += 1
+            try:
+                self.callback(time.monotonic())
+            except Exception as e:
+                self.log.exception(e)
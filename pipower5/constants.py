@@ -48,6 +48,7 @@ SYSTEM_DEFAULT_CONFIG = {
     "temperature_unit": "C",
     "power-failure-simulation": True,
     "shutdown_percentage": 10,
+    "shared_event_loop": False,
     "send_email_on": [
         "battery_activated",
         "low_battery",
@@ -75,6 +76,7 @@ SYSTEM_DEFAULT_CONFIG = {
         "power_insufficient": "B4,50:p,100:B4,50:p,100:B4,100",
         "battery_critical_shutdown": "C6,50:p,60:C6,50:p,60:C6,100",
         "battery_voltage_critical_shutdown": "C6,50:p,60:C6,50:p,60:C6,100:p,60:C6,100",
+        "bus_degraded": "E5,100:p,100:E5,100",
     },
     "send_email_to": "",
     "smtp_email": "",
@@ -0,0 +1,360 @@
+import os
+import json
+import time
+import smtplib
+import logging
+import threading
+from collections import deque
+
+OUTBOX_DIR = '/opt/pipower5/outbox/'
+DEFAULT_MAX_SIZE = 50 # messages
+DEFAULT_MAX_ATTEMPTS = 20
+DEFAULT_BACKOFF = 5 # seconds, doubled after every failed attempt
+DEFAULT_MAX_BACKOFF = 600 # seconds
+DEFAULT_IDLE_TIMEOUT = 30 # seconds a connection is kept open for the next message
+DEFAULT_FLUSH_TIMEOUT = 30 # seconds
+
+def is_permanent_error(error):
+    '''
+    Check if a send error is permanent, a 5xx reply about the message that
+    sending it again won't change. Authentication errors are not, they are
+    fixed by a config change.
+
+    Args:
+        error (Exception): Send error.
+
+    Returns:
+        bool: True if the message should not be retried.
+    '''
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return False
+
+class EmailOutbox():
+    def __init__(self, sender, directory=OUTBOX_DIR,
+                 max_size=DEFAULT_MAX_SIZE,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 backoff=DEFAULT_BACKOFF,
+                 max_backoff=DEFAULT_MAX_BACKOFF,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 log=None):
+        '''
+        Outbox delivering emails from a worker thread, so sending never blocks the caller.
+
+        Messages are rendered on the worker thread and saved to the
+        directory until delivered, so messages queued before a reboot go out
+        after it. Messages are sent in order over one connection kept open
+        while more are queued. A failed message is retried with its own
+        exponential backoff, the ones behind it don't wait for it. A message
+        refused for good, see is_permanent_error, is dropped right away.
+        When the outbox is full the oldest message is dropped.
+
+        Args:
+            sender (EmailSender): Email sender.
+            directory (str, optional): Directory of the undelivered messages. Defaults to OUTBOX_DIR.
+            max_size (int, optional): Max queued messages. Defaults to 50.
+            max_attempts (int, optional): Attempts before a message is dropped. Defaults to 20.
+            backoff (float, optional): First retry delay in seconds. Defaults to 5.
+            max_backoff (float, optional): Max retry delay in seconds. Defaults to 600.
+            idle_timeout (float, optional): Seconds a connection stays open with
+                nothing to send. Defaults to 30.
+        '''
+        self.sender = sender
+        self.directory = directory
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.idle_timeout = idle_timeout
+        self.log = log or logging.getLogger(__name__)
+
+        # Messages put and not rendered yet
+        self.incoming = deque()
+        # Rendered messages, each with its own monotonic retry_at
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.server = None
+        self.reconnect = False
+
+        self.queued = 0
+        self.sent = 0
+        self.failed_attempts = 0
+        self.dropped = 0
+        self.connections = 0
+        self.last_error = None
+
+        self._load()
+
+    def _load(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'r') as f:
+                    message = json.load(f)
+            except (OSError, ValueError) as e:
+                self.log.warning(f"Dropping unreadable outbox message {path}: {e}")
+                self._remove(path)
+                continue
+            message['path'] = path
+            message['retry_at'] = 0
+            self.queue.append(message)
+        if len(self.queue) > 0:
+            self.log.info(f"Outbox loaded {len(self.queue)} undelivered messages")
+        while len(self.queue) > self.max_size:
+            self._drop(self.queue.popleft())
+
+    def _save(self, message):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{time.time_ns()}_{message['event']}.json")
+            with open(path + '.tmp', 'w') as f:
+                json.dump(message, f)
+            os.replace(path + '.tmp', path)
+            return path
+        except OSError as e:
+            # Still delivered, just not kept over a reboot
+            self.log.warning(f"Failed to save outbox message: {e}")
+            return None
+
+    def _remove(self, path):
+        if path is None:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _drop(self, message):
+        self.dropped += 1
+        self._remove(message.get('path'))
+        self.log.warning(f"Outbox dropped message: {message['subject']}")
+
+    def put(self, event, data, attachment_path=None):
+        '''
+        Queue a preset email, returns right away, rendering and saving are
+        left to the worker.
+
+        Args:
+            event (str): Event name, see EmailSender.send_preset_email.
+            data (dict): Values for the template.
+            attachment_path (str, optional): Attachment.
+        '''
+        with self.condition:
+            self.incoming.append({
+                'event': str(event),
+                'data': dict(data),
+                'attachment_path': attachment_path,
+                'time': time.time(),
+            })
+            self.queued += 1
+            self.condition.notify_all()
+
+    def _prepare(self, item):
+        try:
+            subject, body, attachment_path = self.sender.render_preset_email(item['event'], item['data'], item['attachment_path'])
+        except Exception as e:
+            self.log.error(f"Failed to render {item['event']} email, dropped: {e}")
+            with self.condition:
+                self.dropped += 1
+                self.condition.notify_all()
+            return
+        message = {
+            'event': item['event'],
+            'subject': subject,
+            'body': body,
+            'attachment_path': attachment_path,
+            'time': item['time'],
+            'attempts': 0,
+        }
+        message['path'] = self._save(dict(message))
+        message['retry_at'] = 0
+        with self.condition:
+            if len(self.queue) >= self.max_size:
+                self._drop(self.queue.popleft())
+            self.queue.append(message)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, name='pipower5-outbox', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        '''
+        Stop the worker, undelivered messages stay on disk.
+        '''
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        self.thread = None
+        # Messages not rendered yet are saved too
+        while len(self.incoming) > 0:
+            self._prepare(self.incoming.popleft())
+
+    def flush(self, timeout=DEFAULT_FLUSH_TIMEOUT):
+        '''
+        Send the queued messages now, skipping the retry backoff, and wait
+        until the queue is empty, like before shutdown.
+
+        Args:
+            timeout (float, optional): Max wait in seconds. Defaults to 30.
+
+        Returns:
+            bool: True if every message went out.
+        '''
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            for message in self.queue:
+                message['retry_at'] = 0
+            self.condition.notify_all()
+            while self.running and len(self.queue) + len(self.incoming) > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return len(self.queue) + len(self.incoming) == 0
+
+    def reset_connection(self):
+        '''
+        Close the open connection before the next message, like after an SMTP config change.
+        '''
+        with self.condition:
+            self.reconnect = True
+            self.condition.notify_all()
+
+    def _close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            pass
+        self.server = None
+
+    def _next(self):
+        # Render new messages, then wait for the first message that is due,
+        # closing an idle connection
+        while True:
+            close = False
+            item = None
+            with self.condition:
+                if not self.running:
+                    return None
+                if len(self.incoming) > 0:
+                    item = self.incoming.popleft()
+                elif self.reconnect:
+                    self.reconnect = False
+                    close = True
+                else:
+                    now = time.monotonic()
+                    retry_at = None
+                    for message in self.queue:
+                        if message['retry_at'] <= now:
+                            return message
+                        if retry_at is None or message['retry_at'] < retry_at:
+                            retry_at = message['retry_at']
+                    if retry_at is not None:
+                        timeout = retry_at - now
+                    elif self.server is not None:
+                        timeout = self.idle_timeout
+                    else:
+                        timeout = None
+                    if not self.condition.wait(timeout) and len(self.queue) == 0:
+                        close = True
+            # Outside the lock, templates are read from disk and quit may wait on the server
+            if item is not None:
+                self._prepare(item)
+            if close:
+                self._close()
+
+    def _unqueue(self, message):
+        # Under the condition, by identity as messages may be equal
+        for i, queued in enumerate(self.queue):
+            if queued is message:
+                del self.queue[i]
+                return
+
+    def _send(self, message):
+        reused = self.server is not None
+        try:
+            if self.server is None:
+                self.server = self.sender.connect()
+                self.connections += 1
+            email = self.sender.build_message(message['subject'], message['body'], message['attachment_path'])
+            self.sender.send_message(self.server, email)
+        except Exception as e:
+            self._close()
+            if not reused or is_permanent_error(e):
+                raise
+            # The server may have dropped the idle connection, try once on a new one
+            self.server = self.sender.connect()
+            self.connections += 1
+            email = self.sender.build_message(message['subject'], message['body'], message['attachment_path'])
+            self.sender.send_message(self.server, email)
+
+    def _loop(self):
+        while True:
+            message = self._next()
+            if message is None:
+                break
+            try:
+                self._send(message)
+            except Exception as e:
+                self._close()
+                self.failed_attempts += 1
+                self.last_error = str(e)
+                message['attempts'] += 1
+                permanent = is_permanent_error(e)
+                if permanent:
+                    self.log.error(f"{message['event']} email refused: {e}")
+                with self.condition:
+                    if permanent or message['attempts'] >= self.max_attempts:
+                        self._unqueue(message)
+                        self._drop(message)
+                        self.condition.notify_all()
+                        continue
+                    delay = min(self.backoff * 2 ** (message['attempts'] - 1), self.max_backoff)
+                    message['retry_at'] = time.monotonic() + delay
+                self.log.warning(f"Failed to send {message['event']} email, attempt {message['attempts']}, retry in {delay:.1f} s: {e}")
+                continue
+
+            self.sent += 1
+            self._remove(message.get('path'))
+            with self.condition:
+                self._unqueue(message)
+                # Wake up flush
+                self.condition.notify_all()
+            self.log.debug(f"Event {message['event']} sent successfully")
+        self._close()
+
+    def get_stats(self):
+        '''
+        Get outbox stats.
+
+        Returns:
+            dict: running, pending messages, queued, sent, failed attempts,
+                dropped messages, connections opened and the last error.
+        '''
+        return {
+            'running': self.running,
+            'pending': len(self.queue) + len(self.incoming),
+            'queued': self.queued,
+            'sent': self.sent,
+            'failed_attempts': self.failed_attempts,
+            'dropped': self.dropped,
+            'connections': self.connections,
+            'last_error': self.last_error,
+        }
@@ -78,9 +78,18 @@ class EmailSender():
         else:
             raise FileNotFoundError(f"Email templates file {TEMPLATES} not found")
 
-    def send_preset_email(self, event, data):
-        if not self.is_ready():
-            return "Email sender not ready"
+    def render_preset_email(self, event, data, attachment_path=None):
+        '''
+        Render the subject and body of a preset email.
+
+        Args:
+            event (str): Event name, key of the templates.
+            data (dict): Values for the template.
+            attachment_path (str, optional): Attachment, defaults to the one of the template.
+
+        Returns:
+            tuple: (subject, body, attachment_path)
+        '''
         template = self.templates[event]
         subject = template['subject'].format(**data)
         body_path = template['body_path']
@@ -88,10 +97,14 @@ class EmailSender():
         with open(body_path, 'r') as f:
             body = f.read()
         body = body.format(**data)
-        attachment_path = None
-        if 'attachment_path' in template:
+        if attachment_path is None and 'attachment_path' in template:
             attachment_path = template['attachment_path'].format(**data)
+        return subject, body, attachment_path
 
+    def send_preset_email(self, event, data, attachment_path=None):
+        if not self.is_ready():
+            return "Email sender not ready"
+        subject, body, attachment_path = self.render_preset_email(event, data, attachment_path)
         return self.send_email(subject, body, attachment_path)
 
     def connect(self):
@@ -131,6 +144,27 @@ class EmailSender():
         attachment_path: 附件路径(可选)
         """
 
+        try:
+            message = self.build_message(subject, body, attachment_path)
+            server = self.connect()
+            self.send_message(server, message)
+            server.quit()
+            return True
+        except Exception as e:
+            return e
+
+    def build_message(self, subject, body, attachment_path=None):
+        '''
+        Build the message to send.
+
+        Args:
+            subject (str): Subject.
+            body (str): HTML body.
+            attachment_path (str, optional): Attachment, skipped if missing.
+
+        Returns:
+            MIMEMultipart: Message.
+        '''
         message = MIMEMultipart()
         message["From"] = self.smtp_email
         message["To"] = self.send_email_to
@@ -150,12 +184,14 @@ class EmailSender():
                 f"attachment; filename= {filename}",
             )
             message.attach(part)
-        
-        try:
-            server = self.connect()
-            text = message.as_string()
-            server.sendmail(message["From"], self.send_email_to, text)
-            server.quit()
-            return True
-        except Exception as e:
-            return e
+        return message
+
+    def send_message(self, server, message):
+        '''
+        Send a message over a connection from connect, the connection stays open.
+
+        Args:
+            server (smtplib.SMTP): Connection.
+            message (MIMEMultipart): Message, see build_message.
+        '''
+        server.sendmail(message["From"], self.send_email_to, message.as_string())
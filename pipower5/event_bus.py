@@ -0,0 +1,211 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import Histogram
+
+DEFAULT_MAX_QUEUE = 16 # messages per subscriber
+UNBOUNDED = 0 # max_queue of a subscriber that must not miss a message
+DEFAULT_WORKERS = 4 # threads running sync handlers
+
+class Subscriber():
+    def __init__(self, topic, handler, max_queue=DEFAULT_MAX_QUEUE):
+        '''
+        Subscription of a handler to a topic, with its own bounded queue.
+
+        Args:
+            topic (str): Topic.
+            handler (function): Called with the message, may be a coroutine function.
+            max_queue (int, optional): Max queued messages, the oldest is
+                dropped when full, UNBOUNDED to never drop. Defaults to 16.
+        '''
+        self.topic = str(topic)
+        self.handler = handler
+        self.name = getattr(handler, '__qualname__', repr(handler))
+        self.is_async = asyncio.iscoroutinefunction(handler)
+        self.queue = deque(maxlen=max_queue or None)
+        self.task = None
+
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_pending = 0
+        # Publish to handler start
+        self.lag = Histogram()
+        # Handler run time
+        self.duration = Histogram()
+
+    def get_stats(self):
+        return {
+            'topic': self.topic,
+            'handler': self.name,
+            'pending': len(self.queue),
+            'max_pending': self.max_pending,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'lag': self.lag.to_dict(),
+            'duration': self.duration.to_dict(),
+        }
+
+class EventBus():
+    def __init__(self, workers=DEFAULT_WORKERS, log=None):
+        '''
+        Publish/subscribe bus delivering off the publisher.
+
+        publish only queues the message for every subscriber of the topic
+        and returns. Each subscriber is drained in order by its own task on
+        the event loop: coroutine handlers are awaited, sync handlers run on
+        a thread pool, so a slow subscriber delays only its own queue. A full
+        queue drops its oldest message, the publisher never waits.
+
+        Args:
+            workers (int, optional): Threads running sync handlers. Defaults to 4.
+        '''
+        self.log = log or logging.getLogger(__name__)
+        self.workers = workers
+        self.subscribers = {}
+        self.loop = None
+        self.executor = None
+
+    def start(self, loop):
+        '''
+        Start delivering, messages published before are kept until then.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): Loop running the subscriber tasks.
+        '''
+        self.loop = loop
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='pipower5-events')
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                if len(subscriber.queue) > 0:
+                    self.loop.call_soon_threadsafe(self._schedule, subscriber)
+
+    def stop(self):
+        for task in self.detach():
+            task.cancel()
+
+    def detach(self):
+        '''
+        Stop delivering without touching the loop, safe from another thread.
+        Queued messages are kept for the next start.
+
+        Returns:
+            list: Subscriber tasks still running, for their loop to cancel.
+        '''
+        tasks = []
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                if subscriber.task is not None:
+                    tasks.append(subscriber.task)
+                    subscriber.task = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        self.loop = None
+        return tasks
+
+    def subscribe(self, topic, handler, max_queue=DEFAULT_MAX_QUEUE):
+        '''
+        Subscribe a handler to a topic, a topic can have many subscribers.
+
+        Args:
+            topic (str): Topic.
+            handler (function): Called with the message, may be a coroutine function.
+            max_queue (int, optional): Max queued messages, UNBOUNDED to never
+                drop. Defaults to 16.
+
+        Returns:
+            Subscriber: Subscription, for unsubscribe.
+        '''
+        subscriber = Subscriber(topic, handler, max_queue)
+        self.subscribers.setdefault(subscriber.topic, []).append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscribers = self.subscribers.get(subscriber.topic, [])
+        if subscriber in subscribers:
+            subscribers.remove(subscriber)
+        if subscriber.task is not None:
+            subscriber.task.cancel()
+            subscriber.task = None
+
+    def has_subscribers(self, topic):
+        return len(self.subscribers.get(str(topic), [])) > 0
+
+    def publish(self, topic, message):
+        '''
+        Queue a message for the subscribers of a topic, returns right away.
+        Call from the loop thread, the message is shared by the subscribers.
+
+        Args:
+            topic (str): Topic.
+            message (Any): Message.
+        '''
+        subscribers = self.subscribers.get(str(topic))
+        if not subscribers:
+            return
+        now = time.monotonic()
+        # A detached loop still running its last step only queues
+        try:
+            on_loop = self.loop is not None and asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        for subscriber in subscribers:
+            if subscriber.queue.maxlen is not None and len(subscriber.queue) == subscriber.queue.maxlen:
+                subscriber.dropped += 1
+                self.log.debug(f"Subscriber {subscriber.name} of {subscriber.topic} is lagging, dropped a message")
+            subscriber.queue.append((now, message))
+            if len(subscriber.queue) > subscriber.max_pending:
+                subscriber.max_pending = len(subscriber.queue)
+            if on_loop:
+                self._schedule(subscriber)
+
+    def _schedule(self, subscriber):
+        if subscriber.task is None and len(subscriber.queue) > 0:
+            subscriber.task = self.loop.create_task(self._drain(subscriber))
+
+    async def _drain(self, subscriber):
+        # Bound to the loop and executor it started with, detach may clear them
+        loop, executor = self.loop, self.executor
+        task = asyncio.current_task()
+        try:
+            # Once detached, what is still queued waits for the next start
+            while len(subscriber.queue) > 0 and subscriber.task is task:
+                published, message = subscriber.queue.popleft()
+                start = time.monotonic()
+                subscriber.lag.observe(start - published)
+                try:
+                    if subscriber.is_async:
+                        await subscriber.handler(message)
+                    else:
+                        await loop.run_in_executor(executor, subscriber.handler, message)
+                    subscriber.delivered += 1
+                except Exception as e:
+                    subscriber.errors += 1
+                    self.log.error(f"Subscriber {subscriber.name} of {subscriber.topic} failed: {e}")
+                subscriber.duration.observe(time.monotonic() - start)
+        finally:
+            # Once detached, the task may already be replaced on a new loop
+            if subscriber.task is task:
+                subscriber.task = None
+
+    def get_stats(self):
+        '''
+        Get per subscriber stats.
+
+        Returns:
+            dict: {"topic handler": stats}, pending and max pending messages,
+                delivered, dropped, errors, and lag and duration histograms.
+        '''
+        stats = {}
+        for topic, subscribers in self.subscribers.items():
+            for subscriber in subscribers:
+                key = f'{topic} {subscriber.name}'
+                if key in stats:
+                    # Like two lambdas on one topic
+                    key = f'{key} #{subscribers.index(subscriber) + 1}'
+                stats[key] = subscriber.get_stats()
+        return stats
@@ -0,0 +1,154 @@
+import os
+import time
+import tempfile
+from .metrics import Histogram
+
+STATS_ENV = 'PIPOWER5_STATS'
+STATS_NAME = 'pipower5-stats.json'
+
+# Transfer methods of the I2C object, method name: bytes per transaction, None if from the arguments
+TRANSFER_METHODS = {
+    'read_byte': 1,
+    'read_byte_data': 1,
+    'read_word_data': 2,
+    'read_block_data': None,
+    'write_byte_data': 1,
+    'write_word_data': 2,
+    'write_block_data': None,
+}
+
+def get_stats_path():
+    '''
+    Get the file the service dumps its bus stats to, read by the CLI.
+
+    Returns:
+        str: PIPOWER5_STATS if set, else /run or the temp directory.
+    '''
+    path = os.getenv(STATS_ENV)
+    if path:
+        return path
+    if os.access('/run', os.W_OK):
+        return os.path.join('/run', STATS_NAME)
+    return os.path.join(tempfile.gettempdir(), STATS_NAME)
+
+class TransactionStats():
+    def __init__(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.errors = 0
+        self.retries = 0
+        self.latency = Histogram()
+
+    def to_dict(self):
+        return {
+            'transactions': self.transactions,
+            'bytes': self.bytes,
+            'errors': self.errors,
+            'retries': self.retries,
+            'latency': self.latency.to_dict(),
+        }
+
+class InstrumentedBus():
+    def __init__(self, i2c, read_names=None, write_names=None):
+        '''
+        I2C object wrapper counting transactions, bytes, errors and retries,
+        with a latency histogram, per method and register.
+
+        Stats are created on the first transaction of a method and register,
+        after that a transaction allocates nothing. Callers hold the bus lock,
+        so transactions of one process never update the stats concurrently.
+
+        Args:
+            i2c (I2C): I2C object to wrap.
+            read_names (dict, optional): Read register names by address, for the stats keys.
+            write_names (dict, optional): Write register names by address.
+        '''
+        self.i2c = i2c
+        self.read_names = read_names or {}
+        self.write_names = write_names or {}
+        # method: {register: TransactionStats}
+        self.stats = {method: {} for method in TRANSFER_METHODS}
+        for method, length in TRANSFER_METHODS.items():
+            if hasattr(i2c, method):
+                setattr(self, method, self._wrap(method, length))
+
+    def _get(self, method, register):
+        stats = self.stats[method].get(register)
+        if stats is None:
+            stats = TransactionStats()
+            self.stats[method][register] = stats
+        return stats
+
+    def _wrap(self, method, length):
+        func = getattr(self.i2c, method)
+        stats_by_register = self.stats[method]
+
+        def transfer(*args):
+            register = args[0] if len(args) > 0 and method != 'read_byte' else None
+            stats = stats_by_register.get(register)
+            if stats is None:
+                stats = self._get(method, register)
+            start = time.perf_counter()
+            try:
+                result = func(*args)
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                stats.latency.observe(time.perf_counter() - start)
+                stats.transactions += 1
+            if length is not None:
+                stats.bytes += length
+            elif method == 'read_block_data':
+                stats.bytes += args[1]
+            else:
+                stats.bytes += len(args[1])
+            return result
+        transfer.__name__ = method
+        return transfer
+
+    def record_retry(self, method, register=None):
+        '''
+        Count a retry of a transaction, done by the caller.
+
+        Args:
+            method (str): Method name, like 'write_block_data'.
+            register (int, optional): Register address.
+        '''
+        self._get(method, register).retries += 1
+
+    def get_stats(self):
+        '''
+        Get transaction stats.
+
+        Returns:
+            dict: {method: {register: stats}}, registers keyed as "0x00 name",
+                see TransactionStats, plus totals.
+        '''
+        stats = {}
+        total = {'transactions': 0, 'bytes': 0, 'errors': 0, 'retries': 0, 'time': 0}
+        for method, by_register in self.stats.items():
+            if len(by_register) == 0:
+                continue
+            stats[method] = {}
+            names = self.write_names if method.startswith('write_') else self.read_names
+            for register, item in sorted(by_register.items(), key=lambda kv: -1 if kv[0] is None else kv[0]):
+                if register is None:
+                    key = '-'
+                else:
+                    key = f'0x{register:02X} {names.get(register, "")}'.strip()
+                stats[method][key] = item.to_dict()
+                total['transactions'] += item.transactions
+                total['bytes'] += item.bytes
+                total['errors'] += item.errors
+                total['retries'] += item.retries
+                total['time'] += item.latency.sum
+        stats['total'] = total
+        return stats
+
+    def reset_stats(self):
+        for by_register in self.stats.values():
+            by_register.clear()
+
+    def __getattr__(self, name):
+        return getattr(self.i2c, name)
@@ -0,0 +1,71 @@
+import time
+import logging
+
+try:
+    from gpiozero import DigitalInputDevice
+except ImportError:
+    DigitalInputDevice = None
+
+class InterruptSource():
+    def __init__(self, pin=None, simulator=None, active_low=True, log=None):
+        '''
+        Edge triggered event source for button and input changes.
+
+        Uses a GPIO line wired to the board interrupt output, or the interrupt
+        line of a simulated board. Without either, it stays disabled and the
+        service keeps polling.
+
+        Args:
+            pin (int, optional): BCM GPIO pin of the interrupt line.
+            simulator (SimulatedBoard, optional): Simulated board to take edges from.
+            active_low (bool, optional): Interrupt line is active low. Defaults to True.
+        '''
+        self.pin = pin
+        self.simulator = simulator
+        self.active_low = active_low
+        self.log = log or logging.getLogger(__name__)
+        self.device = None
+        self.callback = None
+        self.edges = 0
+
+    def start(self, callback):
+        '''
+        Start watching edges.
+
+        Args:
+            callback (function): Called with the monotonic edge time, from the
+                thread the edge is detected on.
+
+        Returns:
+            bool: True if edges are watched, False if polling has to be used.
+        '''
+        self.callback = callback
+        if self.simulator is not None:
+            self.simulator.add_interrupt_handler(self._handle)
+            return True
+        if self.pin is None:
+            return False
+        if DigitalInputDevice is None:
+            self.log.warning('gpiozero not found, interrupt disabled, polling only')
+            return False
+        try:
+            self.device = DigitalInputDevice(self.pin, pull_up=self.active_low)
+        except Exception as e:
+            self.log.warning(f'Failed to set up interrupt pin {self.pin}: {e}, polling only')
+            return False
+        self.device.when_activated = self._handle
+        self.log.info(f'Interrupt enabled on GPIO{self.pin}')
+        return True
+
+    def _handle(self, *args):
+        edge_time = time.monotonic()
+        self.edges += 1
+        if self.callback:
+            self.callback(edge_time)
+
+    def close(self):
+        if self.simulator is not None:
+            self.simulator.remove_interrupt_handler(self._handle)
+        if self.device is not None:
+            self.device.close()
+            self.device = None
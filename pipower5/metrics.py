@@ -0,0 +1,51 @@
+from bisect import bisect_left
+
+# Default latency bucket upper bounds in seconds
+LATENCY_BUCKETS = [0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5]
+
+class Histogram():
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        '''
+        Fixed bucket histogram, buckets are preallocated so observing allocates nothing.
+
+        Args:
+            buckets (list, optional): Sorted bucket upper bounds, values above the
+                last bound go to an overflow bucket. Defaults to LATENCY_BUCKETS.
+        '''
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def to_dict(self):
+        '''
+        Get histogram as a dict.
+
+        Returns:
+            dict: count, sum, avg, max and buckets as a {upper bound: count} dict,
+                with the overflow bucket as 'inf'.
+        '''
+        buckets = {str(bound): count for bound, count in zip(self.buckets, self.counts)}
+        buckets['inf'] = self.counts[-1]
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'avg': self.sum / self.count if self.count else 0,
+            'max': self.max,
+            'buckets': buckets,
+        }
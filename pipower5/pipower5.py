@@ -3,7 +3,15 @@ import json
 from enum import IntEnum, StrEnum
 from spc.spc import SPC
 from .note import NOTES, get_note_freq
-import threading
+from .register_cache import RegisterCache, CachePolicy
+from .simulator import SimulatedBoard, SimulatedBus, is_simulator_enabled
+from .bus_lock import BusLock
+from .advanced_command import AdvancedCommandExecutor
+from .registers import Register, RegisterDecoder
+from .instrumented_bus import InstrumentedBus
+from .resilient_bus import ResilientBus
+from .buzzer_player import BuzzerPlayer
+from .power_sample import PowerSample
 
 class PowerSource(IntEnum):
     EXTERNAL = 0
@@ -32,6 +40,7 @@ class Event(StrEnum):
     POWER_INSUFFICIENT = 'power_insufficient'
     BATTERY_CRITICAL_SHUTDOWN = 'battery_critical_shutdown'
     BATTERY_VOLTAGE_CRITICAL_SHUTDOWN = 'battery_voltage_critical_shutdown'
+    BUS_DEGRADED = 'bus_degraded'
 
 class PiPower5(SPC):
     # register address
@@ -40,6 +49,71 @@ class PiPower5(SPC):
 
     REG_WRITE_POWER_BTN_STATE = 12
 
+    # Writable settings, name: spc write method
+    # Each setting reads back from the register of the same name in REGISTERS.
+    SETTINGS = {
+        'shutdown_percentage': 'write_shutdown_percentage',
+        'default_on': 'write_default_on',
+        'buzzer_volume': 'write_buzzer_volume',
+    }
+    SETTINGS_SETTLE_TIME = 0.1 # seconds for the firmware to apply written settings
+
+    # Read register map, every read is decoded from it, on the real bus and
+    # on the simulator. It also drives the CLI flags and labels.
+    REGISTERS = {
+        'input_voltage': Register(0, width=2, unit='mV', label='Input voltage', flags=('-iv', '--input-voltage'), group='Input'),
+        'input_current': Register(2, width=2, unit='mA', label='Input current', flags=('-ic', '--input-current'), group='Input'),
+        'output_voltage': Register(4, width=2, unit='mV', label='Output voltage', flags=('-ov', '--output-voltage'), group='Output'),
+        'output_current': Register(6, width=2, unit='mA', label='Output current', flags=('-oc', '--output-current'), group='Output'),
+        'battery_voltage': Register(8, width=2, unit='mV', label='Battery voltage', flags=('-bv', '--battery-voltage'), group='Battery'),
+        'battery_current': Register(10, width=2, signed=True, unit='mA', label='Battery current', flags=('-bc', '--battery-current'), group='Battery'),
+        'battery_percentage': Register(12, unit='%', label='Battery percentage', flags=('-bp', '--battery-percentage'), group='Battery'),
+        'battery_capacity': Register(13, width=2, unit='mAh', label='Battery capacity', group='Battery'),
+        'power_source': Register(15, enum=PowerSource, label='Power source', flags=('-bs', '--battery-source'), group='Battery'),
+        'is_input_plugged_in': Register(16, enum=bool, label='Input plugged in', flags=('-ii', '--is-input-plugged_in'), group='Input'),
+        'is_battery_plugged_in': Register(17, enum=bool, label='Battery plugged in', group='Battery'),
+        'is_charging': Register(18, enum=bool, label='Charging', flags=('-ichg', '--is-charging'), group='Battery'),
+        'shutdown_request': Register(20, enum=ShutdownRequest, label='Shutdown request', flags=('-sr', '--shutdown-request'), group='Internal'),
+        'battery_1_voltage': Register(21, width=2, unit='mV', versions=['50'], label='Battery 1 voltage', flags=('-b1v', '--battery-1-voltage')),
+        'battery_2_voltage': Register(23, width=2, unit='mV', versions=['50'], label='Battery 2 voltage', flags=('-b2v', '--battery-2-voltage')),
+        'firmware_version': Register(128, count=3, label='Pipower5 firmware version', flags=('-fv', '--firmware')),
+        'default_on': Register(131, enum=bool, label='Default on', flags=('-do', '--default-on'), group='Internal'),
+        'shutdown_percentage': Register(142, unit='%', label='Shutdown percentage', group='Internal'),
+        'buzzer_volume': Register(143, label='Buzzer volume'),
+        'power_btn': Register(REG_PWR_BTN_STATE, enum=ButtonState, label='Power button', flags=('-pb', '--power-btn'), group='Internal'),
+        'max_charge_current': Register(REG_CHARGE_MAX_CURRENT, scale=100, unit='mA', label='Max charging current', flags=('-cc', '--charging-current'), group='Internal'),
+    }
+
+    # Fields returned by read_all, one block read of the telemetry registers
+    READ_ALL_FIELDS = [
+        'input_voltage',
+        'input_current',
+        'output_voltage',
+        'output_current',
+        'battery_voltage',
+        'battery_current',
+        'battery_percentage',
+        'battery_capacity',
+        'power_source',
+        'is_input_plugged_in',
+        'is_battery_plugged_in',
+        'is_charging',
+    ]
+
+    # Snapshot fields, every register the service needs on each tick
+    SNAPSHOT_FIELDS = READ_ALL_FIELDS + [
+        'shutdown_request',
+        'default_on',
+        'shutdown_percentage',
+        'power_btn',
+        'max_charge_current',
+    ]
+
+    # Registers are read in SMBus block reads, up to 32 bytes each. Registers
+    # closer than BLOCK_GAP share a read, the bytes between are read and skipped.
+    MAX_BLOCK_LENGTH = 32 # bytes
+    BLOCK_GAP = 8 # bytes
+
     BAT_MAX_CAPACITY = 2000 # mAh   
 
     ADV_CMD_START = 0xAC
@@ -55,38 +129,380 @@ class PiPower5(SPC):
 
     PAUSE_ACTIONS = ['pause', 'PAUSE', 'Pause', 'P', 'p']
 
-    def __init__(self):
+    # Freshness policy of slow-changing registers, others are always read live.
+    # Settings other processes may write (the CLI) use a TTL instead of static.
+    CACHE_POLICIES = {
+        'firmware_version': (CachePolicy.STATIC, None),
+        'max_charge_current': (CachePolicy.STATIC, None),
+        'default_on': (CachePolicy.TTL, 30),
+        'shutdown_percentage': (CachePolicy.TTL, 10),
+        'buzzer_volume': (CachePolicy.TTL, 10),
+    }
+
+    def __init__(self, simulator=None, bus_lock=None):
+        '''
+        PiPower5 board.
+
+        Args:
+            simulator (bool|SimulatedBoard, optional): Run against a simulated
+                board instead of the I2C bus. True creates a default board.
+                Defaults to the PIPOWER5_SIMULATOR environment variable.
+            bus_lock (BusLock, optional): Lock shared with other processes on
+                the bus. Defaults to BusLock().
+        '''
         super().__init__()
+        # Closed with the device only if created here
+        self.owns_bus_lock = bus_lock is None
+        self.bus_lock = bus_lock or BusLock()
+        if simulator is None:
+            simulator = is_simulator_enabled()
+        self.simulator = None
+        if simulator:
+            # The simulated board answers on the bus, spc runs unchanged on top
+            if not isinstance(simulator, SimulatedBoard):
+                simulator = SimulatedBoard.from_env()
+            self.simulator = simulator
+            self.i2c = SimulatedBus(simulator, self)
+        # Per register transaction stats, cheap enough to stay on
+        read_names = {register.address: name for name, register in self.REGISTERS.items()}
+        write_names = {
+            self.REG_WRITE_POWER_BTN_STATE: 'power_btn',
+            self.ADV_CMD_START: 'advanced_command',
+        }
+        self.i2c = InstrumentedBus(self.i2c, read_names, write_names)
+        # Retries and circuit breaker on top, retries show in the stats above
+        self.i2c = ResilientBus(self.i2c)
+
+        self.cache = RegisterCache()
+        for name, (policy, ttl) in self.CACHE_POLICIES.items():
+            self.cache.set_policy(name, policy, ttl)
+
+        self.advanced_command = AdvancedCommandExecutor(self)
+
+        # Decoders are compiled once per field set, blocks once per read
+        self.decoders = {}
+        self.blocks = {}
+        for names in [self.READ_ALL_FIELDS, self.SNAPSHOT_FIELDS]:
+            self._get_blocks(names)
+        # Refilled by every read_snapshot, stale fields keep their last value
+        self.snapshot = PowerSample()
+
+        # Started on the first sequence
+        self.buzzer = BuzzerPlayer(self._buzz_action, lambda: self.write_buzzer_freq(0))
+
+    @property
+    def is_simulated(self):
+        return self.simulator is not None
+
+    def _get_decoder(self, names):
+        key = tuple(names)
+        decoder = self.decoders.get(key)
+        if decoder is None:
+            decoder = RegisterDecoder(self.REGISTERS, names)
+            self.decoders[key] = decoder
+        return decoder
+
+    def _get_blocks(self, names):
+        key = tuple(names)
+        blocks = self.blocks.get(key)
+        if blocks is None:
+            groups = self._get_decoder(names).split(self.BLOCK_GAP, self.MAX_BLOCK_LENGTH)
+            blocks = [self._get_decoder(group) for group in groups]
+            self.blocks[key] = blocks
+        return blocks
+
+    def _read_block(self, decoder, target=None):
+        with self.bus_lock:
+            buffer = bytes(self.i2c.read_block_data(decoder.start, decoder.length))
+        if target is not None:
+            return decoder.decode_into(target, buffer)
+        return decoder.decode(buffer)
+
+    def _read_fields(self, names, target=None):
+        '''
+        Read registers with as few block reads as cover all of them.
 
-        self.buzzer_sequence_queue = []
-        self.buzzer_thread = None
+        Args:
+            names (list): Register names in REGISTERS.
+            target (object, optional): Record to decode into, like a PowerSample.
 
-    def get_max_charge_current(self):
-        return self.i2c.read_byte_data(self.REG_CHARGE_MAX_CURRENT)*100
+        Returns:
+            dict: Decoded values by name, or the target.
+        '''
+        blocks = self._get_blocks(names)
+        if len(blocks) == 1:
+            return self._read_block(blocks[0], target)
+        data = {}
+        # One lock for all blocks, so other processes don't write in between
+        with self.bus_lock:
+            for decoder in blocks:
+                if target is not None:
+                    self._read_block(decoder, target)
+                else:
+                    data.update(self._read_block(decoder))
+        if target is not None:
+            return target
+        return data
 
-    def disable_input(self):
-        time_out = 5 # seconds
-        st = time.time()
-        while time.time() - st < time_out:
-            self.i2c.write_block_data(self.ADV_CMD_START, [self.ADV_CMD_VBUS_EN, 0, self.ADV_CMD_END])
-            status = self.i2c.read_byte()
-            if status == self.ADV_CMD_OK:
-                return True
-            # !!! Don't add delay, otherwise status maybe error casued multiple process read data at the same time !!!
+    def read_fields(self, names):
+        '''
+        Read several registers in as few block reads as possible.
+
+        Args:
+            names (list): Register names, see REGISTERS.
+
+        Returns:
+            dict: Typed values by name.
+        '''
+        for name in names:
+            if name not in self.REGISTERS:
+                raise ValueError(f"Invalid register: {name}")
+        return self._read_fields(names)
+
+    def _read_field(self, name):
+        return self._read_fields([name])[name]
+
+    def get_cache_stats(self):
+        '''
+        Get register cache hit and miss counters.
+
+        Returns:
+            dict: Cache stats, hits are bus transactions saved.
+        '''
+        return self.cache.get_stats()
+
+    def get_bus_stats(self):
+        '''
+        Get I2C transaction stats.
+
+        Returns:
+            dict: Transactions, bytes, errors, retries and latency histogram
+                per method and register, see InstrumentedBus.get_stats.
+        '''
+        return self.i2c.get_stats()
+
+    def get_fault_stats(self):
+        '''
+        Get bus error and recovery counters.
+
+        Returns:
+            dict: Circuit breaker state and counters, see ResilientBus.get_fault_stats.
+        '''
+        return self.i2c.get_fault_stats()
+
+    @property
+    def is_bus_healthy(self):
+        return self.i2c.is_healthy
+
+    def get_bus_lock_stats(self):
+        '''
+        Get bus lock contention stats.
+
+        Returns:
+            dict: Bus lock stats, see BusLock.get_stats.
+        '''
+        return self.bus_lock.get_stats()
+
+    def read_all(self):
+        '''
+        Read all telemetry registers in one block read.
+
+        Returns:
+            dict: Input, output and battery telemetry.
+        '''
+        return self._read_fields(self.READ_ALL_FIELDS)
+
+    def read_input_voltage(self):
+        return self._read_field('input_voltage')
+
+    def read_input_current(self):
+        return self._read_field('input_current')
+
+    def read_output_voltage(self):
+        return self._read_field('output_voltage')
+
+    def read_output_current(self):
+        return self._read_field('output_current')
+
+    def read_battery_voltage(self):
+        return self._read_field('battery_voltage')
+
+    def read_battery_1_voltage(self):
+        return self._read_field('battery_1_voltage')
+
+    def read_battery_2_voltage(self):
+        return self._read_field('battery_2_voltage')
+
+    def read_battery_current(self):
+        return self._read_field('battery_current')
+
+    def read_battery_percentage(self):
+        return self._read_field('battery_percentage')
+
+    def read_power_source(self):
+        return self._read_field('power_source')
+
+    def read_is_input_plugged_in(self):
+        return self._read_field('is_input_plugged_in')
+
+    def read_is_charging(self):
+        return self._read_field('is_charging')
+
+    def get_max_charge_current(self, cached=True):
+        if not cached:
+            self.cache.invalidate('max_charge_current')
+        return self.cache.get('max_charge_current', lambda: self._read_field('max_charge_current'))
+
+    def read_firmware_version(self, cached=True):
+        if not cached:
+            self.cache.invalidate('firmware_version')
+        return self.cache.get('firmware_version', lambda: self._read_field('firmware_version'))
+
+    def read_default_on(self, cached=True):
+        if not cached:
+            self.cache.invalidate('default_on')
+        return self.cache.get('default_on', lambda: self._read_field('default_on'))
+
+    def read_shutdown_percentage(self, cached=True):
+        if not cached:
+            self.cache.invalidate('shutdown_percentage')
+        return self.cache.get('shutdown_percentage', lambda: self._read_field('shutdown_percentage'))
+
+    def _write_setting(self, name, write, value):
+        # Keep the written value, a value the board didn't take is read back
+        # once its TTL runs out, or by the next snapshot
+        try:
+            with self.bus_lock:
+                result = write(value)
+        except Exception:
+            self.cache.invalidate(name)
+            raise
+        if result is False:
+            self.cache.invalidate(name)
         else:
-            return False
+            self.cache.put(name, self.REGISTERS[name].convert(int(value)))
+        return result
+
+    def write_shutdown_percentage(self, percentage):
+        return self._write_setting('shutdown_percentage', super().write_shutdown_percentage, percentage)
+
+    def read_buzzer_volume(self, cached=True):
+        if not cached:
+            self.cache.invalidate('buzzer_volume')
+        return self.cache.get('buzzer_volume', lambda: self._read_field('buzzer_volume'))
+
+    def write_buzzer_volume(self, volume):
+        return self._write_setting('buzzer_volume', super().write_buzzer_volume, volume)
+
+    def write_default_on(self, on):
+        return self._write_setting('default_on', super().write_default_on, on)
+
+    def apply_settings(self, settings, verify=True):
+        '''
+        Apply several settings in one pass.
+
+        Current values are read in one block read and only changed settings
+        are written, each with its spc write method. Then all settings are
+        verified with one block read-back. A setting that fails doesn't stop
+        the others. Blocks for the settle time, run it off the callers of
+        update_config, like on the bus executor.
+
+        Args:
+            settings (dict): Settings by name, see SETTINGS.
+            verify (bool, optional): Read back and verify written settings. Defaults to True.
+
+        Returns:
+            dict: changed, {name: (old, new)} of settings written and verified,
+                failed, {name: (wanted, actual)} of settings that didn't stick.
+        '''
+        for name in settings:
+            if name not in self.SETTINGS:
+                raise ValueError(f"Invalid setting: {name}")
+        names = list(settings.keys())
+        result = {'changed': {}, 'failed': {}}
+        if len(names) == 0:
+            return result
+
+        current = self._read_fields(names)
+        pending = {name: settings[name] for name in names if current[name] != settings[name]}
+        if len(pending) == 0:
+            return result
+
+        written = {}
+        with self.bus_lock:
+            for name, value in pending.items():
+                try:
+                    getattr(self, self.SETTINGS[name])(value)
+                except (OSError, ValueError):
+                    # Rejected by spc or lost on the bus, the others still go
+                    result['failed'][name] = (value, current[name])
+                    continue
+                written[name] = value
+
+        if not verify:
+            for name, value in written.items():
+                result['changed'][name] = (current[name], value)
+            return result
+
+        time.sleep(self.SETTINGS_SETTLE_TIME)
+        actual = self._read_fields(names)
+        for name, value in written.items():
+            self.cache.put(name, actual[name])
+            if actual[name] == value:
+                result['changed'][name] = (current[name], value)
+            else:
+                result['failed'][name] = (value, actual[name])
+        return result
+
+    def write_buzzer_freq(self, freq):
+        with self.bus_lock:
+            return super().write_buzzer_freq(freq)
+
+    def get_advanced_command_stats(self):
+        '''
+        Get advanced command counters, latency and attempt histograms.
+
+        Returns:
+            dict: Stats by command name.
+        '''
+        return self.advanced_command.get_stats()
+
+    def send_advanced_command(self, command, arg=0):
+        '''
+        Send an advanced command, retried with backoff until acknowledged.
+
+        Args:
+            command (int): One of ADV_CMD_RST, ADV_CMD_VBUS_EN, ADV_CMD_BAT_EN, ADV_CMD_OUPUT_EN, ADV_CMD_ENTER_IAP.
+            arg (int, optional): Command argument. Defaults to 0.
+
+        Returns:
+            bool: True if the board acknowledged the command.
+        '''
+        return self.advanced_command.execute(command, arg)
+
+    def reset(self):
+        return self.send_advanced_command(self.ADV_CMD_RST)
+
+    def disable_input(self):
+        return self.send_advanced_command(self.ADV_CMD_VBUS_EN, 0)
 
     def enable_input(self):
-        time_out = 5 # seconds
-        st = time.time()
-        while time.time() - st < time_out:
-            self.i2c.write_block_data(self.ADV_CMD_START, [self.ADV_CMD_VBUS_EN, 1, self.ADV_CMD_END])
-            status = self.i2c.read_byte()
-            if status == self.ADV_CMD_OK:
-                return True
-            # !!! Don't add delay, otherwise status maybe error casued multiple process read data at the same time !!!
-        else:
-            return False
+        return self.send_advanced_command(self.ADV_CMD_VBUS_EN, 1)
+
+    def disable_battery(self):
+        return self.send_advanced_command(self.ADV_CMD_BAT_EN, 0)
+
+    def enable_battery(self):
+        return self.send_advanced_command(self.ADV_CMD_BAT_EN, 1)
+
+    def disable_output(self):
+        return self.send_advanced_command(self.ADV_CMD_OUPUT_EN, 0)
+
+    def enable_output(self):
+        return self.send_advanced_command(self.ADV_CMD_OUPUT_EN, 1)
+
+    def enter_iap(self):
+        return self.send_advanced_command(self.ADV_CMD_ENTER_IAP)
 
     def power_failure_simulation(self, test_time):
         import signal, os
@@ -313,10 +729,83 @@ class PiPower5(SPC):
         Returns:
             ButtonState: Power button state.
         '''
-        val = self.i2c.read_byte_data(self.REG_PWR_BTN_STATE)
-        self.i2c.write_byte_data(self.REG_WRITE_POWER_BTN_STATE, 0) # reset state
+        with self.bus_lock:
+            val = self._read_field('power_btn')
+            self.i2c.write_byte_data(self.REG_WRITE_POWER_BTN_STATE, 0) # reset state
+
+        return val
+
+    def read_snapshot(self):
+        '''
+        Read every register the service needs in as few block reads as
+        possible, and clear the button latch in the same pass.
+
+        Each call is a poll tick and refills the bus retry budget. Fields of
+        blocks that fail to read or decode keep their last value and are
+        listed as stale.
+
+        Returns:
+            PowerSample: The same record on every call, refilled, with the
+                SNAPSHOT_FIELDS and stale, the list of stale field names.
+                Fields never read are None.
+        '''
+        self.i2c.new_tick()
+        sample = self.snapshot
+        sample.stamp()
+        stale = sample.stale
+        stale.clear()
+        circuit_open = False
+        with self.bus_lock:
+            for decoder in self._get_blocks(self.SNAPSHOT_FIELDS):
+                if circuit_open:
+                    # No point trying the other blocks
+                    stale.extend(decoder.names)
+                    continue
+                try:
+                    self._read_block(decoder, sample)
+                    if 'power_btn' in decoder.names:
+                        sample.power_btn = self._clear_power_btn(sample.power_btn)
+                except ConnectionError:
+                    circuit_open = True
+                    stale.extend(decoder.names)
+                except (OSError, ValueError):
+                    # ValueError is a value the decoder doesn't know, like a
+                    # button state of newer firmware, the block counts as stale
+                    stale.extend(decoder.names)
+        if 'power_btn' in stale and sample.power_btn is not None:
+            # A press seen on an earlier tick must not be reported again
+            sample.power_btn = ButtonState.RELEASED
+        # The snapshot is fresh, refresh the cached settings it covers
+        for name in ['default_on', 'shutdown_percentage', 'max_charge_current']:
+            if name not in stale:
+                self.cache.put(name, getattr(sample, name))
+        return sample
+
+    def get_stale_snapshot(self):
+        '''
+        Get the last snapshot with every field listed as stale, for a tick
+        whose read failed altogether.
 
-        return ButtonState(val)
+        Returns:
+            PowerSample: The read_snapshot record, restamped.
+        '''
+        sample = self.snapshot
+        sample.stamp()
+        sample.stale.clear()
+        sample.stale.extend(self.SNAPSHOT_FIELDS)
+        if sample.power_btn is not None:
+            sample.power_btn = ButtonState.RELEASED
+        return sample
+
+    def _clear_power_btn(self, state):
+        if state == ButtonState.RELEASED:
+            return state
+        try:
+            self.i2c.write_byte_data(self.REG_WRITE_POWER_BTN_STATE, 0) # reset state
+        except OSError:
+            # The latch stays and is read again next tick, report it once cleared
+            return ButtonState.RELEASED
+        return state
 
     def read_shutdown_request(self):
         '''
@@ -325,8 +814,7 @@ class PiPower5(SPC):
         Returns:
             ShutdownRequest: Shutdown request.
         '''
-        val = super().read_shutdown_request()
-        return ShutdownRequest(val)
+        return self._read_field('shutdown_request')
 
     def _buzz_action(self, action):
         if action in self.PAUSE_ACTIONS:
@@ -346,34 +834,6 @@ class PiPower5(SPC):
         else:
             raise ValueError(f"Invalid action: {action}")
 
-    def _buzz_sequence(self, sequence):
-        '''
-        Buzz according to the sequence, every value is a list of [action, duration]
-        Actions:
-        - Tone note string like 'C5', 'D3', 'C#1'
-        - Frequency integer like 440, 880
-        - Pause string like 'pause', 'PAUSE', 'Pause', 'P', 'p', 'stop', 'STOP'
-        Duration:
-        - Integer like 1000, 2000 in milisecond
-
-        Args:
-            sequence (list): A list of [action, duration]
-        '''
-        for action, duration in sequence:
-            self._buzz_action(action)
-            time.sleep(duration / 1000)
-        self.write_buzzer_freq(0)
-
-    def _buzz_sequence_loop(self):
-        while True:
-            if len(self.buzzer_sequence_queue) > 0:
-                sequence = self.buzzer_sequence_queue.pop(0)
-                self._buzz_sequence(sequence)
-                time.sleep(1)
-            else:
-                break
-        self.buzzer_thread = None
-
     def buzz_sequence(self, sequence: [str,list]):
         '''
         Buzz according to the sequence, every value is a list of [action, duration]
@@ -391,8 +851,22 @@ class PiPower5(SPC):
             sequence = [item.split(',') for item in sequence.split(':')]
             sequence = [[action.strip(), int(duration.strip())] for action, duration in sequence]
 
-        self.buzzer_sequence_queue.append(sequence)
-        if self.buzzer_thread is None or not self.buzzer_thread.is_alive():
-            self.buzzer_thread = threading.Thread(target=self._buzz_sequence_loop)
-            self.buzzer_thread.start()
+        self.buzzer.put(sequence)
+
+    def close(self):
+        '''
+        Stop the buzzer player and release the bus lock file.
+        '''
+        self.buzzer.stop()
+        if self.owns_bus_lock:
+            self.bus_lock.close()
+
+    def get_buzzer_stats(self):
+        '''
+        Get buzzer player stats.
+
+        Returns:
+            dict: See BuzzerPlayer.get_stats.
+        '''
+        return self.buzzer.get_stats()
         
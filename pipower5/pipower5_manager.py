@@ -1,10 +1,15 @@
 import os
 import json
+import time
 import signal
+import threading
 from importlib.resources import files as resource_files
 
 from .pipower5_service import PiPower5Service
 from .pipower5_system import PiPower5System
+from .config_watcher import ConfigWatcher
+from .watchdog import Watchdog
+from .runtime import Runtime
 
 from .logger import Logger
 from .utils import log_error, get_varient_id_and_version
@@ -16,6 +21,7 @@ CONFIG_PATH = str(resource_files(__package_name__).joinpath('config.json'))
 _, BOARD_VERSION = get_varient_id_and_version()
 
 DEFAULT_DEBUG_LEVEL = 'INFO' # 'DEBUG' | 'INFO' | 'WARNING' | 'ERROR' | 'CRITICAL'
+STATS_INTERVAL = 10 # seconds the stats in read_data are reused
 
 class PiPower5Manager():
 
@@ -47,8 +53,19 @@ class PiPower5Manager():
         }
 
         self.pm_dashboard = None
+        self.system = None
         self.service = None
+        self.runtime = None
         self.data = {}
+        # data is updated by the service and system, and read by the dashboard
+        self.data_lock = threading.Lock()
+        # Applies config file changes, like from the pipower5 CLI, without a restart
+        self.config_watcher = ConfigWatcher(self.config_path, self.reload_config, log=self.log)
+        # Restarts stalled loops, and feeds the systemd watchdog while they run
+        self.watchdog = Watchdog(log=self.log)
+        # Stats served with the data, rebuilt at most every STATS_INTERVAL
+        self.stats = None
+        self.stats_time = 0
 
     def init_service(self):
         # --- import ---
@@ -81,6 +98,11 @@ class PiPower5Manager():
         if has_pm_dashboard:
             self.log.info(f"PM_Dashboard version: {pm_dashboard_version}")
 
+        # --- init runtime ---
+        # One event loop for the service and system instead of a loop and thread each
+        if self.config['system'].get('shared_event_loop', False):
+            self.runtime = Runtime(log=self.log)
+
         # --- init system ---
         self.system = PiPower5System(peripherals=PERIPHERALS, log=self.log)
         self.system.set_on_data_changed(self.handle_data_changed)
@@ -92,6 +114,10 @@ class PiPower5Manager():
         self.service.set_on_button_shutdown(self.system.shutdown)
         self.service.set_on_battery_critical_shutdown(self.system.shutdown)
         self.service.set_on_battery_voltage_critical_shutdown(self.system.shutdown)
+        # Pre-shutdown hooks run concurrently, within a share of the remaining runtime
+        self.system.set_remaining_runtime(self.service.get_remaining_runtime)
+        self.system.add_shutdown_hook('email', self.service.flush_email, deadline=20)
+        self.system.add_shutdown_hook('buzzer', self.service.drain_buzzer, deadline=5)
 
         # --- init pm_dashboard ---
         if not has_pm_dashboard:
@@ -109,10 +135,35 @@ class PiPower5Manager():
             self.pm_dashboard.set_test_smtp(self.service.test_smtp)
             self.pm_dashboard.set_on_restart_service(self.restart_service)
             self.pm_dashboard.set_play_pipower5_buzzer(self.play_pipower5_buzzer)
+            # Stopping the dashboard flushes its database
+            self.system.add_shutdown_hook('dashboard', lambda reason: self.pm_dashboard.stop(), deadline=10)
 
     @log_error
     def read_data(self):
-        return self.data
+        with self.data_lock:
+            data = dict(self.data)
+        # Too big to rebuild on every poll of the data
+        now = time.monotonic()
+        if self.stats is None or now - self.stats_time >= STATS_INTERVAL:
+            self.stats = self.get_stats()
+            self.stats_time = now
+        data['stats'] = self.stats
+        return data
+
+    @log_error
+    def get_stats(self):
+        '''
+        Get the daemon stats, served under the stats key of read_data.
+
+        Returns:
+            dict: runtime, see get_runtime_stats, bus_stats, see
+                PiPower5Service.get_bus_stats, and watchdog, see Watchdog.get_stats.
+        '''
+        stats = {'runtime': self.get_runtime_stats()}
+        if self.service:
+            stats['bus_stats'] = self.service.get_bus_stats()
+        stats['watchdog'] = self.watchdog.get_stats()
+        return stats
 
     @log_error
     def read_config(self):
@@ -122,10 +173,33 @@ class PiPower5Manager():
     def handle_data_changed(self, data, delete_keys=[]) -> None:
         if len(delete_keys) != 0:
             self.log.debug(f"Delete keys: {delete_keys}")
-        for key in delete_keys:
-            if key in self.data:
-                del self.data[key]
-        self.data.update(data)
+        with self.data_lock:
+            for key in delete_keys:
+                if key in self.data:
+                    del self.data[key]
+            self.data.update(data)
+
+    @log_error
+    def get_runtime_stats(self):
+        '''
+        Get the CPU time of the service and system loops, to compare running
+        them on a shared event loop or on a loop and thread each.
+
+        Returns:
+            dict: mode, 'shared' or 'threads', process CPU time in seconds,
+                thread count, and CPU stats by loop, see TaskCpu.
+        '''
+        tasks = {}
+        if self.system:
+            tasks['system'] = self.system.get_cpu_stats()
+        if self.service:
+            tasks['service'] = self.service.get_cpu_stats()
+        return {
+            'mode': 'shared' if self.runtime else 'threads',
+            'process_cpu': round(time.process_time(), 3),
+            'threads': threading.active_count(),
+            'tasks': tasks,
+        }
 
     @log_error
     def play_pipower5_buzzer(self, event):
@@ -170,33 +244,73 @@ class PiPower5Manager():
             json.dump(self.config, f, indent=4)
         return self.config
 
+    @log_error
+    def reload_config(self, seen_at=None):
+        '''
+        Apply the system config keys changed in the config file.
+
+        Args:
+            seen_at (float, optional): Monotonic time the change was seen.
+        '''
+        try:
+            with open(self.config_path, 'r') as f:
+                config = json.load(f)
+            written_at = os.stat(self.config_path).st_mtime
+        except (OSError, ValueError) as e:
+            self.log.warning(f"Failed to reload config: {e}")
+            return
+        changed = {key: value for key, value in config.get('system', {}).items()
+                   if self.config['system'].get(key) != value}
+        if len(changed) == 0:
+            # Like our own write in update_config
+            return
+        before = dict(self.config['system'])
+        self.update_config({'system': dict(changed)})
+        applied = [key for key in changed if self.config['system'].get(key) != before.get(key)]
+        ignored = [key for key in changed if key not in applied]
+        latency = time.time() - written_at
+        apply_time = time.monotonic() - seen_at if seen_at is not None else 0
+        self.log.info(f"Config reloaded {latency * 1000:.0f} ms after the write ({apply_time * 1000:.0f} ms to apply), applied: {', '.join(applied) or 'none'}")
+        if len(ignored) > 0:
+            self.log.debug(f"Config keys not applied: {', '.join(ignored)}")
+
     @log_error
     def start(self):
         self.init_service()
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
         signal.signal(signal.SIGABRT, self.signal_handler)
-        self.system.start()
-        self.service.start()
+        if self.runtime:
+            self.runtime.start()
+        self.system.start(runtime=self.runtime)
+        self.service.start(runtime=self.runtime)
         if self.pm_dashboard:
             self.pm_dashboard.start()
             self.log.info('PmDashboard started')
+        self.config_watcher.start()
+        self.watchdog.watch('system', self.system)
+        self.watchdog.watch('service', self.service, deadline=self.service.get_watchdog_deadline)
+        self.watchdog.start()
         while True:
             signal.pause()
 
     @log_error
     def stop(self):
         self.log.debug('Stopping PiPower5...')
+        self.watchdog.stop()
+        self.config_watcher.stop()
         if self.system:
             self.system.stop()
             self.log.debug('Stop PiPower5 system.')
         if self.service:
             self.service.stop()
             self.log.debug('Stop PiPower5 service.')
+        if self.runtime:
+            self.runtime.stop()
+            self.log.debug('Stop shared event loop.')
         if self.pm_dashboard:
             self.log.debug('Stop PM Dashboard.')
             self.pm_dashboard.stop()
-        import threading
         for t in threading.enumerate():
             if t is not threading.main_thread():
                 self.log.warning(f"Thread {t.name} is still alive")
@@ -1,13 +1,43 @@
 import asyncio
 import logging
+from enum import StrEnum
 from .pipower5 import PiPower5, ButtonState, ShutdownRequest, Event, PowerSource
+from .async_pipower5 import AsyncPiPower5
 from .utils import log_error
 from .email_sender import EmailSender
+from .email_outbox import EmailOutbox
+from .event_bus import EventBus, UNBOUNDED
 from .battery_device import BatteryDevice
-from .lazy_caller import LazyCaller
-from .debounce import Debounce
+from .battery_estimator import BatteryEstimator
+from .state_machine import StateMachine, Region, State, Transition, ANY
+from .interrupt import InterruptSource
+from .metrics import Histogram
+from .adaptive_interval import AdaptiveInterval
+from .instrumented_bus import get_stats_path
+from .power_sample import REGISTER_FIELDS
+from .power_loss_hooks import PowerLossHooks
+from .runtime import TaskCpu, timed, count_task_cpu
+from .watchdog import DEFAULT_DEADLINE as WATCHDOG_DEFAULT_DEADLINE
+from .burst_capture import BurstCapture, save_capture, BURST_DIR, DEFAULT_PERIOD as BURST_DEFAULT_PERIOD
 import threading
 import math
+import time
+import json
+import os
+
+BURST_ATTACH_TIMEOUT = 60 # seconds a capture is attached to the email of its event
+STATS_DUMP_INTERVAL = 10 # seconds between bus stats dumps for the CLI
+WATCHDOG_POLLS = 3 # polls at the max interval missed before the loop counts as stalled
+
+class Topic(StrEnum):
+    # Event bus topics besides the Event values
+    DATA_CHANGED = 'data_changed'
+    CONFIG_CHANGED = 'config_changed'
+    BUTTON_CLICK = 'button_click'
+    BUTTON_DOUBLE_CLICK = 'button_double_click'
+    BUTTON_LONG_PRESS = 'button_long_press'
+    BUTTON_LONG_PRESS_RELEASED = 'button_long_press_released'
+    BUTTON_SHUTDOWN = 'button_shutdown'
 
 class PiPower5Service():
     @log_error
@@ -15,193 +45,353 @@ class PiPower5Service():
         self.device_name = device_name
         self._is_ready = False
         self.log = log or logging.getLogger(__name__)
+        # Poll interval follows the power state, see AdaptiveInterval
+        self.adaptive_interval = AdaptiveInterval()
+        self.burst_capture = None
+        self.burst_enabled = False
+        self.burst_period = BURST_DEFAULT_PERIOD
+        self.burst_thresholds = {}
+        self.burst_dir = BURST_DIR
         self.update_config(config, init=True)
         
         self.pipower5 = PiPower5()
+        # Bus I/O of the main loop runs on its own thread, off the event loop
+        self.board = AsyncPiPower5(self.pipower5, log=self.log)
         try:
             self.email_sender = EmailSender(config, log=self.log)
         except Exception as e:
             self.log.warning(f'Email sender init failed: {e}')
             self.email_sender = None
-
-        self.device = BatteryDevice(log=self.log)
+        # Emails go out from a worker thread, SMTP never blocks the loop
+        self.outbox = EmailOutbox(self.email_sender, log=self.log) if self.email_sender else None
+
+        # Smoothed battery current, for the estimated times of both the data and the battery device
+        self.estimator = BatteryEstimator(self.pipower5.BAT_MAX_CAPACITY)
+        self.battery_percentage = None
+        self.device = BatteryDevice(log=self.log, simulated=self.pipower5.is_simulated, estimator=self.estimator)
+
+        # High rate capture around power events, off by default as it keeps the bus busy
+        self.burst_capture = BurstCapture(self.pipower5,
+                                          period=self.burst_period,
+                                          thresholds=self.burst_thresholds,
+                                          log=self.log)
+        # Event emails sent before their capture was complete, by event,
+        # followed up with the capture attached
+        self.burst_followups = {}
+        self.last_burst = None
+        self.last_is_input_plugged_in = None
+        # Fired on the first unplugged reading, before the power disconnected event
+        self.power_loss_hooks = PowerLossHooks(log=self.log)
 
         self.interval = 1
         self.task = None
         self.running = False
         self.loop = None
         self.loop_thread = None
-
-        self.last_shutdown_request = None
-
-        self.__on_user_config_changed__ = None
-        self.__on_user_button_click__ = None
-        self.__on_user_button_double_click__ = None
-        self.__on_user_button_long_press__ = None
-        self.__on_user_button_long_press_released__ = None
-        self.__on_user_battery_critical_shutdown__ = None
-        self.__on_user_button_shutdown__ = None
-        self.__on_user_battery_critical_shutdown__ = None
-        self.__on_user_low_battery__ = None
-        self.__on_user_power_insufficient__ = None
-        self.__on_user_battery_activated__ = None
-        self.__on_user_power_restore__ = None
-        self.__on_user_power_disconnected__ = None
-        self.__on_data_changed__ = None
-
-        self.on_low_battery = LazyCaller(self._on_low_battery, interval=10*60) # 10 minutes
-        self.on_power_insufficient = LazyCaller(self._on_power_insufficient, interval=10*60) # 10 minutes
-        self.on_battery_critical_shutdown = LazyCaller(self._on_battery_critical_shutdown, interval=10*60) # 10 minutes
-        self.on_battery_voltage_critical_shutdown = LazyCaller(self._on_battery_voltage_critical_shutdown, interval=10*60) # 10 minutes
-        self.on_power_restore = LazyCaller(self._on_power_restore, oneshot=True)
-        self.on_power_disconnected = LazyCaller(self._on_power_disconnected, oneshot=True)
-        self.on_battery_activated = LazyCaller(self._on_battery_activated, oneshot=True)
-
-        self.is_input_plugged_in_debounced = Debounce(timeout=1)
-        self.is_power_insufficient_debounced = Debounce(timeout=3)
-        self.is_battery_activated_debounced = Debounce(timeout=3)
+        # Shared event loop, see Runtime, None when the service runs its own
+        self.runtime = None
+        self.cpu = TaskCpu('service')
+        # Monotonic time of the last tick, see Watchdog
+        self.last_beat = None
+        self.restarts = 0
+
+        self.last_stats_dump = 0
+
+        # Optional interrupt line, wakes the loop right away on button and input
+        # changes, polling stays as fallback
+        self.interrupt = InterruptSource(pin=config.get('pipower5_interrupt_pin', None),
+                                         simulator=self.pipower5.simulator,
+                                         log=self.log)
+        self.interrupt_enabled = False
+        self.wake = None
+        self.last_edge_time = None
+        self.latest_edge_time = None
+        self.last_sample_time = 0
+        self.edge_recheck = None
+        self.edge_latency = Histogram()
+
+        # Callbacks subscribe to topics, handlers run off the polling loop
+        self.bus = EventBus(log=self.log)
+
+        self.bus_degraded = False
+        self.events = StateMachine(self._build_event_regions(), log=self.log)
 
         self._is_ready = True
 
+    def _build_event_regions(self):
+        '''
+        Power event table, regions are updated in this order every tick.
+        A new event is a new region here, the loop doesn't change.
+
+        Returns:
+            list: List of Region.
+        '''
+        plugged = lambda data: data['is_input_plugged_in']
+        on_battery = lambda data: data['power_source'] == PowerSource.BATTERY
+        insufficient = lambda data: self.events.state('power') == 'plugged' and self.events.state('battery') == 'activated'
+        low_battery = lambda data: data['battery_percentage'] < data['shutdown_percentage']
+        # Hysteresis, low battery clears 5% above the shutdown percentage
+        battery_ok = lambda data: data['battery_percentage'] > data['shutdown_percentage'] + 5
+        degraded = lambda data: data['bus_degraded']
+
+        def shutdown_request(request):
+            return lambda data: data['shutdown_request'] == request
+
+        return [
+            Region('bus', [
+                State('healthy'),
+                State('degraded', self._on_bus_degraded),
+            ], [
+                Transition(None, 'degraded', degraded),
+                Transition(None, 'healthy', lambda data: not degraded(data)),
+                Transition('healthy', 'degraded', degraded),
+                Transition('degraded', 'healthy', lambda data: not degraded(data), action=self._on_bus_recovered),
+            ]),
+            Region('power', [
+                State('plugged', self._on_power_restore),
+                State('unplugged', self._on_power_disconnected),
+            ], [
+                Transition(None, 'plugged', plugged),
+                Transition(None, 'unplugged', lambda data: not plugged(data)),
+                Transition('unplugged', 'plugged', plugged, hold=1),
+                Transition('plugged', 'unplugged', lambda data: not plugged(data), hold=1),
+            ]),
+            Region('battery', [
+                State('standby'),
+                State('activated', self._on_battery_activated),
+            ], [
+                Transition(None, 'activated', on_battery),
+                Transition(None, 'standby', lambda data: not on_battery(data)),
+                Transition('standby', 'activated', on_battery, hold=3),
+                Transition('activated', 'standby', lambda data: not on_battery(data), hold=3),
+            ]),
+            Region('power_insufficient', [
+                State('ok'),
+                State('insufficient', self._on_power_insufficient, repeat=10*60), # 10 minutes
+            ], [
+                Transition(None, 'insufficient', insufficient),
+                Transition(None, 'ok', lambda data: not insufficient(data)),
+                Transition('ok', 'insufficient', insufficient, hold=3),
+                Transition('insufficient', 'ok', lambda data: not insufficient(data), hold=3),
+            ]),
+            Region('low_battery', [
+                State('ok'),
+                State('low', self._on_low_battery, repeat=10*60), # 10 minutes
+            ], [
+                Transition(None, 'low', low_battery),
+                Transition(None, 'ok', lambda data: not low_battery(data)),
+                Transition('ok', 'low', low_battery),
+                Transition('low', 'ok', battery_ok),
+            ]),
+            Region('shutdown_request', [
+                State('none'),
+                State('button', self._on_button_shutdown),
+                State('low_battery', self._on_battery_critical_shutdown),
+                State('low_voltage', self._on_battery_voltage_critical_shutdown),
+            ], [
+                Transition(None, 'none', shutdown_request(ShutdownRequest.NONE)),
+                Transition(None, 'button', shutdown_request(ShutdownRequest.BUTTON)),
+                Transition(None, 'low_battery', shutdown_request(ShutdownRequest.LOW_BATTERY)),
+                Transition(None, 'low_voltage', shutdown_request(ShutdownRequest.LOW_VOLTAGE)),
+                Transition(ANY, 'none', shutdown_request(ShutdownRequest.NONE)),
+                Transition(ANY, 'button', shutdown_request(ShutdownRequest.BUTTON)),
+                Transition(ANY, 'low_battery', shutdown_request(ShutdownRequest.LOW_BATTERY)),
+                Transition(ANY, 'low_voltage', shutdown_request(ShutdownRequest.LOW_VOLTAGE)),
+            ]),
+        ]
+
+    @log_error
+    def subscribe(self, topic, callback, max_queue=None):
+        '''
+        Subscribe a callback to a topic, see Topic and Event. A topic takes
+        many callbacks, each is called in order off the polling loop, may be
+        a coroutine function, and drops its oldest messages when it lags.
+
+        Args:
+            topic (str): Topic.
+            callback (function): Callback function.
+            max_queue (int, optional): Max queued messages, see EventBus.
+
+        Returns:
+            Subscriber: Subscription, see unsubscribe.
+        '''
+        if max_queue is None:
+            return self.bus.subscribe(topic, callback)
+        return self.bus.subscribe(topic, callback, max_queue)
+
+    @log_error
+    def unsubscribe(self, subscriber):
+        self.bus.unsubscribe(subscriber)
+
     @log_error
     def set_on_config_changed(self, callback):
         '''
-        Set callback for config changed.
+        Add callback for config changed.
 
         Args:
             callback (function): Callback function.
         '''
-        self.__on_user_config_changed__ = callback
+        self.subscribe(Topic.CONFIG_CHANGED, callback)
 
     @log_error
     def set_on_button_click(self, callback):
         '''
-        Set callback for button click.
+        Add callback for button click.
 
         Args:
             callback (function): Callback function.
         '''
-        self.__on_user_button_click__ = callback
+        self.subscribe(Topic.BUTTON_CLICK, callback)
 
     @log_error
     def set_on_button_double_click(self, callback):
         '''
-        Set callback for button double click.
+        Add callback for button double click.
 
         Args:
             callback (function): Callback function.
         '''
-        self.__on_user_button_double_click__ = callback
+        self.subscribe(Topic.BUTTON_DOUBLE_CLICK, callback)
 
     @log_error
     def set_on_button_long_press(self, callback):
         '''
-        Set callback for button long press.
+        Add callback for button long press.
 
         Args:
             callback (function): Callback function.
         '''
-        self.__on_user_button_long_press__ = callback
+        self.subscribe(Topic.BUTTON_LONG_PRESS, callback)
 
     @log_error
     def set_on_button_long_press_released(self, callback):
         '''
-        Set callback for button long press released.
+        Add callback for button long press released.
 
         Args:
             callback (function): Callback function.
         '''
-        self.__on_user_button_long_press_released__ = callback
+        self.subscribe(Topic.BUTTON_LONG_PRESS_RELEASED, callback)
 
     @log_error
     def set_on_battery_critical_shutdown(self, callback):
         '''
-        Set callback for low battery shutdown
+        Add callback for low battery shutdown
 
         Args:
             callback (function): Callback function.
         '''
-        self.__on_user_battery_critical_shutdown__ = callback
+        self.subscribe(Event.BATTERY_CRITICAL_SHUTDOWN, callback, max_queue=UNBOUNDED)
 
     @log_error
     def set_on_button_shutdown(self, callback):
         '''
-        Set callback for button shutdown.
+        Add callback for button shutdown.
 
         Args:
             callback (function): Callback function.
         '''
-        self.__on_user_button_shutdown__ = callback
+        self.subscribe(Topic.BUTTON_SHUTDOWN, callback, max_queue=UNBOUNDED)
 
     @log_error
     def set_on_battery_voltage_critical_shutdown(self, callback):
         '''
-        Set callback for low voltage shutdown
+        Add callback for low voltage shutdown
 
         Args:
             callback (function): Callback function.
         '''
-        self.__on_user_battery_critical_shutdown__ = callback
+        self.subscribe(Event.BATTERY_VOLTAGE_CRITICAL_SHUTDOWN, callback, max_queue=UNBOUNDED)
 
     @log_error
     def set_on_low_battery(self, callback):
         '''
-        Set callback for low power.
+        Add callback for low power.
 
         Args:
             callback (function): Callback function.
         '''
-        self.__on_user_low_battery__ = callback
+        self.subscribe(Event.LOW_BATTERY, callback)
 
     @log_error
     def set_on_power_insufficient(self, callback):
         '''
-        Set callback for power insufficient.
+        Add callback for power insufficient.
 
         Args:
             callback (function): Callback function.
         '''
-        self.__on_user_power_insufficient__ = callback
+        self.subscribe(Event.POWER_INSUFFICIENT, callback)
 
     @log_error
     def set_on_battery_activated(self, callback):
         '''
-        Set callback for battery activated.
+        Add callback for battery activated.
 
         Args:
             callback (function): Callback function.
         '''
-        self.__on_user_battery_activated__ = callback
+        self.subscribe(Event.BATTERY_ACTIVATED, callback)
 
     @log_error
     def set_on_power_restore(self, callback):
         '''
-        Set callback for input plugged in.
+        Add callback for input plugged in.
 
         Args:
             callback (function): Callback function.
         '''
-        self.__on_user_power_restore__ = callback
+        self.subscribe(Event.POWER_RESTORED, callback)
 
     @log_error
     def set_on_power_disconnected(self, callback):
         '''
-        Set callback for input unplugged.
+        Add callback for input unplugged.
+
+        Args:
+            callback (function): Callback function.
+        '''
+        self.subscribe(Event.POWER_DISCONNECTED, callback)
+
+    @log_error
+    def add_power_loss_hook(self, name, on_loss, on_cancel=None):
+        '''
+        Add a fast path power loss hook, like syncing data or pausing writes.
+
+        on_loss runs on the first unplugged reading, right after the
+        interrupt edge when enabled, a second before the power disconnected
+        event. on_cancel runs if power comes back before that, see PowerLossHooks.
+
+        Args:
+            name (str): Hook name, a hook of the same name is replaced.
+            on_loss (function): Called with the monotonic time the loss was detected.
+            on_cancel (function, optional): Called with the monotonic time power came back.
+        '''
+        self.power_loss_hooks.add(name, on_loss, on_cancel)
+
+    @log_error
+    def remove_power_loss_hook(self, name):
+        self.power_loss_hooks.remove(name)
+
+    @log_error
+    def set_on_bus_degraded(self, callback):
+        '''
+        Add callback for bus degraded.
 
         Args:
             callback (function): Callback function.
         '''
-        self.__on_user_power_disconnected__ = callback
+        self.subscribe(Event.BUS_DEGRADED, callback)
 
     @log_error
     def set_on_data_changed(self, callback):
         '''
-        Set callback for data changed.
+        Add callback for data changed.
 
         Args:
             callback (function): Callback function.
         '''
-        self.__on_data_changed__ = callback
+        self.subscribe(Topic.DATA_CHANGED, callback)
 
     @log_error
     def update_config(self, config, init=False):
@@ -215,10 +405,21 @@ class PiPower5Service():
             A dict of config patch to update the config file.
         '''
         patch = {}
+        # Checked before anything is applied, invalid bounds are left out
+        poll_bounds = None
+        if 'pipower5_poll_interval_min' in config or 'pipower5_poll_interval_max' in config:
+            _min = config.get('pipower5_poll_interval_min', None)
+            _max = config.get('pipower5_poll_interval_max', None)
+            try:
+                self.adaptive_interval.check_bounds(_min, _max)
+                poll_bounds = (_min, _max)
+            except (TypeError, ValueError) as e:
+                self.log.warning(f'Invalid PiPower5 poll interval bounds, ignored: {e}')
+        # Board settings are applied together in one transaction
+        board_settings = {}
         if "shutdown_percentage" in config:
             _percentage = config['shutdown_percentage']
-            if not init:
-                self.pipower5.write_shutdown_percentage(_percentage)
+            board_settings['shutdown_percentage'] = _percentage
             patch['shutdown_percentage'] = _percentage
             self.log.debug(f'Set PiPower5 shutdown percentage: {_percentage}')
         if 'send_email_on' in config:
@@ -238,36 +439,92 @@ class PiPower5Service():
             self.log.debug(f'Set PiPower5 buzz sequence: {_buzz_sequence}')
         if 'pipower5_buzzer_volume' in config:
             _buzzer_volume = config['pipower5_buzzer_volume']
-            if not init:
-                self.pipower5.write_buzzer_volume(_buzzer_volume)
+            board_settings['buzzer_volume'] = _buzzer_volume
             self.buzzer_volume = _buzzer_volume
             patch['pipower5_buzzer_volume'] = _buzzer_volume
             self.log.debug(f'Set PiPower5 buzzer volume: {_buzzer_volume}')
+        if poll_bounds is not None:
+            _min, _max = poll_bounds
+            self.adaptive_interval.set_bounds(_min, _max)
+            if _min is not None:
+                patch['pipower5_poll_interval_min'] = _min
+            if _max is not None:
+                patch['pipower5_poll_interval_max'] = _max
+            self.log.debug(f'Set PiPower5 poll interval bounds: {self.adaptive_interval.min_interval} - {self.adaptive_interval.max_interval}')
+        if 'pipower5_burst_capture' in config:
+            _enabled = config['pipower5_burst_capture']
+            self.burst_enabled = _enabled
+            patch['pipower5_burst_capture'] = _enabled
+            self.log.debug(f'Set PiPower5 burst capture: {_enabled}')
+        if 'pipower5_burst_period' in config:
+            _period = config['pipower5_burst_period']
+            self.burst_period = _period
+            patch['pipower5_burst_period'] = _period
+            self.log.debug(f'Set PiPower5 burst period: {_period}')
+        if 'pipower5_burst_thresholds' in config:
+            _thresholds = config['pipower5_burst_thresholds']
+            self.burst_thresholds = _thresholds
+            patch['pipower5_burst_thresholds'] = _thresholds
+            self.log.debug(f'Set PiPower5 burst thresholds: {_thresholds}')
+        if 'pipower5_burst_dir' in config:
+            _dir = config['pipower5_burst_dir']
+            self.burst_dir = _dir
+            patch['pipower5_burst_dir'] = _dir
+            self.log.debug(f'Set PiPower5 burst dir: {_dir}')
+        if not init and self.burst_capture is not None:
+            self.burst_capture.period = self.burst_period
+            self.burst_capture.set_thresholds(self.burst_thresholds)
+            if self.running:
+                if self.burst_enabled:
+                    self.burst_capture.start(self._on_burst_captured)
+                else:
+                    self.burst_capture.stop()
+        if not init and len(board_settings) > 0:
+            # Written and verified on the bus thread, callers don't wait for it
+            try:
+                self.board.submit(self._apply_board_settings, board_settings)
+            except RuntimeError:
+                # Bus executor and board closed with the service
+                self.log.warning(f'PiPower5 service stopped, board settings not written: {board_settings}')
         if not init and self.email_sender:
             email_patch = self.email_sender.update_config(config)
             patch.update(email_patch)
+            if len(email_patch) > 0:
+                self.outbox.reset_connection()
         return patch
 
+    @log_error
+    def _apply_board_settings(self, settings):
+        result = self.pipower5.apply_settings(settings)
+        for name, (old, new) in result['changed'].items():
+            self.log.debug(f'PiPower5 {name} changed: {old} -> {new}')
+        for name, (wanted, actual) in result['failed'].items():
+            self.log.warning(f'Failed to set PiPower5 {name} to {wanted}, board reports {actual}')
+
     @log_error
     def is_ready(self):
         return self._is_ready
 
     @log_error
-    def send_email(self, event, data):
+    def send_email(self, event, data, attachment_path=None):
         if not self.email_sender:
             self.log.debug("Email sender not ready")
             return False
         if event not in self.send_email_on:
             self.log.debug(f"Event {event} not in send_email_on")
             return False
-        
-        status = self.email_sender.send_preset_email(event, data)
-        if status == True:
-            self.log.debug(f"Event {event} sent successfully")
-            return True
-        else:
-            self.log.warning(f"Failed to send event {event}: {status}")
-            return False
+        if attachment_path is None and self.last_burst is not None:
+            reason, path, captured_at = self.last_burst
+            if reason == event and time.monotonic() - captured_at < BURST_ATTACH_TIMEOUT:
+                attachment_path = path
+        if attachment_path is None and self.burst_capture.pending_reason == event:
+            # Sent right away, the capture follows once its window is complete
+            self.burst_followups[event] = (dict(data), time.monotonic())
+            self.log.debug(f"Event {event} email followed up with the burst capture")
+
+        self.outbox.put(event, data, attachment_path)
+        self.log.debug(f"Event {event} queued")
+        return True
 
     def buzz_event(self, event):
         if event in self.buzz_sequence:
@@ -280,6 +537,25 @@ class PiPower5Service():
 
         self.log.debug(f"Event {event} buzz sequence: {sequence}")
 
+    @log_error
+    def send_advanced_command(self, command, arg=0):
+        '''
+        Send an advanced command to PiPower5.
+
+        Args:
+            command (int): One of PiPower5.ADV_CMD_*.
+            arg (int, optional): Command argument. Defaults to 0.
+
+        Returns:
+            bool: True if the board acknowledged the command.
+        '''
+        result = self.pipower5.send_advanced_command(command, arg)
+        if result:
+            self.log.debug(f"Advanced command {command}({arg}) done")
+        else:
+            self.log.warning(f"Advanced command {command}({arg}) failed")
+        return result
+
     @log_error
     def test_smtp(self):
         '''
@@ -296,194 +572,470 @@ class PiPower5Service():
             return False, str(e)
 
     @log_error
-    def call(self, callback, data):
-        if callback:
-            callback(data)
+    def get_interrupt_stats(self):
+        '''
+        Get interrupt stats.
+
+        Returns:
+            dict: enabled, edges count and edge to callback latency histogram.
+        '''
+        return {
+            'enabled': self.interrupt_enabled,
+            'edges': self.interrupt.edges,
+            'edge_latency': self.edge_latency.to_dict(),
+        }
+
+    @log_error
+    def get_email_stats(self):
+        '''
+        Get email outbox stats.
+
+        Returns:
+            dict: See EmailOutbox.get_stats, None without email sender.
+        '''
+        return self.outbox.get_stats() if self.outbox else None
+
+    @log_error
+    def trigger_burst_capture(self, reason='manual'):
+        '''
+        Capture the voltages and currents around now.
+
+        Args:
+            reason (str, optional): Reason, part of the file name. Defaults to 'manual'.
+
+        Returns:
+            bool: True if a capture started.
+        '''
+        return self.burst_capture.trigger(reason)
+
+    @log_error
+    def get_burst_stats(self):
+        '''
+        Get burst capture stats.
+
+        Returns:
+            dict: See BurstCapture.get_stats, plus the last capture file.
+        '''
+        stats = self.burst_capture.get_stats()
+        stats['last_file'] = self.last_burst[1] if self.last_burst else None
+        return stats
+
+    @log_error
+    def get_event_stats(self):
+        '''
+        Get power event state machine stats.
+
+        Returns:
+            dict: See StateMachine.get_stats.
+        '''
+        return self.events.get_stats()
+
+    def get_remaining_runtime(self):
+        '''
+        Get the pessimistic remaining battery runtime, down to empty.
+
+        Returns:
+            float: Seconds, the low end of the estimate, inf when not discharging.
+        '''
+        if self.battery_percentage is None:
+            return math.inf
+        return self.estimator.time_to_empty(self.battery_percentage)[1] * 3600
+
+    def flush_email(self, reason=None):
+        '''
+        Pre-shutdown hook, send the queued emails, like the shutdown event email.
+
+        Raises:
+            TimeoutError: Emails are still queued.
+        '''
+        if self.outbox and not self.outbox.flush():
+            raise TimeoutError("Emails still queued")
+
+    def drain_buzzer(self, reason=None):
+        '''
+        Pre-shutdown hook, let the buzzer finish the queued sequences.
+
+        Raises:
+            TimeoutError: Sequences are still queued.
+        '''
+        if not self.pipower5.buzzer.drain():
+            raise TimeoutError("Buzzer sequences still queued")
+
+    @log_error
+    def get_power_loss_stats(self):
+        '''
+        Get fast path power loss hook stats.
+
+        Returns:
+            dict: See PowerLossHooks.get_stats.
+        '''
+        return self.power_loss_hooks.get_stats()
+
+    @log_error
+    def get_cpu_stats(self):
+        '''
+        Get the CPU time of the service loop, see TaskCpu.
+
+        Returns:
+            dict: Loop steps and CPU time, longest step, executor calls and CPU time.
+        '''
+        return self.cpu.to_dict()
+
+    @log_error
+    def get_bus_stats(self):
+        '''
+        Get bus usage stats.
+
+        Returns:
+            dict: i2c transaction stats per method and register, bus lock,
+                register cache, advanced command, interrupt, burst capture,
+                power event, email outbox, event bus subscriber, poll tick and
+                power loss hook stats.
+        '''
+        return {
+            'i2c': self.pipower5.get_bus_stats(),
+            'faults': self.pipower5.get_fault_stats(),
+            'bus_lock': self.pipower5.get_bus_lock_stats(),
+            'cache': self.pipower5.get_cache_stats(),
+            'advanced_command': self.pipower5.get_advanced_command_stats(),
+            'interrupt': self.get_interrupt_stats(),
+            'burst': self.get_burst_stats(),
+            'events': self.get_event_stats(),
+            'email': self.get_email_stats(),
+            'subscribers': self.bus.get_stats(),
+            'ticks': self.board.get_tick_stats(),
+            'power_loss': self.get_power_loss_stats(),
+        }
+
+    def dump_bus_stats(self, path=None):
+        '''
+        Write bus stats to a file, for the CLI to read.
+
+        Args:
+            path (str, optional): File path. Defaults to get_stats_path().
+        '''
+        path = path or get_stats_path()
+        stats = self.get_bus_stats()
+        stats['time'] = time.time()
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(stats, f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            self.log.debug(f"Failed to dump bus stats to {path}: {e}")
+
+    def _on_burst_captured(self, capture):
+        # Called from the sampler thread
+        self.loop.call_soon_threadsafe(self._handle_burst_capture, capture)
+
+    @log_error
+    def _handle_burst_capture(self, capture):
+        path = save_capture(capture, self.burst_dir)
+        self.last_burst = (capture['reason'], path, time.monotonic())
+        self.log.info(f"Burst capture saved: {path}")
+        followup = self.burst_followups.pop(capture['reason'], None)
+        if followup is not None:
+            data, sent_at = followup
+            if time.monotonic() - sent_at < BURST_ATTACH_TIMEOUT:
+                self.send_email(capture['reason'], data, path)
+
+    def _check_bus(self, stale):
+        if len(stale) > 0:
+            self.log.debug(f"Stale fields: {stale}")
+        self.bus_degraded = len(stale) > 0 or not self.pipower5.is_bus_healthy
+
+    def _on_interrupt(self, edge_time):
+        # Called from the GPIO thread
+        self.loop.call_soon_threadsafe(self._handle_edge, edge_time)
+
+    def _handle_edge(self, edge_time):
+        self.latest_edge_time = edge_time
+        if self.last_edge_time is None:
+            self.last_edge_time = edge_time
+        self.wake.set()
+
+    def _recheck_edge(self):
+        self.edge_recheck = None
+        self.wake.set()
+
+    def _observe_edge_latency(self):
+        if self.last_edge_time is not None:
+            self.edge_latency.observe(time.monotonic() - self.last_edge_time)
+            self.last_edge_time = None
 
     @log_error
     def _on_low_battery(self, data):
         self.log.info("Low Battery")
-        if self.__on_user_low_battery__:
-            self.__on_user_low_battery__("Low Battery")
+        self.bus.publish(Event.LOW_BATTERY, "Low Battery")
         self.send_email(Event.LOW_BATTERY, data)
         self.buzz_event(Event.LOW_BATTERY)
 
     @log_error
     def _on_power_insufficient(self, data):
         self.log.info("Power Insufficient")
-        if self.__on_user_power_insufficient__:
-            self.__on_user_power_insufficient__("Power Insufficient")
+        self.bus.publish(Event.POWER_INSUFFICIENT, "Power Insufficient")
         self.send_email(Event.POWER_INSUFFICIENT, data)
         self.buzz_event(Event.POWER_INSUFFICIENT)
 
     @log_error
     def _on_battery_critical_shutdown(self, data):
         self.log.info("Battery Critical Shutdown")
-        if self.__on_user_battery_critical_shutdown__:
-            self.__on_user_battery_critical_shutdown__("Battery Critical Shutdown")
+        self.bus.publish(Event.BATTERY_CRITICAL_SHUTDOWN, "Battery Critical Shutdown")
         self.send_email(Event.BATTERY_CRITICAL_SHUTDOWN, data)
         self.buzz_event(Event.BATTERY_CRITICAL_SHUTDOWN)
 
     @log_error
     def _on_battery_voltage_critical_shutdown(self, data):
         self.log.info("Battery Voltage Critical Shutdown")
-        if self.__on_user_battery_critical_shutdown__:
-            self.__on_user_battery_critical_shutdown__("Battery Voltage Critical Shutdown")
+        self.bus.publish(Event.BATTERY_VOLTAGE_CRITICAL_SHUTDOWN, "Battery Voltage Critical Shutdown")
         self.send_email(Event.BATTERY_VOLTAGE_CRITICAL_SHUTDOWN, data)
         self.buzz_event(Event.BATTERY_VOLTAGE_CRITICAL_SHUTDOWN)
 
     @log_error
     def _on_power_restore(self, data):
         self.log.info("Power Restore")
-        if self.__on_user_power_restore__:
-            self.__on_user_power_restore__("Power Restore")
+        self.bus.publish(Event.POWER_RESTORED, "Power Restore")
+        self._observe_edge_latency()
         self.send_email(Event.POWER_RESTORED, data)
         self.buzz_event(Event.POWER_RESTORED)
-        self.on_power_disconnected.reset()
 
     @log_error
     def _on_power_disconnected(self, data):
         self.log.info("Power Disconnected")
-        if self.__on_user_power_disconnected__:
-            self.__on_user_power_disconnected__("Power Disconnected")
+        self.power_loss_hooks.confirm()
+        self.bus.publish(Event.POWER_DISCONNECTED, "Power Disconnected")
+        self._observe_edge_latency()
         self.send_email(Event.POWER_DISCONNECTED, data)
         self.buzz_event(Event.POWER_DISCONNECTED)
-        self.on_power_insufficient.reset()
-        self.on_power_restore.reset()
+
+    @log_error
+    def _on_bus_degraded(self, data):
+        self.log.warning(f"Bus Degraded: {self.pipower5.get_fault_stats()}")
+        self.bus.publish(Event.BUS_DEGRADED, "Bus Degraded")
+        self.send_email(Event.BUS_DEGRADED, data)
+        self.buzz_event(Event.BUS_DEGRADED)
+
+    @log_error
+    def _on_bus_recovered(self, data):
+        self.log.info(f"Bus recovered: {self.pipower5.get_fault_stats()}")
+
+    @log_error
+    def _on_button_shutdown(self, data):
+        self.log.info("Shutdown request: Button")
+        self.bus.publish(Topic.BUTTON_SHUTDOWN, data.to_dict())
 
     @log_error
     def _on_battery_activated(self, data):
         self.log.info("Battery Activated")
-        if self.__on_user_battery_activated__:
-            self.__on_user_battery_activated__("Battery Activated")
+        self.bus.publish(Event.BATTERY_ACTIVATED, "Battery Activated")
         self.send_email(Event.BATTERY_ACTIVATED, data)
         self.buzz_event(Event.BATTERY_ACTIVATED)
 
     @log_error
     async def main(self):
+        self.bus.start(asyncio.get_running_loop())
         # Sync data with PiPower5
-        self.shutdown_percentage = self.pipower5.read_shutdown_percentage()
-        self.buzzer_volume = self.pipower5.read_buzzer_volume()
-        self.__on_user_config_changed__({
-            "system": {
-                "shutdown_percentage": self.shutdown_percentage,
-                "buzzer_volume": self.buzzer_volume
-            }
-        })
-
-        while self.running:
-            data = self.pipower5.read_all()
-            data['device_name'] = self.device_name
-            self.call(self.__on_data_changed__, data)
-            self.device.update_battery(data)
-
-            shutdown_percentage = self.pipower5.read_shutdown_percentage()
-            shutdown_request = self.pipower5.read_shutdown_request()
-            button_state = self.pipower5.read_power_btn()
-            is_input_plugged_in = self.is_input_plugged_in_debounced(data['is_input_plugged_in'])
-            is_battery_activated = data['power_source'] == PowerSource.BATTERY
-            is_battery_activated = self.is_battery_activated_debounced(is_battery_activated)
-            is_power_insufficient = is_input_plugged_in and is_battery_activated
-            is_power_insufficient = self.is_power_insufficient_debounced(is_power_insufficient)
-
-            battery_percentage = data['battery_percentage']
-            data['shutdown_percentage'] = shutdown_percentage
-
-            # Estimate time until shutdown
-            try:
-                remain_percentage = data['battery_percentage'] - shutdown_percentage
-                remain_mAh = self.pipower5.BAT_MAX_CAPACITY * remain_percentage / 100
-                current = -data['battery_current']
-                if current != 0:
-                    estimated_time = remain_mAh / current
-                    estimated_time = round(estimated_time, 2)
-                else:
-                    estimated_time = math.inf
-            except Exception as e:
-                self.log.error(f"Failed to estimate time until shutdown: {e}")
-                estimated_time = "Unknown"
-            data['battery_current_output'] = current
-            data['estimated_time'] = estimated_time
-
-            # Check button state
-            if button_state == ButtonState.CLICK:
-                self.log.debug(f'pipower5_button_click: {button_state}')
-                self.call(self.__on_user_button_click__, button_state)
-            elif button_state == ButtonState.DOUBLE_CLICK:
-                self.log.debug(f'pipower5_button_double_click: {button_state}')
-                self.call(self.__on_user_button_double_click__, button_state)
-            elif button_state == ButtonState.LONG_PRESS_2S:
-                self.log.debug(f'pipower5_button_long_press_2s: {button_state}')
-                self.call(self.__on_user_button_long_press__, button_state)
-            elif button_state == ButtonState.LONG_PRESS_2S_RELEASED:
-                self.log.debug(f'pipower5_button_long_press_2s_released: {button_state}')
-                self.call(self.__on_user_button_long_press_released__, button_state)
-
-            # Check low battery
-            if battery_percentage < shutdown_percentage:
-                self.on_low_battery(data)
-            elif battery_percentage > shutdown_percentage + 5:
-                self.on_low_battery.reset()
-
-            # Check shutdown request
-            if shutdown_request != self.last_shutdown_request:
-                if shutdown_request == ShutdownRequest.BUTTON:
-                    self.log.info("Shutdown request: Button")
-                    self.call(self.__on_user_button_shutdown__, data)
-                elif shutdown_request == ShutdownRequest.LOW_BATTERY:
-                    self.on_battery_critical_shutdown(data)
-                elif shutdown_request == ShutdownRequest.LOW_VOLTAGE:
-                    self.on_battery_voltage_critical_shutdown(data)
-                self.last_shutdown_request = shutdown_request
-
-            # Check power state
+        try:
+            self.shutdown_percentage = await self.board.read_shutdown_percentage()
+            self.buzzer_volume = await self.board.read_buzzer_volume()
+            self.bus.publish(Topic.CONFIG_CHANGED, {
+                "system": {
+                    "shutdown_percentage": self.shutdown_percentage,
+                    "buzzer_volume": self.buzzer_volume
+                }
+            })
+        except OSError as e:
+            self.log.warning(f"Failed to sync settings from PiPower5: {e}")
+
+        self.wake = asyncio.Event()
+        self.interrupt_enabled = self.interrupt.start(self._on_interrupt)
+        self.adaptive_interval.interrupt_enabled = self.interrupt_enabled
+        if self.interrupt_enabled:
+            self.log.info("Interrupt driven events enabled")
+        if self.burst_enabled:
+            self.burst_capture.start(self._on_burst_captured)
+        if self.outbox:
+            self.outbox.start()
+
+        self.last_beat = time.monotonic()
+        async for data in self.board.stream(lambda: self.interval, wake=self.wake):
+            if not self.running:
+                break
+            self._handle_data(data)
+            self.last_beat = time.monotonic()
+
+    @log_error
+    def _handle_data(self, data):
+        # data is the PowerSample of the tick, reused by the next one,
+        # consumers keeping values past the tick take a copy.
+        # A failed tick is logged by log_error and monitoring goes on
+        data.device_name = self.device_name
+        self._check_bus(data.stale)
+        data.bus_degraded = self.bus_degraded
+        if any(getattr(data, name) is None for name in REGISTER_FIELDS):
+            self.log.warning("No data read from PiPower5 yet, bus degraded")
+            self.events.update(data, regions=['bus'])
+            return
+        # Act on the raw input edge first, the power events settle a second later
+        is_input_plugged_in = data.is_input_plugged_in
+        if self.last_is_input_plugged_in is not None and is_input_plugged_in != self.last_is_input_plugged_in:
+            # From the edge when it came since the previous reading
+            detected_at = data.monotonic
+            if self.latest_edge_time is not None and self.latest_edge_time > self.last_sample_time:
+                detected_at = min(detected_at, self.latest_edge_time)
             if is_input_plugged_in:
-                self.on_power_restore(data)
+                self.power_loss_hooks.restored(detected_at)
             else:
-                self.on_power_disconnected(data)
-
-            # Check battery activated
-            if is_battery_activated:
-                self.on_battery_activated(data)
+                self.power_loss_hooks.lost(detected_at)
+        self.last_is_input_plugged_in = is_input_plugged_in
+        self.last_sample_time = data.monotonic
+
+        shutdown_request = data.shutdown_request
+        button_state = data.power_btn
+        self.interval = self.adaptive_interval.update(data, shutdown_request, button_state)
+        data.poll_state = str(self.adaptive_interval.state)
+        data.poll_interval = self.interval
+
+        # Estimate time until shutdown from the smoothed current
+        current = self.estimator.update(data.battery_current, data.monotonic)
+        self.battery_percentage = data.battery_percentage
+        estimated_time, low, high = self.estimator.time_to_empty(data.battery_percentage, data.shutdown_percentage)
+        data.battery_current_output = round(-current)
+        data.estimated_time = round(estimated_time, 2)
+        data.estimated_time_low = round(low, 2)
+        data.estimated_time_high = round(high, 2)
+        data.time_to_full = round(self.estimator.time_to_full(data.battery_percentage)[0], 2)
+
+        if self.bus.has_subscribers(Topic.DATA_CHANGED):
+            # Subscribers run after the record is refilled, give them a copy
+            self.bus.publish(Topic.DATA_CHANGED, data.to_dict())
+        self.device.update_battery(data)
+
+        # Check button state
+        if button_state == ButtonState.CLICK:
+            self.log.debug(f'pipower5_button_click: {button_state}')
+            self.bus.publish(Topic.BUTTON_CLICK, button_state)
+        elif button_state == ButtonState.DOUBLE_CLICK:
+            self.log.debug(f'pipower5_button_double_click: {button_state}')
+            self.bus.publish(Topic.BUTTON_DOUBLE_CLICK, button_state)
+        elif button_state == ButtonState.LONG_PRESS_2S:
+            self.log.debug(f'pipower5_button_long_press_2s: {button_state}')
+            self.bus.publish(Topic.BUTTON_LONG_PRESS, button_state)
+        elif button_state == ButtonState.LONG_PRESS_2S_RELEASED:
+            self.log.debug(f'pipower5_button_long_press_2s_released: {button_state}')
+            self.bus.publish(Topic.BUTTON_LONG_PRESS_RELEASED, button_state)
+        if button_state != ButtonState.RELEASED:
+            self._observe_edge_latency()
+
+        # Power events, see _build_event_regions
+        self.events.update(data)
+
+        if time.monotonic() - self.last_stats_dump >= STATS_DUMP_INTERVAL:
+            self.last_stats_dump = time.monotonic()
+            self.dump_bus_stats()
+
+        # After an edge, check again as soon as a pending transition can settle,
+        # drop edges that didn't lead to an event
+        if self.last_edge_time is not None:
+            deadline = self.events.next_deadline()
+            if deadline is not None:
+                if self.edge_recheck is None:
+                    delay = max(0, deadline - time.monotonic()) + 0.05
+                    self.edge_recheck = self.loop.call_later(delay, self._recheck_edge)
             else:
-                self.on_battery_activated.reset()
-
-            # Check power insufficient
-            if is_power_insufficient:
-                self.on_power_insufficient(data)
-
-            await asyncio.sleep(self.interval)
+                self.last_edge_time = None
 
     @log_error
-    def start(self):
+    def start(self, runtime=None):
+        '''
+        Start the service loop.
+
+        Args:
+            runtime (Runtime, optional): Shared event loop to run on. Defaults to
+                a loop and thread of its own.
+        '''
         if self.running:
             self.log.warning("Already running")
             return
         
         self.running = True
+        if runtime is not None:
+            self.runtime = runtime
+            self.loop = runtime.loop
+            self.loop_thread = runtime.loop_thread
+            self.loop.call_soon_threadsafe(self._start_loop_task)
+            self.log.info("PiPower5 service started on the shared event loop")
+            return
         # 创建新的事件循环
         self.loop = asyncio.new_event_loop()
+        count_task_cpu(self.loop)
         asyncio.set_event_loop(self.loop)
         # 在新线程中运行事件循环
-        self.loop_thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.loop_thread = threading.Thread(target=self._run_loop, args=(self.loop,), daemon=True)
         self.loop_thread.start()
         # 在事件循环中创建并运行任务
         self.loop.call_soon_threadsafe(self._start_loop_task)
         self.log.info("PiPower5 service started")
 
-    def _run_loop(self):
+    def _run_loop(self, loop):
         """在线程中运行事件循环"""
         try:
-            self.loop.run_forever()
+            loop.run_forever()
         except Exception as e:
             self.log.error(f"Event loop error: {e}")
         finally:
-            self.loop.close()
+            loop.close()
             self.log.info("Event loop closed")
 
+    def get_watchdog_deadline(self):
+        '''
+        Get the watchdog deadline of the main loop, it beats once a poll so
+        the deadline follows the configured max poll interval.
+
+        Returns:
+            float: Deadline in seconds.
+        '''
+        return max(WATCHDOG_DEFAULT_DEADLINE, WATCHDOG_POLLS * self.adaptive_interval.max_interval)
+
+    @log_error
+    def restart(self):
+        '''
+        Restart the main loop on a new event loop and thread, see Watchdog.
+
+        The stalled loop is asked to stop and left to its thread, it exits
+        whenever the blocking call returns. A stuck bus thread is replaced
+        the same way. On the shared event loop only the task is restarted,
+        a blocked shared loop is left to the systemd watchdog.
+        '''
+        if not self.running:
+            return
+        self.restarts += 1
+        self.log.warning(f"Restarting PiPower5 service loop ({self.restarts} restarts)")
+        old_loop, old_task = self.loop, self.task
+        # Subscriber tasks belong to the stalled loop, it cancels them itself
+        bus_tasks = self.bus.detach()
+        if old_task is not None and not old_loop.is_closed():
+            old_loop.call_soon_threadsafe(old_task.cancel)
+            for task in bus_tasks:
+                old_loop.call_soon_threadsafe(task.cancel)
+            if self.runtime is None:
+                old_loop.call_soon_threadsafe(old_loop.stop)
+        self.interrupt.close()
+        self.edge_recheck = None
+        self.board.reset_executor()
+        self.task = None
+        if self.runtime is not None:
+            self.loop.call_soon_threadsafe(self._start_loop_task)
+            return
+        self.loop = asyncio.new_event_loop()
+        count_task_cpu(self.loop)
+        self.loop_thread = threading.Thread(target=self._run_loop, args=(self.loop,), daemon=True)
+        self.loop_thread.start()
+        self.loop.call_soon_threadsafe(self._start_loop_task)
+
     def _start_loop_task(self):
         """在事件循环中创建并启动任务"""
-        self.task = self.loop.create_task(self.main())
+        self.task = self.loop.create_task(timed(self.main(), self.cpu))
 
     @log_error
     def stop(self):
@@ -493,18 +1045,27 @@ class PiPower5Service():
             
         self.running = False
         
-        # 如果任务已完成，直接返回
-        if self.task.done():
-            return
+        # A finished task, main ended by an error, still leaves the loop
+        # running and the board open
+        if not self.loop.is_closed():
+            # 取消任务
+            if not self.task.done():
+                self.loop.call_soon_threadsafe(self.task.cancel)
+            self.loop.call_soon_threadsafe(self.bus.stop)
+            # The shared event loop is stopped by its owner
+            if self.runtime is None:
+                # 停止事件循环
+                self.loop.call_soon_threadsafe(self.loop.stop)
             
-        # 取消任务
-        self.loop.call_soon_threadsafe(self.task.cancel)
-        
-        # 停止事件循环
-        self.loop.call_soon_threadsafe(self.loop.stop)
-        
         # 等待线程结束
-        if self.loop_thread and self.loop_thread.is_alive():
+        if self.runtime is None and self.loop_thread and self.loop_thread.is_alive():
             self.loop_thread.join(timeout=2.0)
-                
+
+        self.interrupt.close()
+        self.burst_capture.stop()
+        if self.outbox:
+            self.outbox.stop()
+        self.power_loss_hooks.close()
+        self.board.close()
+        self.pipower5.close()
         self.log.info("PiPower5 service stopped")
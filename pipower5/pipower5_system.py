@@ -15,17 +15,26 @@ from sf_rpi_status import \
     get_network_connection_type, \
     get_network_speed
 
+import os
 import time
 import asyncio
+import functools
 import threading
+from .runtime import TaskCpu, timed, count_task_cpu
+from .shutdown_orchestrator import ShutdownOrchestrator, DEFAULT_HOOK_DEADLINE
 from typing import Callable
 
+POWER_OFF_MARGIN = 10 # seconds past the hook budget before powering off regardless
+
 class TaskScheduler:
     """极简异步任务调度系统，通过回调暴露关键节点"""
     
     def __init__(self):
         self.scheduler = {}  # 存储所有任务
         self._stop_event = asyncio.Event()
+        # Coroutine function running sync tasks off the loop, like Runtime.run_blocking,
+        # None runs them on the loop
+        self.run_blocking = None
         self._callbacks = {
             "task_start": [],
             "task_complete": [],
@@ -49,6 +58,13 @@ class TaskScheduler:
         for callback in self._callbacks[event_type]:
             callback(task_id, **kwargs)
     
+    async def _call(self, func: Callable, *args, **kwargs):
+        if asyncio.iscoroutinefunction(func):
+            return await func(*args, **kwargs)
+        if self.run_blocking is not None:
+            return await self.run_blocking(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
     async def run_once(self, func: Callable, delay: float = 0, *args, **kwargs) -> str:
         """注册一次性任务"""
         task_id = f"once-{int(time.time()*1000)}-{len(self.scheduler)}"
@@ -58,10 +74,7 @@ class TaskScheduler:
             if not self._stop_event.is_set():
                 self._trigger_callback("task_start", task_id, task_type="once")
                 try:
-                    if asyncio.iscoroutinefunction(func):
-                        result = await func(*args, **kwargs)
-                    else:
-                        result = func(*args, **kwargs)
+                    result = await self._call(func, *args, **kwargs)
                     self._trigger_callback("task_complete", task_id, result=result)
                 except Exception as e:
                     self._trigger_callback("task_error", task_id, error=e)
@@ -83,10 +96,7 @@ class TaskScheduler:
                 start_time = time.time()
                 self._trigger_callback("task_start", task_id, task_type="periodic")
                 try:
-                    if asyncio.iscoroutinefunction(func):
-                        result = await func(*args, **kwargs)
-                    else:
-                        result = func(*args, **kwargs)
+                    result = await self._call(func, *args, **kwargs)
                     self._trigger_callback("task_complete", task_id, result=result, duration=time.time()-start_time)
                 except Exception as e:
                     self._trigger_callback("task_error", task_id, error=e, duration=time.time()-start_time)
@@ -124,14 +134,28 @@ class PiPower5System():
     def __init__(self, peripherals=None, log=None):
         self.peripherals = peripherals
         self.log = log
-        self.__before_shutdown__ = None
         self.__on_data_changed__ = None
+        # Pre-shutdown hooks, run concurrently before power off
+        self.shutdown_orchestrator = ShutdownOrchestrator(log=log)
+        self.shutdown_orchestrator.add_hook('sync_filesystems', self._sync_filesystems)
+        # True from a shutdown request until power off is called
+        self.shutting_down = False
+        self.shutdown_lock = threading.Lock()
+        self.shutdown_thread = None
+        self.shutdown_timer = None
+        self.shutdown_attempts = 0
         self.scheduler = TaskScheduler()
 
         self.task = None
         self.running = False
         self.loop = None
         self.loop_thread = None
+        # Shared event loop, see Runtime, None when the system runs its own
+        self.runtime = None
+        self.cpu = TaskCpu('system')
+        # Monotonic time the main loop last ran, see Watchdog
+        self.last_beat = None
+        self.restarts = 0
 
         self._is_ready = True
 
@@ -141,7 +165,36 @@ class PiPower5System():
 
     @log_error
     def set_before_shutdown(self, callback):
-        self.__before_shutdown__ = callback
+        '''
+        Set the before shutdown hook, see add_shutdown_hook.
+
+        Args:
+            callback (function): Called with the shutdown reason.
+        '''
+        self.shutdown_orchestrator.add_hook('before_shutdown', callback)
+
+    @log_error
+    def add_shutdown_hook(self, name, callback, deadline=DEFAULT_HOOK_DEADLINE):
+        '''
+        Add a pre-shutdown hook, like flushing a database or stopping containers.
+        Hooks run concurrently before power off, see ShutdownOrchestrator.
+
+        Args:
+            name (str): Hook name, a hook of the same name is replaced.
+            callback (function): Called with the shutdown reason, may be a coroutine function.
+            deadline (float, optional): Max run time in seconds. Defaults to 10.
+        '''
+        self.shutdown_orchestrator.add_hook(name, callback, deadline)
+
+    @log_error
+    def set_remaining_runtime(self, callback):
+        '''
+        Set the remaining runtime estimate the shutdown hook budget is taken from.
+
+        Args:
+            callback (function): Returns the remaining runtime in seconds.
+        '''
+        self.shutdown_orchestrator.get_remaining_runtime = callback
 
     @log_error
     def set_on_data_changed(self, callback):
@@ -149,19 +202,70 @@ class PiPower5System():
 
     @log_error
     def shutdown(self, reason):
+        '''
+        Shut down: run the pre-shutdown hooks on a thread and loop of their
+        own, then power off. Returns right away, so the caller and the battery
+        polling go on until power off. A stalled or restarted system loop
+        doesn't hold it up, and power off is called anyway POWER_OFF_MARGIN
+        past the hook budget. Calls while the hooks run are ignored, a call
+        after power off failed retries.
+
+        Args:
+            reason (Any): Shutdown reason.
+        '''
         if reason != 'None' or reason != None or reason != 0:
+            with self.shutdown_lock:
+                if self.shutting_down:
+                    self.log.debug(f"Already shutting down, ignored: {reason}")
+                    return
+                self.shutting_down = True
+                self.shutdown_attempts += 1
+            if self.shutdown_attempts > 1:
+                self.log.warning(f"Still running after power off, retrying shutdown ({self.shutdown_attempts} attempts)")
             self.log.info(f"Shutdown reason: {reason}")
-            if self.__before_shutdown__:
-                self.__before_shutdown__(reason)
-            time.sleep(5)
-
-            try:
-                from sf_rpi_status import shutdown
-                shutdown()
-            except Exception as e:
-                self.log.error(f"Failed to shutdown: {e}")
-                from os import system
-                system("sudo shutdown -h now")
+            budget = self.shutdown_orchestrator.get_budget()
+            powered_off = threading.Event()
+            self.shutdown_timer = threading.Timer(budget + POWER_OFF_MARGIN, self._power_off_once, args=(powered_off, True))
+            self.shutdown_timer.daemon = True
+            self.shutdown_timer.start()
+            self.shutdown_thread = threading.Thread(target=self._shutdown, args=(reason, budget, powered_off),
+                                                    name='pipower5-shutdown', daemon=True)
+            self.shutdown_thread.start()
+
+    def _shutdown(self, reason, budget, powered_off):
+        try:
+            asyncio.run(self.shutdown_orchestrator.run(reason, budget=budget))
+        except Exception as e:
+            # Power off regardless
+            self.log.error(f"Shutdown hooks failed: {e}")
+        self.shutdown_timer.cancel()
+        self._power_off_once(powered_off)
+
+    def _power_off_once(self, powered_off, fallback=False):
+        # Called by the shutdown thread or the fallback timer, whichever is first
+        with self.shutdown_lock:
+            if powered_off.is_set():
+                return
+            powered_off.set()
+        if fallback:
+            self.log.warning("Shutdown hooks still running past the budget, powering off")
+        try:
+            self._power_off()
+        finally:
+            with self.shutdown_lock:
+                self.shutting_down = False
+
+    def _power_off(self):
+        try:
+            from sf_rpi_status import shutdown
+            shutdown()
+        except Exception as e:
+            self.log.error(f"Failed to shutdown: {e}")
+            from os import system
+            system("sudo shutdown -h now")
+
+    def _sync_filesystems(self, reason):
+        os.sync()
 
     @log_error
     def task_once(self):
@@ -253,6 +357,16 @@ class PiPower5System():
         if self.__on_data_changed__:
             self.__on_data_changed__(data, delete_keys=delete_keys)
 
+    @log_error
+    def get_cpu_stats(self):
+        '''
+        Get the CPU time of the system loop and its tasks, see TaskCpu.
+
+        Returns:
+            dict: Loop steps and CPU time, longest step, executor calls and CPU time.
+        '''
+        return self.cpu.to_dict()
+
     @log_error
     async def main(self):
         self.log.debug("SystemAddon main loop started")
@@ -261,38 +375,87 @@ class PiPower5System():
         await self.scheduler.run_periodically(self.task_3s, 3)
         await self.scheduler.run_periodically(self.task_5s, 5)
         while self.running:
+            self.last_beat = time.monotonic()
             await asyncio.sleep(1)
 
     @log_error
-    def start(self):
+    def start(self, runtime=None):
+        '''
+        Start the system loop.
+
+        Args:
+            runtime (Runtime, optional): Shared event loop to run on, the
+                tasks then run on its executor. Defaults to a loop and thread
+                of its own.
+        '''
         if self.running:
             self.log.warning("Already running")
             return
         
         self.running = True
+        if runtime is not None:
+            self.runtime = runtime
+            self.scheduler.run_blocking = functools.partial(runtime.run_blocking, self.cpu)
+            self.loop = runtime.loop
+            self.loop_thread = runtime.loop_thread
+            self.loop.call_soon_threadsafe(self._start_loop_task)
+            self.log.info("PiPower5 system started on the shared event loop")
+            return
         # 创建新的事件循环
         self.loop = asyncio.new_event_loop()
+        count_task_cpu(self.loop)
         asyncio.set_event_loop(self.loop)
         # 在新线程中运行事件循环
-        self.loop_thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.loop_thread = threading.Thread(target=self._run_loop, args=(self.loop,), daemon=True)
         self.loop_thread.start()
         # 在事件循环中创建并运行任务
         self.loop.call_soon_threadsafe(self._start_loop_task)
         self.log.info("PiPower5 system started")
 
-    def _run_loop(self):
+    def _run_loop(self, loop):
         """在线程中运行事件循环"""
         try:
-            self.loop.run_forever()
+            loop.run_forever()
         except Exception as e:
             self.log.error(f"Event loop error: {e}")
         finally:
-            self.loop.close()
+            loop.close()
             self.log.debug("Event loop closed")
 
+    @log_error
+    def restart(self):
+        '''
+        Restart the main loop on a new event loop and thread, see Watchdog.
+        The stalled loop is asked to stop and left to its thread. On the
+        shared event loop only the tasks are restarted.
+        '''
+        if not self.running:
+            return
+        self.restarts += 1
+        self.log.warning(f"Restarting PiPower5 system loop ({self.restarts} restarts)")
+        old_loop, old_task = self.loop, self.task
+        old_scheduler = self.scheduler
+        if old_task is not None and not old_loop.is_closed():
+            old_loop.call_soon_threadsafe(old_task.cancel)
+            old_loop.call_soon_threadsafe(old_scheduler.cancel_all_tasks)
+            if self.runtime is None:
+                old_loop.call_soon_threadsafe(old_loop.stop)
+        # Tasks of the old scheduler belong to the stalled loop
+        self.scheduler = TaskScheduler()
+        self.scheduler.run_blocking = old_scheduler.run_blocking
+        self.task = None
+        if self.runtime is not None:
+            self.loop.call_soon_threadsafe(self._start_loop_task)
+            return
+        self.loop = asyncio.new_event_loop()
+        count_task_cpu(self.loop)
+        self.loop_thread = threading.Thread(target=self._run_loop, args=(self.loop,), daemon=True)
+        self.loop_thread.start()
+        self.loop.call_soon_threadsafe(self._start_loop_task)
+
     def _start_loop_task(self):
         """在事件循环中创建并启动任务"""
-        self.task = self.loop.create_task(self.main())
+        self.task = self.loop.create_task(timed(self.main(), self.cpu))
 
     @log_error
     def stop(self):
@@ -309,12 +472,16 @@ class PiPower5System():
         # 取消任务
         self.loop.call_soon_threadsafe(self.task.cancel)
         
-        # 停止事件循环
-        self.loop.call_soon_threadsafe(self.loop.stop)
-        
-        # 等待线程结束
-        if self.loop_thread and self.loop_thread.is_alive():
-            self.loop_thread.join(timeout=2.0)
+        # The shared event loop is stopped by its owner
+        if self.runtime is not None:
+            self.loop.call_soon_threadsafe(self.scheduler.cancel_all_tasks)
+        else:
+            # 停止事件循环
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            
+            # 等待线程结束
+            if self.loop_thread and self.loop_thread.is_alive():
+                self.loop_thread.join(timeout=2.0)
                 
         self.log.info("PiPower5 service stopped")
 
@@ -0,0 +1,160 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import Histogram
+
+DEFAULT_WORKERS = 4 # threads running hooks
+
+class PowerLossHook():
+    def __init__(self, name, on_loss, on_cancel=None):
+        '''
+        Fast path power loss hook.
+
+        Args:
+            name (str): Hook name, for logs and stats.
+            on_loss (function): Called with the monotonic time the loss was detected.
+            on_cancel (function, optional): Called with the monotonic time power
+                came back, when it did before the loss was confirmed.
+        '''
+        self.name = name
+        self.on_loss = on_loss
+        self.on_cancel = on_cancel
+        # Future of the last call, a cancel runs after its loss call is done
+        self.future = None
+
+        self.fired = 0
+        self.cancelled = 0
+        self.errors = 0
+        # Detection to hook start
+        self.latency = Histogram()
+        # Hook run time
+        self.duration = Histogram()
+
+    def get_stats(self):
+        return {
+            'fired': self.fired,
+            'cancelled': self.cancelled,
+            'errors': self.errors,
+            'latency': self.latency.to_dict(),
+            'duration': self.duration.to_dict(),
+        }
+
+class PowerLossHooks():
+    def __init__(self, workers=DEFAULT_WORKERS, log=None):
+        '''
+        Hooks fired on the first raw unplugged reading, before the power
+        disconnected event is confirmed.
+
+        Hooks run on a thread pool, so neither the poll loop nor the other
+        hooks wait for them. If power comes back before the loss is
+        confirmed, the cancel callbacks run, each after the loss call of its
+        hook is done. Latency from detection to hook start and run time are
+        recorded per hook.
+
+        Args:
+            workers (int, optional): Threads running hooks. Defaults to 4.
+        '''
+        self.log = log or logging.getLogger(__name__)
+        self.hooks = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pipower5-power-loss')
+        # Monotonic detection time of a loss not confirmed yet
+        self.pending = None
+        self.confirmed = False
+        self.losses = 0
+        self.false_alarms = 0
+
+    def add(self, name, on_loss, on_cancel=None):
+        '''
+        Add a hook, replacing the hook of the same name.
+
+        Args:
+            name (str): Hook name.
+            on_loss (function): Called with the monotonic time the loss was detected.
+            on_cancel (function, optional): Called with the monotonic time power
+                came back, if before the loss was confirmed.
+        '''
+        self.hooks[name] = PowerLossHook(name, on_loss, on_cancel)
+
+    def remove(self, name):
+        self.hooks.pop(name, None)
+
+    def _call(self, hook, func, since):
+        start = time.monotonic()
+        hook.latency.observe(start - since)
+        try:
+            func(since)
+        except Exception as e:
+            hook.errors += 1
+            self.log.error(f"Power loss hook {hook.name} failed: {e}")
+        hook.duration.observe(time.monotonic() - start)
+
+    def lost(self, detected_at):
+        '''
+        Fire the hooks, call from the poll loop on the first unplugged reading.
+
+        Args:
+            detected_at (float): Monotonic time of the edge or of the reading.
+        '''
+        if self.pending is not None:
+            return
+        self.pending = detected_at
+        self.confirmed = False
+        self.losses += 1
+        for hook in self.hooks.values():
+            hook.fired += 1
+            hook.future = self.executor.submit(self._call, hook, hook.on_loss, detected_at)
+
+    def confirm(self):
+        '''
+        The power disconnected event fired, a later restore doesn't cancel.
+        '''
+        if self.pending is not None:
+            self.confirmed = True
+
+    def restored(self, detected_at):
+        '''
+        Power is back, cancel the hooks if the loss isn't confirmed yet.
+
+        Args:
+            detected_at (float): Monotonic time of the edge or of the reading.
+        '''
+        if self.pending is None:
+            return
+        confirmed = self.confirmed
+        self.pending = None
+        self.confirmed = False
+        if confirmed:
+            return
+        self.false_alarms += 1
+        self.log.info("Power came back before the loss was confirmed, cancelling power loss hooks")
+        for hook in self.hooks.values():
+            if hook.on_cancel is None:
+                continue
+            hook.cancelled += 1
+            self._after(hook, lambda hook=hook: self._call(hook, hook.on_cancel, detected_at))
+
+    def _after(self, hook, call):
+        if hook.future is None:
+            hook.future = self.executor.submit(call)
+            return
+        # A done callback runs right away on this thread if the loss call is
+        # done, hand it to the executor so the poll loop never runs a hook
+        hook.future.add_done_callback(lambda _: self.executor.submit(call))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    def get_stats(self):
+        '''
+        Get power loss hook stats.
+
+        Returns:
+            dict: losses detected, losses cancelled by power coming back, and
+                per hook fired and cancel counts, errors, and latency and
+                duration histograms.
+        '''
+        return {
+            'losses': self.losses,
+            'false_alarms': self.false_alarms,
+            'hooks': {name: hook.get_stats() for name, hook in self.hooks.items()},
+        }
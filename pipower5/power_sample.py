@@ -0,0 +1,90 @@
+import time
+from collections.abc import Mapping
+
+# Sample schema, register fields of the snapshot read first, see PiPower5.SNAPSHOT_FIELDS
+REGISTER_FIELDS = [
+    'input_voltage', # mV
+    'input_current', # mA
+    'output_voltage', # mV
+    'output_current', # mA
+    'battery_voltage', # mV
+    'battery_current', # mA, positive when charging
+    'battery_percentage', # %
+    'battery_capacity', # mAh
+    'power_source', # PowerSource
+    'is_input_plugged_in', # bool
+    'is_battery_plugged_in', # bool
+    'is_charging', # bool
+    'shutdown_request', # ShutdownRequest
+    'default_on', # bool
+    'shutdown_percentage', # %
+    'power_btn', # ButtonState
+    'max_charge_current', # mA
+]
+
+# Fields added by the service on each tick
+SERVICE_FIELDS = [
+    'device_name', # str
+    'poll_state', # str, see PollState
+    'poll_interval', # seconds
+    'bus_degraded', # bool
+    'battery_current_output', # mA, smoothed discharge current
+    'estimated_time', # hours until the shutdown percentage
+    'estimated_time_low', # hours, 95% band
+    'estimated_time_high', # hours, 95% band
+    'time_to_full', # hours
+]
+
+FIELDS = REGISTER_FIELDS + SERVICE_FIELDS
+_FIELD_SET = frozenset(FIELDS)
+
+class PowerSample(Mapping):
+    __slots__ = tuple(['monotonic', 'time', 'stale'] + FIELDS)
+
+    def __init__(self):
+        '''
+        Record of one poll tick, reused from tick to tick.
+
+        Fields are attributes, see FIELDS for the schema, never read fields
+        are None. It is a read only mapping of the fields too, so
+        sample['battery_current'], dict(sample) and template.format(**sample)
+        work, use to_dict to keep the values of a tick. Fields are set as
+        attributes only.
+
+        Attributes:
+            monotonic (float): Monotonic time of the read.
+            time (float): Wall clock time of the read.
+            stale (list): Fields that failed to read and kept their previous value.
+        '''
+        self.monotonic = None
+        self.time = None
+        self.stale = []
+        for name in FIELDS:
+            setattr(self, name, None)
+
+    def stamp(self):
+        self.monotonic = time.monotonic()
+        self.time = time.time()
+
+    def __getitem__(self, name):
+        if name not in _FIELD_SET:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def to_dict(self):
+        '''
+        Copy the fields to a dict.
+
+        Returns:
+            dict: Fields by name.
+        '''
+        return {name: getattr(self, name) for name in FIELDS}
+
+    def __repr__(self):
+        return f'PowerSample({self.to_dict()})'
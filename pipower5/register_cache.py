@@ -0,0 +1,118 @@
+import time
+import threading
+from enum import StrEnum
+
+class CachePolicy(StrEnum):
+    LIVE = 'live'       # Always read from the bus
+    TTL = 'ttl'         # Reuse the cached value until it is older than ttl
+    STATIC = 'static'   # Reuse the cached value until it is written or invalidated
+
+class RegisterCache:
+    def __init__(self):
+        '''
+        Register cache with a freshness policy per register.
+
+        Registers without a policy are treated as live and never cached.
+        '''
+        self.policies = {}
+        self.values = {}
+        self.timestamps = {}
+        self.hits = {}
+        self.misses = {}
+        self.lock = threading.Lock()
+
+    def set_policy(self, name, policy, ttl=None):
+        '''
+        Set freshness policy for a register.
+
+        Args:
+            name (str): Register name.
+            policy (CachePolicy): Freshness policy.
+            ttl (float, optional): Time to live in seconds, required for CachePolicy.TTL.
+        '''
+        policy = CachePolicy(policy)
+        if policy == CachePolicy.TTL and ttl is None:
+            raise ValueError(f"TTL policy for {name} needs a ttl")
+        with self.lock:
+            self.policies[name] = (policy, ttl)
+            self.hits.setdefault(name, 0)
+            self.misses.setdefault(name, 0)
+            if policy == CachePolicy.LIVE:
+                self.values.pop(name, None)
+                self.timestamps.pop(name, None)
+
+    def _is_fresh(self, name):
+        if name not in self.values:
+            return False
+        policy, ttl = self.policies[name]
+        if policy == CachePolicy.STATIC:
+            return True
+        if policy == CachePolicy.TTL:
+            return time.monotonic() - self.timestamps[name] < ttl
+        return False
+
+    def get(self, name, read_func):
+        '''
+        Get a register value, reading it from the bus only if the cached value is not fresh.
+
+        Args:
+            name (str): Register name.
+            read_func (function): Function to read the value from the bus.
+
+        Returns:
+            Any: Register value.
+        '''
+        if name not in self.policies:
+            return read_func()
+        with self.lock:
+            if self._is_fresh(name):
+                self.hits[name] += 1
+                return self.values[name]
+            self.misses[name] += 1
+        value = read_func()
+        self.put(name, value)
+        return value
+
+    def put(self, name, value):
+        '''
+        Store a value read from or written to the bus.
+
+        Args:
+            name (str): Register name.
+            value (Any): Register value.
+        '''
+        with self.lock:
+            if name not in self.policies or self.policies[name][0] == CachePolicy.LIVE:
+                return
+            self.values[name] = value
+            self.timestamps[name] = time.monotonic()
+
+    def invalidate(self, name=None):
+        '''
+        Drop a cached value, or all cached values if name is None.
+
+        Args:
+            name (str, optional): Register name.
+        '''
+        with self.lock:
+            if name is None:
+                self.values.clear()
+                self.timestamps.clear()
+            else:
+                self.values.pop(name, None)
+                self.timestamps.pop(name, None)
+
+    def get_stats(self):
+        '''
+        Get hit and miss counters, hits are bus transactions saved.
+
+        Returns:
+            dict: Total hits and misses, and per register counters.
+        '''
+        with self.lock:
+            registers = {name: {'hits': self.hits[name], 'misses': self.misses[name]} for name in self.policies}
+            return {
+                'hits': sum(self.hits.values()),
+                'misses': sum(self.misses.values()),
+                'registers': registers,
+            }
@@ -0,0 +1,185 @@
+import struct
+from enum import IntEnum
+
+STRUCT_CODES = {
+    (1, False): 'B',
+    (1, True): 'b',
+    (2, False): 'H',
+    (2, True): 'h',
+    (4, False): 'I',
+    (4, True): 'i',
+}
+
+class Register():
+    def __init__(self, address, width=1, signed=False, count=1, scale=1, unit=None,
+                 enum=None, versions=None, label=None, flags=None, group=None):
+        '''
+        Register descriptor.
+
+        Args:
+            address (int): Register address.
+            width (int, optional): Width of a value in bytes. Defaults to 1.
+            signed (bool, optional): Value is signed. Defaults to False.
+            count (int, optional): Number of values, more than one decodes to a
+                dotted string like a version. Defaults to 1.
+            scale (int, optional): Raw value multiplier. Defaults to 1.
+            unit (str, optional): Unit after scaling, like 'mV'.
+            enum (type, optional): Type the value is converted to, like ButtonState or bool.
+            versions (list, optional): Board versions having the register, None for all.
+            label (str, optional): Label for output.
+            flags (tuple, optional): CLI flags reading the register.
+            group (str, optional): Section in the CLI status output.
+        '''
+        if (width, signed) not in STRUCT_CODES:
+            raise ValueError(f"Invalid register width: {width}")
+        self.address = address
+        self.width = width
+        self.signed = signed
+        self.count = count
+        self.scale = scale
+        self.unit = unit
+        self.enum = enum
+        self.versions = versions
+        self.label = label
+        self.flags = flags
+        self.group = group
+
+    @property
+    def code(self):
+        return STRUCT_CODES[(self.width, self.signed)] * self.count
+
+    @property
+    def format(self):
+        return '<' + self.code
+
+    @property
+    def size(self):
+        return self.width * self.count
+
+    def is_available(self, version):
+        return self.versions is None or version in self.versions
+
+    def convert(self, raw):
+        '''
+        Convert raw value(s) to the typed value.
+
+        Args:
+            raw (int|tuple): Raw value, a tuple if count is more than one.
+
+        Returns:
+            Any: Typed value.
+        '''
+        if self.count > 1:
+            return '.'.join(str(value) for value in raw)
+        if self.enum is not None:
+            return self.enum(raw)
+        return raw * self.scale
+
+    def format_value(self, value):
+        '''
+        Format a typed value for output, like "5000 mV" or "1 - CLICK".
+        '''
+        if isinstance(value, IntEnum):
+            return f'{int(value)} - {value.name}'
+        if self.unit:
+            return f'{value} {self.unit}'
+        return str(value)
+
+class RegisterDecoder():
+    def __init__(self, registers, names):
+        '''
+        Decoder of a block read covering the given registers.
+
+        The layout is compiled once into a single struct, with pad bytes over
+        the gaps, so decoding a buffer is one unpack and one pass over the values.
+
+        Args:
+            registers (dict): Register map, {name: Register}.
+            names (list): Names of the registers to decode.
+        '''
+        fields = sorted(((registers[name].address, name, registers[name]) for name in names))
+        self.start = fields[0][0]
+        code = '<'
+        position = self.start
+        self.fields = []
+        index = 0
+        for address, name, register in fields:
+            if address < position:
+                raise ValueError(f"Register {name} at {address} overlaps the previous register")
+            code += 'x' * (address - position) + register.code
+            position = address + register.size
+            if register.count > 1:
+                convert = register.convert
+            elif register.enum is not None:
+                convert = register.enum
+            elif register.scale != 1:
+                convert = register.convert
+            else:
+                convert = None
+            self.fields.append((name, index, register.count, convert))
+            index += register.count
+        self.length = position - self.start
+        self.struct = struct.Struct(code)
+        self.names = [name for _, name, _ in fields]
+        self.registers = registers
+
+    def split(self, max_gap, max_length=None):
+        '''
+        Split the fields into groups read separately, at gaps wider than
+        max_gap, and where a group would get longer than max_length.
+
+        Args:
+            max_gap (int): Max unused bytes within a group.
+            max_length (int, optional): Max bytes of a group. Defaults to no limit.
+
+        Returns:
+            list: Lists of names.
+        '''
+        groups = []
+        start = None
+        end = None
+        for name in self.names:
+            register = self.registers[name]
+            if end is None or register.address - end > max_gap \
+                    or (max_length is not None and register.address + register.size - start > max_length):
+                groups.append([])
+                start = register.address
+            groups[-1].append(name)
+            end = register.address + register.size
+        return groups
+
+    def decode(self, buffer, offset=0):
+        '''
+        Decode a buffer read from the start address.
+
+        Args:
+            buffer (bytes): Block read buffer.
+            offset (int, optional): Offset of the start address in the buffer. Defaults to 0.
+
+        Returns:
+            dict: Typed values by name.
+        '''
+        raw = self.struct.unpack_from(buffer, offset)
+        data = {}
+        for name, index, count, convert in self.fields:
+            value = raw[index] if count == 1 else raw[index:index + count]
+            data[name] = convert(value) if convert else value
+        return data
+
+    def decode_into(self, target, buffer, offset=0):
+        '''
+        Decode a buffer into the attributes of a record, like a PowerSample.
+
+        Args:
+            target (object): Record with an attribute per field.
+            buffer (bytes): Block read buffer.
+            offset (int, optional): Offset of the start address in the buffer. Defaults to 0.
+
+        Returns:
+            object: The target.
+        '''
+        raw = self.struct.unpack_from(buffer, offset)
+        for name, index, count, convert in self.fields:
+            value = raw[index] if count == 1 else raw[index:index + count]
+            setattr(target, name, convert(value) if convert else value)
+        return target
@@ -0,0 +1,168 @@
+import time
+from enum import StrEnum
+
+class BreakerState(StrEnum):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+READ_METHODS = ['read_byte', 'read_byte_data', 'read_word_data', 'read_block_data']
+WRITE_METHODS = ['write_byte_data', 'write_word_data', 'write_block_data']
+
+class ResilientBus():
+    def __init__(self, i2c,
+                 retries=2,
+                 retry_budget=5,
+                 refill_time=1,
+                 backoff=0.002,
+                 failure_threshold=3,
+                 open_time=1,
+                 max_open_time=30):
+        '''
+        I2C object wrapper with retries and a circuit breaker.
+
+        Failed reads are retried, as long as the retry budget lasts. The
+        budget refills over refill_time, so every user of the bus gets its
+        retries back, and a poll tick refills it at once, see new_tick. Writes are not retried as they may have reached the board.
+        After failure_threshold failed transactions in a row the breaker
+        opens and transactions fail right away with ConnectionError, so a
+        dead bus isn't hammered. After open_time one probe transaction is let
+        through, success closes the breaker, failure opens it again for
+        twice as long, up to max_open_time.
+
+        Args:
+            i2c (I2C): I2C object to wrap.
+            retries (int, optional): Max retries per read. Defaults to 2.
+            retry_budget (int, optional): Max retries in a burst. Defaults to 5.
+            refill_time (float, optional): Seconds for an empty budget to refill. Defaults to 1.
+            backoff (float, optional): Wait before a retry in seconds. Defaults to 0.002.
+            failure_threshold (int, optional): Failed transactions in a row that
+                open the breaker. Defaults to 3.
+            open_time (float, optional): First open time in seconds. Defaults to 1.
+            max_open_time (float, optional): Max open time in seconds. Defaults to 30.
+        '''
+        self.i2c = i2c
+        self.retries = retries
+        self.retry_budget = retry_budget
+        self.refill_time = refill_time
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.min_open_time = open_time
+        self.max_open_time = max_open_time
+
+        self.state = BreakerState.CLOSED
+        self.open_time = open_time
+        self.open_until = 0
+        self.consecutive_failures = 0
+        self.budget = retry_budget
+        self.refilled_at = time.monotonic()
+
+        self.errors = 0
+        self.retried = 0
+        self.budget_exhausted = 0
+        self.rejected = 0
+        self.trips = 0
+        self.recoveries = 0
+
+        for method in READ_METHODS + WRITE_METHODS:
+            if hasattr(i2c, method):
+                setattr(self, method, self._wrap(method, method in READ_METHODS))
+
+    def new_tick(self):
+        '''
+        Refill the retry budget, called once per poll.
+        '''
+        self.budget = self.retry_budget
+        self.refilled_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.refill_time > 0:
+            refill = (now - self.refilled_at) * self.retry_budget / self.refill_time
+        else:
+            refill = self.retry_budget
+        self.budget = min(self.retry_budget, self.budget + refill)
+        self.refilled_at = now
+
+    @property
+    def is_healthy(self):
+        return self.state == BreakerState.CLOSED and self.consecutive_failures == 0
+
+    def _check(self):
+        if self.state == BreakerState.OPEN:
+            if time.monotonic() < self.open_until:
+                self.rejected += 1
+                raise ConnectionError(f"I2C bus circuit open for {self.open_until - time.monotonic():.1f} s")
+            # Let one probe through
+            self.state = BreakerState.HALF_OPEN
+
+    def _on_success(self):
+        self.consecutive_failures = 0
+        if self.state != BreakerState.CLOSED:
+            self.state = BreakerState.CLOSED
+            self.open_time = self.min_open_time
+            self.recoveries += 1
+
+    def _on_failure(self):
+        self.errors += 1
+        self.consecutive_failures += 1
+        if self.state == BreakerState.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state == BreakerState.HALF_OPEN:
+                self.open_time = min(self.open_time * 2, self.max_open_time)
+            else:
+                self.trips += 1
+            self.state = BreakerState.OPEN
+            self.open_until = time.monotonic() + self.open_time
+
+    def _wrap(self, method, retry):
+        func = getattr(self.i2c, method)
+
+        def transfer(*args):
+            self._check()
+            attempt = 0
+            while True:
+                try:
+                    result = func(*args)
+                except OSError:
+                    can_retry = retry and attempt < self.retries and self.state == BreakerState.CLOSED
+                    if can_retry:
+                        self._refill()
+                    if can_retry and self.budget < 1:
+                        self.budget_exhausted += 1
+                        can_retry = False
+                    if not can_retry:
+                        self._on_failure()
+                        raise
+                    attempt += 1
+                    self.budget -= 1
+                    self.retried += 1
+                    if hasattr(self.i2c, 'record_retry'):
+                        self.i2c.record_retry(method, args[0] if len(args) > 0 else None)
+                    time.sleep(self.backoff)
+                    continue
+                self._on_success()
+                return result
+        transfer.__name__ = method
+        return transfer
+
+    def get_fault_stats(self):
+        '''
+        Get error and recovery counters.
+
+        Returns:
+            dict: Breaker state, errors (failed transactions after retries),
+                retries, retries denied by the budget, transactions rejected
+                while open, trips and recoveries.
+        '''
+        return {
+            'state': str(self.state),
+            'errors': self.errors,
+            'retries': self.retried,
+            'budget_exhausted': self.budget_exhausted,
+            'rejected': self.rejected,
+            'trips': self.trips,
+            'recoveries': self.recoveries,
+        }
+
+    def __getattr__(self, name):
+        return getattr(self.i2c, name)
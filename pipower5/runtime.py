@@ -0,0 +1,181 @@
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = 2 # threads running blocking work of the tasks
+
+# TaskCpu of the running task, inherited by the tasks it creates
+_current_cpu = contextvars.ContextVar('pipower5_task_cpu', default=None)
+
+class TaskCpu():
+    def __init__(self, name):
+        '''
+        CPU time of a task: thread CPU time of the steps of its coroutine and
+        of the tasks it creates on the loop, and of its calls in the runtime
+        executor.
+
+        Args:
+            name (str): Task name.
+        '''
+        self.name = name
+        self.steps = 0
+        self.loop_cpu = 0
+        self.executor_calls = 0
+        self.executor_cpu = 0
+        self.max_step = 0
+
+    def to_dict(self):
+        return {
+            'steps': self.steps,
+            'loop_cpu': round(self.loop_cpu, 3),
+            'max_step': round(self.max_step, 6),
+            'executor_calls': self.executor_calls,
+            'executor_cpu': round(self.executor_cpu, 3),
+        }
+
+class _Timed():
+    # Drives a coroutine and adds the thread CPU time of every step to cpu.
+    # Futures the coroutine awaits are passed up to the task unchanged.
+    def __init__(self, coro, cpu):
+        self.coro = coro
+        self.cpu = cpu
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            start = time.thread_time()
+            try:
+                if error is not None:
+                    future = self.coro.throw(error)
+                else:
+                    future = self.coro.send(value)
+            except StopIteration as e:
+                self._observe(start)
+                return e.value
+            except BaseException:
+                self._observe(start)
+                raise
+            self._observe(start)
+            try:
+                value, error = (yield future), None
+            except BaseException as e:
+                value, error = None, e
+
+    def _observe(self, start):
+        elapsed = time.thread_time() - start
+        self.cpu.steps += 1
+        self.cpu.loop_cpu += elapsed
+        if elapsed > self.cpu.max_step:
+            self.cpu.max_step = elapsed
+
+async def timed(coro, cpu):
+    '''
+    Run a coroutine counting the CPU time of its steps.
+
+    Args:
+        coro (coroutine): Coroutine to run.
+        cpu (TaskCpu): Counters to add to.
+
+    Returns:
+        Any: The return value of the coroutine.
+    '''
+    # Set in the context of the task, see count_task_cpu
+    _current_cpu.set(cpu)
+    return await _Timed(coro, cpu)
+
+def _task_factory(loop, coro, **kwargs):
+    cpu = _current_cpu.get()
+    if cpu is not None and getattr(coro, 'cr_code', None) is not timed.__code__:
+        coro = timed(coro, cpu)
+    return asyncio.Task(coro, loop=loop, **kwargs)
+
+def count_task_cpu(loop):
+    '''
+    Count the CPU time of the tasks created on a loop by a timed task to
+    the TaskCpu of that task, like the scheduler tasks of the system loop.
+
+    Args:
+        loop (asyncio.AbstractEventLoop): Loop.
+    '''
+    loop.set_task_factory(_task_factory)
+
+class Runtime():
+    def __init__(self, workers=DEFAULT_WORKERS, log=None):
+        '''
+        One event loop on one thread, shared by the service and system loops.
+
+        Components run as tasks on the loop instead of each owning a loop
+        and a thread, blocking work goes to the runtime executor with
+        run_blocking. Task CPU time is counted the same way as with a loop
+        per component, so the two modes compare, see TaskCpu.
+
+        Args:
+            workers (int, optional): Executor threads. Defaults to 2.
+        '''
+        self.log = log or logging.getLogger(__name__)
+        self.workers = workers
+        self.loop = None
+        self.loop_thread = None
+        self.executor = None
+
+    def start(self):
+        if self.loop is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        count_task_cpu(self.loop)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='pipower5-blocking')
+        self.loop_thread = threading.Thread(target=self._run_loop, name='pipower5-runtime', daemon=True)
+        self.loop_thread.start()
+        self.log.info("Shared event loop started")
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        except Exception as e:
+            self.log.error(f"Event loop error: {e}")
+        finally:
+            # Let the tasks of the components handle their cancellation
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+            self.log.debug("Shared event loop closed")
+
+    def stop(self):
+        if self.loop is None:
+            return
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.loop_thread.is_alive() and self.loop_thread is not threading.current_thread():
+            self.loop_thread.join(timeout=2.0)
+        self.executor.shutdown(wait=False)
+        self.loop = None
+        self.loop_thread = None
+        self.executor = None
+
+    async def run_blocking(self, cpu, func, *args, **kwargs):
+        '''
+        Run blocking work on the runtime executor, off the shared loop.
+
+        Args:
+            cpu (TaskCpu): Counters for the CPU time of the call, None to not count.
+            func (function): Function to run.
+
+        Returns:
+            Any: The return value of the function.
+        '''
+        def call():
+            start = time.thread_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if cpu is not None:
+                    cpu.executor_calls += 1
+                    cpu.executor_cpu += time.thread_time() - start
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
@@ -0,0 +1,134 @@
+import math
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_HOOK_DEADLINE = 10 # seconds
+MIN_BUDGET = 5 # seconds, hooks always get this long
+MAX_BUDGET = 60 # seconds, also the budget on external power
+RUNTIME_SHARE = 0.5 # share of the estimated remaining runtime given to the hooks
+DEFAULT_WORKERS = 4 # threads running sync hooks
+
+class ShutdownHook():
+    def __init__(self, name, func, deadline=DEFAULT_HOOK_DEADLINE):
+        '''
+        Pre-shutdown hook.
+
+        Args:
+            name (str): Hook name, for logs.
+            func (function): Called with the shutdown reason, may be a coroutine function.
+            deadline (float, optional): Max run time in seconds. Defaults to 10.
+        '''
+        self.name = name
+        self.func = func
+        self.deadline = deadline
+        self.is_async = asyncio.iscoroutinefunction(func)
+
+class ShutdownOrchestrator():
+    def __init__(self, get_remaining_runtime=None, workers=DEFAULT_WORKERS, log=None):
+        '''
+        Runs the pre-shutdown hooks concurrently, within a time budget.
+
+        Every hook starts at once, coroutine hooks on the loop and sync hooks
+        on a thread pool, so a slow hook holds up none of the others. Each hook is given up on after its own deadline, and
+        all of them after the overall budget: RUNTIME_SHARE of the estimated
+        remaining battery runtime, clamped to MIN_BUDGET and MAX_BUDGET. A
+        hook given up on keeps its thread, it is not waited for.
+
+        Args:
+            get_remaining_runtime (function, optional): Returns the estimated
+                remaining runtime in seconds, inf on external power. Defaults
+                to always MAX_BUDGET.
+            workers (int, optional): Threads running sync hooks. Defaults to 4.
+        '''
+        self.get_remaining_runtime = get_remaining_runtime
+        self.workers = workers
+        self.log = log or logging.getLogger(__name__)
+        self.hooks = {}
+        self.executor = None
+        self.last_run = None
+
+    def add_hook(self, name, func, deadline=DEFAULT_HOOK_DEADLINE):
+        '''
+        Add a pre-shutdown hook, replacing the hook of the same name.
+
+        Args:
+            name (str): Hook name.
+            func (function): Called with the shutdown reason, may be a coroutine function.
+            deadline (float, optional): Max run time in seconds. Defaults to 10.
+        '''
+        self.hooks[name] = ShutdownHook(name, func, deadline)
+
+    def remove_hook(self, name):
+        self.hooks.pop(name, None)
+
+    def get_budget(self):
+        '''
+        Get the time budget of the hooks.
+
+        Returns:
+            float: Budget in seconds.
+        '''
+        remaining = math.inf
+        if self.get_remaining_runtime is not None:
+            try:
+                remaining = self.get_remaining_runtime()
+            except Exception as e:
+                self.log.warning(f"Failed to get the remaining runtime: {e}")
+        if remaining is None or math.isnan(remaining):
+            remaining = math.inf
+        return max(MIN_BUDGET, min(MAX_BUDGET, remaining * RUNTIME_SHARE))
+
+    async def _run_hook(self, hook, reason, timeout, start):
+        loop = asyncio.get_running_loop()
+        try:
+            if hook.is_async:
+                await asyncio.wait_for(hook.func(reason), timeout)
+            else:
+                await asyncio.wait_for(loop.run_in_executor(self.executor, hook.func, reason), timeout)
+            status = 'done'
+        except asyncio.TimeoutError:
+            status = 'timeout'
+        except Exception as e:
+            status = f'failed: {e}'
+        elapsed = time.monotonic() - start
+        if status == 'done':
+            self.log.info(f"Shutdown hook {hook.name} done in {elapsed * 1000:.0f} ms")
+        elif status == 'timeout':
+            self.log.warning(f"Shutdown hook {hook.name} timed out after {elapsed * 1000:.0f} ms")
+        else:
+            self.log.error(f"Shutdown hook {hook.name} {status} after {elapsed * 1000:.0f} ms")
+        return {'status': status, 'time': round(elapsed, 3)}
+
+    async def run(self, reason, budget=None):
+        '''
+        Run all hooks concurrently and wait until they are done or given up on.
+
+        Args:
+            reason (Any): Shutdown reason, passed to the hooks.
+            budget (float, optional): Time budget in seconds. Defaults to get_budget().
+
+        Returns:
+            dict: budget, total time, and status and time by hook.
+        '''
+        start = time.monotonic()
+        if budget is None:
+            budget = self.get_budget()
+        hooks = list(self.hooks.values())
+        self.log.info(f"Running {len(hooks)} shutdown hooks, budget {budget:.1f} s")
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='pipower5-shutdown')
+        results = await asyncio.gather(*[
+            self._run_hook(hook, reason, min(hook.deadline, budget), start) for hook in hooks])
+        elapsed = time.monotonic() - start
+        self.log.info(f"Shutdown hooks finished in {elapsed * 1000:.0f} ms")
+        self.last_run = {
+            'budget': round(budget, 3),
+            'time': round(elapsed, 3),
+            'hooks': {hook.name: result for hook, result in zip(hooks, results)},
+        }
+        # Don't wait for hooks that timed out
+        self.executor.shutdown(wait=False)
+        self.executor = None
+        return self.last_run
@@ -0,0 +1,460 @@
+import os
+import time
+import random
+import struct
+import threading
+
+SIMULATOR_ENV = 'PIPOWER5_SIMULATOR'
+SIMULATOR_LATENCY_ENV = 'PIPOWER5_SIMULATOR_LATENCY'
+SIMULATOR_BUS_SPEED_ENV = 'PIPOWER5_SIMULATOR_BUS_SPEED'
+SIMULATOR_TIME_SCALE_ENV = 'PIPOWER5_SIMULATOR_TIME_SCALE'
+SIMULATOR_ERROR_RATE_ENV = 'PIPOWER5_SIMULATOR_ERROR_RATE'
+
+TRUE_LIST = ['true', 'True', 'TRUE', '1', 'on', 'On', 'ON', 'yes']
+
+# Open circuit voltage of the 2S Li-ion pack, (percentage, mV)
+OCV_CURVE = [
+    (0, 6200),
+    (5, 6600),
+    (10, 6900),
+    (20, 7200),
+    (40, 7450),
+    (60, 7650),
+    (80, 7950),
+    (100, 8400),
+]
+
+INPUT_VOLTAGE = 5100 # mV
+OUTPUT_VOLTAGE = 5100 # mV
+INTERNAL_RESISTANCE = 0.1 # ohm
+EFFICIENCY = 0.9
+CC_CV_KNEE = 90 # percentage where charge current starts tapering
+LOW_VOLTAGE_SHUTDOWN = 6400 # mV
+
+# Raw register values, same as PowerSource, ShutdownRequest and ButtonState
+POWER_SOURCE_EXTERNAL = 0
+POWER_SOURCE_BATTERY = 1
+SHUTDOWN_REQUEST_NONE = 0
+SHUTDOWN_REQUEST_LOW_BATTERY = 1
+SHUTDOWN_REQUEST_BUTTON = 2
+SHUTDOWN_REQUEST_LOW_VOLTAGE = 3
+BUTTON_RELEASED = 0
+BUTTON_LONG_PRESS_5S = 5
+
+# Write registers the simulated firmware handles, by the device class constant
+# holding the address, as spc and PiPower5 define them. Settings are written
+# by the spc methods, so they run unchanged against the simulated bus.
+WRITE_REGISTERS = {
+    'REG_WRITE_SHUTDOWN_PERCENTAGE': 'shutdown_percentage',
+    'REG_WRITE_DEFAULT_ON': 'default_on',
+    'REG_WRITE_BUZZER_VOLUME': 'buzzer_volume',
+    'REG_WRITE_BUZZER_FREQ': 'buzzer_freq',
+    'REG_WRITE_POWER_BTN_STATE': 'power_btn',
+}
+
+def is_simulator_enabled():
+    '''
+    Check if the simulator is selected by environment variable.
+
+    Returns:
+        bool: True if PIPOWER5_SIMULATOR is set to a true value.
+    '''
+    return os.getenv(SIMULATOR_ENV, '') in TRUE_LIST
+
+def ocv(percentage):
+    '''
+    Open circuit voltage of the battery pack at a percentage.
+
+    Args:
+        percentage (float): Battery percentage, 0-100.
+
+    Returns:
+        float: Voltage in mV.
+    '''
+    for (p1, v1), (p2, v2) in zip(OCV_CURVE, OCV_CURVE[1:]):
+        if percentage <= p2:
+            return v1 + (v2 - v1) * (percentage - p1) / (p2 - p1)
+    return OCV_CURVE[-1][1]
+
+class SimulatedBoard():
+    def __init__(self,
+                 capacity=2000,
+                 battery_percentage=80,
+                 load_current=800,
+                 input_plugged_in=True,
+                 shutdown_percentage=10,
+                 max_charge_current=2000,
+                 firmware_version=(1, 0, 0),
+                 latency=0.0,
+                 bus_speed=None,
+                 time_scale=1.0,
+                 error_rate=0.0):
+        '''
+        Simulated PiPower5 board, models battery, input, button and shutdown requests.
+
+        Args:
+            capacity (int, optional): Battery capacity in mAh. Defaults to 2000.
+            battery_percentage (float, optional): Initial battery percentage. Defaults to 80.
+            load_current (int, optional): Output load in mA. Defaults to 800.
+            input_plugged_in (bool, optional): Initial input state. Defaults to True.
+            shutdown_percentage (int, optional): Initial shutdown percentage. Defaults to 10.
+            max_charge_current (int, optional): Max charge current in mA. Defaults to 2000.
+            firmware_version (tuple, optional): Firmware version. Defaults to (1, 0, 0).
+            latency (float, optional): Bus latency per transaction in seconds. Defaults to 0.
+            bus_speed (int, optional): Bus clock in Hz for per byte transfer time,
+                None for instant transfer. Defaults to None.
+            time_scale (float, optional): Simulated seconds per real second. Defaults to 1.
+            error_rate (float, optional): Probability of a transaction failing
+                with a Remote I/O error, like a glitching bus. Defaults to 0.
+        '''
+        self.capacity = capacity
+        self.charge = capacity * battery_percentage / 100 # mAh
+        self.load_current = load_current
+        self.input_plugged_in = input_plugged_in
+        self.shutdown_percentage = shutdown_percentage
+        self.max_charge_current = max_charge_current
+        self.firmware_version = firmware_version
+        self.latency = latency
+        self.bus_speed = bus_speed
+        self.time_scale = time_scale
+        self.error_rate = error_rate
+        self.bus_down = False
+
+        self.default_on = False
+        self.buzzer_volume = 3
+        self.buzzer_freq = 0
+        self.power_btn = BUTTON_RELEASED
+        self.button_shutdown = False
+        self.vbus_enabled = True
+        self.battery_enabled = True
+        self.output_enabled = True
+        self.in_iap = False
+
+        self.input_voltage = 0
+        self.input_current = 0
+        self.output_voltage = 0
+        self.output_current = 0
+        self.battery_voltage = 0
+        self.battery_current = 0
+        self.power_source = POWER_SOURCE_EXTERNAL
+        self.shutdown_request = SHUTDOWN_REQUEST_NONE
+
+        self.interrupt_handlers = []
+
+        self.lock = threading.RLock()
+        self.last_update = time.monotonic()
+        self._step(0)
+
+    @classmethod
+    def from_env(cls):
+        '''
+        Create a board configured from environment variables.
+
+        Returns:
+            SimulatedBoard: Simulated board.
+        '''
+        bus_speed = os.getenv(SIMULATOR_BUS_SPEED_ENV)
+        return cls(
+            latency=float(os.getenv(SIMULATOR_LATENCY_ENV, 0)),
+            bus_speed=int(bus_speed) if bus_speed else None,
+            time_scale=float(os.getenv(SIMULATOR_TIME_SCALE_ENV, 1)),
+            error_rate=float(os.getenv(SIMULATOR_ERROR_RATE_ENV, 0)),
+        )
+
+    @property
+    def battery_percentage(self):
+        return self.charge / self.capacity * 100
+
+    def add_interrupt_handler(self, handler):
+        '''
+        Add a handler called on interrupt line edges (input and button changes).
+
+        Args:
+            handler (function): Handler without arguments.
+        '''
+        self.interrupt_handlers.append(handler)
+
+    def remove_interrupt_handler(self, handler):
+        if handler in self.interrupt_handlers:
+            self.interrupt_handlers.remove(handler)
+
+    def _interrupt(self):
+        for handler in self.interrupt_handlers:
+            handler()
+
+    def plug_in(self):
+        with self.lock:
+            self.update()
+            self.input_plugged_in = True
+        self._interrupt()
+
+    def unplug(self):
+        with self.lock:
+            self.update()
+            self.input_plugged_in = False
+        self._interrupt()
+
+    def press_button(self, state):
+        '''
+        Latch a button state, as the firmware does until it is reset over the bus.
+
+        Args:
+            state (int): Button state, see ButtonState.
+        '''
+        with self.lock:
+            self.power_btn = int(state)
+            if self.power_btn == BUTTON_LONG_PRESS_5S:
+                self.button_shutdown = True
+        self._interrupt()
+
+    def update(self):
+        '''
+        Advance the simulation to now.
+        '''
+        with self.lock:
+            now = time.monotonic()
+            dt = (now - self.last_update) * self.time_scale
+            self.last_update = now
+            self._step(dt)
+
+    def _step(self, dt):
+        input_present = self.input_plugged_in and self.vbus_enabled
+        percentage = self.battery_percentage
+        has_battery = self.battery_enabled and self.charge > 0
+
+        if self.output_enabled and (input_present or has_battery):
+            self.output_voltage = OUTPUT_VOLTAGE
+            self.output_current = self.load_current
+        else:
+            self.output_voltage = 0
+            self.output_current = 0
+        load_power = self.output_voltage * self.output_current / 1000 # mW
+
+        open_voltage = ocv(percentage)
+        if input_present:
+            charge_current = 0
+            if self.battery_enabled and percentage < 100:
+                charge_current = self.max_charge_current
+                if percentage > CC_CV_KNEE:
+                    # Constant voltage phase, current tapers down to full
+                    charge_current *= (100 - percentage) / (100 - CC_CV_KNEE)
+            self.battery_current = charge_current
+            self.battery_voltage = open_voltage + charge_current * INTERNAL_RESISTANCE
+            charge_power = self.battery_voltage * charge_current / 1000 # mW
+            self.input_voltage = INPUT_VOLTAGE
+            self.input_current = (load_power + charge_power) / EFFICIENCY * 1000 / INPUT_VOLTAGE
+            self.power_source = POWER_SOURCE_EXTERNAL
+        else:
+            discharge_current = 0
+            if has_battery:
+                discharge_current = load_power / EFFICIENCY * 1000 / open_voltage
+            self.battery_current = -discharge_current
+            self.battery_voltage = open_voltage - discharge_current * INTERNAL_RESISTANCE
+            self.input_voltage = 0
+            self.input_current = 0
+            self.power_source = POWER_SOURCE_BATTERY
+
+        self.charge += self.battery_current * dt / 3600
+        self.charge = max(0, min(self.capacity, self.charge))
+
+        if self.button_shutdown:
+            self.shutdown_request = SHUTDOWN_REQUEST_BUTTON
+        elif not input_present and self.battery_percentage < self.shutdown_percentage:
+            self.shutdown_request = SHUTDOWN_REQUEST_LOW_BATTERY
+        elif not input_present and self.battery_voltage < LOW_VOLTAGE_SHUTDOWN:
+            self.shutdown_request = SHUTDOWN_REQUEST_LOW_VOLTAGE
+        else:
+            self.shutdown_request = SHUTDOWN_REQUEST_NONE
+
+    def read_registers(self):
+        '''
+        Get raw register values by name.
+
+        Returns:
+            dict: Raw register values.
+        '''
+        with self.lock:
+            self.update()
+            voltage = int(round(self.battery_voltage))
+            return {
+                'input_voltage': int(round(self.input_voltage)),
+                'input_current': int(round(self.input_current)),
+                'output_voltage': int(round(self.output_voltage)),
+                'output_current': int(round(self.output_current)),
+                'battery_voltage': voltage,
+                'battery_current': int(round(self.battery_current)),
+                'battery_percentage': int(self.battery_percentage),
+                'battery_capacity': int(round(self.charge)),
+                'power_source': self.power_source,
+                'is_input_plugged_in': int(self.input_plugged_in),
+                'is_battery_plugged_in': int(self.battery_enabled),
+                'is_charging': int(self.battery_current > 0),
+                'shutdown_request': self.shutdown_request,
+                'battery_1_voltage': voltage // 2,
+                'battery_2_voltage': voltage - voltage // 2,
+                'firmware_version': tuple(self.firmware_version),
+                'default_on': int(self.default_on),
+                'shutdown_percentage': self.shutdown_percentage,
+                'buzzer_volume': self.buzzer_volume,
+                'power_btn': self.power_btn,
+                'max_charge_current': self.max_charge_current // 100,
+            }
+
+    def write_register(self, name, value):
+        '''
+        Apply a register write, values out of range are ignored like the firmware does.
+
+        Args:
+            name (str): Register name.
+            value (int): Raw value.
+        '''
+        with self.lock:
+            self.update()
+            if name == 'shutdown_percentage':
+                if 10 <= value <= 100:
+                    self.shutdown_percentage = value
+            elif name == 'default_on':
+                self.default_on = bool(value)
+            elif name == 'buzzer_volume':
+                if 0 <= value <= 10:
+                    self.buzzer_volume = value
+            elif name == 'buzzer_freq':
+                self.buzzer_freq = value
+            elif name == 'power_btn':
+                self.power_btn = BUTTON_RELEASED
+
+    def advanced_command(self, command, arg):
+        '''
+        Run an advanced command.
+
+        Args:
+            command (str): Command, 'rst', 'vbus_en', 'bat_en', 'output_en' or 'enter_iap'.
+            arg (int): Command argument.
+
+        Returns:
+            bool: True if the command is accepted.
+        '''
+        with self.lock:
+            self.update()
+            if command == 'rst':
+                self.vbus_enabled = True
+                self.battery_enabled = True
+                self.output_enabled = True
+                self.button_shutdown = False
+                self.power_btn = BUTTON_RELEASED
+            elif command == 'vbus_en':
+                self.vbus_enabled = bool(arg)
+            elif command == 'bat_en':
+                self.battery_enabled = bool(arg)
+            elif command == 'output_en':
+                self.output_enabled = bool(arg)
+            elif command == 'enter_iap':
+                self.in_iap = True
+            else:
+                return False
+            self._step(0)
+            return True
+
+class SimulatedBus():
+    def __init__(self, board, device):
+        '''
+        Simulated I2C bus, same interface as the spc I2C object.
+
+        Reads are served from the register map of the device, filled from the
+        simulated board, and writes to known write registers go to the board,
+        so the device and spc code above the bus is the same as on hardware.
+
+        Args:
+            board (SimulatedBoard): Simulated board.
+            device (PiPower5): Device the register map is taken from.
+        '''
+        self.board = board
+        self.device = device
+        self.memory = bytearray(256)
+        self.adv_cmd_status = 0
+        self.transactions = 0
+        self.bytes = 0
+        self.errors = 0
+        self.write_registers = {}
+        for constant, name in WRITE_REGISTERS.items():
+            address = getattr(device, constant, None)
+            if address is not None:
+                self.write_registers[address] = name
+        self.advanced_commands = {
+            device.ADV_CMD_RST: 'rst',
+            device.ADV_CMD_VBUS_EN: 'vbus_en',
+            device.ADV_CMD_BAT_EN: 'bat_en',
+            device.ADV_CMD_OUPUT_EN: 'output_en',
+            device.ADV_CMD_ENTER_IAP: 'enter_iap',
+        }
+
+    def _transfer(self, length):
+        self.transactions += 1
+        self.bytes += length
+        delay = self.board.latency
+        if self.board.bus_speed:
+            # address, register and data bytes, 9 clocks each
+            delay += (length + 2) * 9 / self.board.bus_speed
+        if delay > 0:
+            time.sleep(delay)
+        if self.board.bus_down or (self.board.error_rate > 0 and random.random() < self.board.error_rate):
+            self.errors += 1
+            raise OSError(121, 'Remote I/O error')
+
+    def _render(self):
+        values = self.board.read_registers()
+        for name, register in self.device.REGISTERS.items():
+            value = values[name]
+            if isinstance(value, tuple):
+                struct.pack_into(register.format, self.memory, register.address, *value)
+            else:
+                struct.pack_into(register.format, self.memory, register.address, value)
+
+    def is_ready(self):
+        return True
+
+    def read_byte(self):
+        self._transfer(1)
+        status = self.adv_cmd_status
+        self.adv_cmd_status = 0
+        return status
+
+    def read_byte_data(self, reg):
+        self._transfer(1)
+        self._render()
+        return self.memory[reg]
+
+    def read_word_data(self, reg):
+        self._transfer(2)
+        self._render()
+        return self.memory[reg] | self.memory[reg + 1] << 8
+
+    def read_block_data(self, reg, num):
+        self._transfer(num)
+        self._render()
+        return list(self.memory[reg:reg + num])
+
+    def write_byte_data(self, reg, data):
+        self._transfer(1)
+        self._write(reg, data)
+
+    def write_word_data(self, reg, data):
+        self._transfer(2)
+        self._write(reg, data)
+
+    def write_block_data(self, reg, data):
+        self._transfer(len(data))
+        if reg == self.device.ADV_CMD_START:
+            if len(data) == 3 and data[2] == self.device.ADV_CMD_END \
+                    and data[0] in self.advanced_commands \
+                    and self.board.advanced_command(self.advanced_commands[data[0]], data[1]):
+                self.adv_cmd_status = self.device.ADV_CMD_OK
+            else:
+                self.adv_cmd_status = self.device.ADV_CMD_ERR
+        else:
+            self._write(reg, int.from_bytes(bytes(data), 'big'))
+
+    def _write(self, reg, value):
+        # Writes to unknown registers are dropped, like the firmware does
+        if reg in self.write_registers:
+            self.board.write_register(self.write_registers[reg], value)
@@ -0,0 +1,215 @@
+import time
+from .metrics import Histogram
+
+# Time spent in a state before leaving it, in seconds
+DWELL_BUCKETS = [1, 5, 10, 30, 60, 300, 600, 1800, 3600, 6 * 3600, 24 * 3600]
+
+ANY = '*'
+
+class State():
+    def __init__(self, name, action=None, repeat=None):
+        '''
+        State of a region.
+
+        Args:
+            name (str): State name.
+            action (function, optional): Called with the data on entering the state.
+            repeat (float, optional): Call the action again every repeat seconds
+                while staying in the state.
+        '''
+        self.name = name
+        self.action = action
+        self.repeat = repeat
+
+class Transition():
+    def __init__(self, source, target, guard, hold=0, action=None):
+        '''
+        Transition between states of a region.
+
+        Args:
+            source (str): Source state, None for the initial transition on the
+                first update, ANY for every other state.
+            target (str): Target state.
+            guard (function): Called with the data, the transition is taken
+                once it returns True on every update for hold seconds.
+            hold (float, optional): Debounce time in seconds. Defaults to 0.
+            action (function, optional): Called with the data when the
+                transition is taken, before the action of the target state.
+        '''
+        self.source = source
+        self.target = target
+        self.guard = guard
+        self.hold = hold
+        self.action = action
+        self.key = None
+        self.pending_since = None
+
+        self.count = 0
+        self.last_time = None
+        self.dwell = Histogram(DWELL_BUCKETS)
+
+class Region():
+    def __init__(self, name, states, transitions):
+        '''
+        Independent part of the state machine, in one state at a time.
+
+        Transitions are indexed by source state, so an update only evaluates
+        the transitions leaving the current state.
+
+        Args:
+            name (str): Region name.
+            states (list): List of State.
+            transitions (list): List of Transition.
+        '''
+        self.name = name
+        self.states = {state.name: state for state in states}
+        self.live = {None: []}
+        for state in self.states:
+            self.live[state] = []
+        for transition in transitions:
+            for name in [transition.source, transition.target]:
+                if name not in self.live and name != ANY:
+                    raise ValueError(f"Unknown state {name} in region {self.name}")
+            sources = [state for state in self.states if state != transition.target] \
+                if transition.source == ANY else [transition.source]
+            transition.key = f'{transition.source or "initial"}->{transition.target}'
+            for source in sources:
+                self.live[source].append(transition)
+
+        self.state = None
+        self.since = None
+        self.last_action = None
+
+    def update(self, data, now):
+        '''
+        Evaluate the live transitions and take the first one whose guard held long enough.
+
+        Args:
+            data (dict): Data of the tick.
+            now (float): Monotonic time.
+
+        Returns:
+            Transition: Transition taken, or None.
+        '''
+        for transition in self.live[self.state]:
+            if not transition.guard(data):
+                transition.pending_since = None
+                continue
+            if transition.pending_since is None:
+                transition.pending_since = now
+            if self.state is not None and now - transition.pending_since < transition.hold:
+                continue
+            self._take(transition, data, now)
+            return transition
+
+        state = self.states.get(self.state)
+        if state is not None and state.action and state.repeat is not None \
+                and now - self.last_action >= state.repeat:
+            self.last_action = now
+            state.action(data)
+        return None
+
+    def _take(self, transition, data, now):
+        for pending in self.live[self.state]:
+            pending.pending_since = None
+        if self.since is not None:
+            transition.dwell.observe(now - self.since)
+        transition.count += 1
+        transition.last_time = time.time()
+        self.state = transition.target
+        self.since = now
+        self.last_action = now
+        if transition.action:
+            transition.action(data)
+        state = self.states[self.state]
+        if state.action:
+            state.action(data)
+
+    def next_deadline(self):
+        '''
+        Get when the earliest pending hold completes.
+
+        Returns:
+            float: Monotonic time, None if no transition is pending.
+        '''
+        deadlines = [transition.pending_since + transition.hold for transition in self.live[self.state]
+                     if transition.pending_since is not None]
+        return min(deadlines) if deadlines else None
+
+class StateMachine():
+    def __init__(self, regions, log=None):
+        '''
+        Event state machine made of independent regions, updated on every tick
+        in the given order, so guards can look at the state of earlier regions.
+
+        Args:
+            regions (list): List of Region.
+        '''
+        self.regions = {region.name: region for region in regions}
+        self.log = log
+        self.evaluate_time = Histogram()
+
+    def __getitem__(self, name):
+        return self.regions[name]
+
+    def state(self, name):
+        return self.regions[name].state
+
+    def update(self, data, regions=None):
+        '''
+        Update regions with the data of a tick.
+
+        Args:
+            data (dict): Data of the tick.
+            regions (list, optional): Names of the regions to update. Defaults to all.
+        '''
+        start = time.monotonic()
+        for name, region in self.regions.items():
+            if regions is not None and name not in regions:
+                continue
+            previous = region.state
+            transition = region.update(data, start)
+            if transition is not None and self.log:
+                self.log.debug(f'{name}: {previous} -> {transition.target}')
+        self.evaluate_time.observe(time.monotonic() - start)
+
+    def next_deadline(self):
+        '''
+        Get when the earliest pending hold of any region completes.
+
+        Returns:
+            float: Monotonic time, None if no transition is pending.
+        '''
+        deadlines = [region.next_deadline() for region in self.regions.values()]
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        return min(deadlines) if deadlines else None
+
+    def get_stats(self):
+        '''
+        Get current states and transition stats.
+
+        Returns:
+            dict: Per region, state, seconds in it and per transition count,
+                last wall clock time and dwell time histogram, plus the
+                evaluation time histogram.
+        '''
+        now = time.monotonic()
+        regions = {}
+        for name, region in self.regions.items():
+            transitions = {}
+            for live in region.live.values():
+                for transition in live:
+                    transitions[transition.key] = {
+                        'count': transition.count,
+                        'last_time': transition.last_time,
+                        'dwell': transition.dwell.to_dict(),
+                    }
+            regions[name] = {
+                'state': region.state,
+                'time_in_state': now - region.since if region.since is not None else 0,
+                'transitions': transitions,
+            }
+        return {
+            'regions': regions,
+            'evaluate_time': self.evaluate_time.to_dict(),
+        }
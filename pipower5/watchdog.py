@@ -0,0 +1,234 @@
+import os
+import sys
+import time
+import socket
+import logging
+import threading
+import traceback
+
+DEFAULT_DEADLINE = 30 # seconds without a heartbeat before a loop counts as stalled
+DEFAULT_MAX_RESTARTS = 3 # restarts of a loop within RESTART_WINDOW before giving up
+RESTART_WINDOW = 600 # seconds
+CHECK_INTERVAL = 1 # seconds
+
+def sd_notify(state):
+    '''
+    Send a state to systemd, like READY=1 or WATCHDOG=1.
+
+    Args:
+        state (str): Newline separated assignments, see sd_notify(3).
+
+    Returns:
+        bool: True if sent, False if not run by systemd.
+    '''
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return False
+    if address.startswith('@'):
+        # Abstract namespace
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC) as sock:
+            sock.sendto(state.encode(), address)
+    except OSError:
+        return False
+    return True
+
+def get_watchdog_interval():
+    '''
+    Get the systemd watchdog timeout set by WatchdogSec.
+
+    Returns:
+        float: Timeout in seconds, None if the watchdog is off.
+    '''
+    usec = os.environ.get('WATCHDOG_USEC')
+    pid = os.environ.get('WATCHDOG_PID')
+    if not usec or (pid and int(pid) != os.getpid()):
+        return None
+    return int(usec) / 1000000
+
+class Heart():
+    def __init__(self, name, target, deadline):
+        '''
+        Heartbeat record of a watched loop.
+
+        Args:
+            name (str): Loop name, for logs and stats.
+            target (object): Loop owner, with last_beat, loop_thread and restart().
+            deadline (float or function): Seconds without a heartbeat before the
+                loop is stalled, or a function returning them.
+        '''
+        self.name = name
+        self.target = target
+        self.deadline = deadline
+        # Watched or last restarted, a loop gets a full deadline to beat from then
+        self.since = time.monotonic()
+        self.stalls = 0
+        self.restarts = []
+        self.stalled_since = None
+        self.max_silence = 0
+
+    def get_deadline(self):
+        if callable(self.deadline):
+            return self.deadline()
+        return self.deadline
+
+    def silence(self, now):
+        last_beat = self.target.last_beat
+        if last_beat is None or last_beat < self.since:
+            return now - self.since
+        return now - last_beat
+
+    def get_stats(self, now):
+        return {
+            'deadline': self.get_deadline(),
+            'silence': round(self.silence(now), 3),
+            'max_silence': round(self.max_silence, 3),
+            'stalls': self.stalls,
+            'restarts': len(self.restarts),
+            'stalled': self.stalled_since is not None,
+        }
+
+class Watchdog():
+    def __init__(self, max_restarts=DEFAULT_MAX_RESTARTS, log=None):
+        '''
+        Loop stall watchdog, feeding the systemd watchdog while all loops beat.
+
+        Each watched loop stamps its last_beat with the monotonic time as it
+        makes progress. A loop silent past its deadline, blocked or ended by
+        an exception, gets the stacks of all threads dumped to the log and is
+        restarted. A loop that keeps stalling after max_restarts within
+        RESTART_WINDOW is given up on: WATCHDOG=1 is no longer sent, so
+        systemd restarts the whole process when WatchdogSec is set.
+
+        Args:
+            max_restarts (int, optional): Restarts of a loop within RESTART_WINDOW
+                before giving up. Defaults to 3.
+        '''
+        self.max_restarts = max_restarts
+        self.log = log or logging.getLogger(__name__)
+        self.hearts = []
+        self.thread = None
+        self.running = False
+        self.healthy = True
+        self.feeds = 0
+        self.sd_interval = get_watchdog_interval()
+        self.last_feed = 0
+
+    def watch(self, name, target, deadline=DEFAULT_DEADLINE):
+        '''
+        Watch a loop.
+
+        Args:
+            name (str): Loop name.
+            target (object): Loop owner, with a last_beat monotonic time (None
+                until the loop starts), a loop_thread and a restart() method.
+            deadline (float or function, optional): Seconds without a heartbeat
+                before the loop is stalled, or a function returning them, for a
+                loop whose period is configurable. Defaults to 30.
+        '''
+        self.hearts.append(Heart(name, target, deadline))
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        if self.sd_interval is not None:
+            self.log.info(f"systemd watchdog enabled, timeout {self.sd_interval} s")
+        sd_notify('READY=1')
+        self.thread = threading.Thread(target=self._loop, name='pipower5-watchdog', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        sd_notify('STOPPING=1')
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
+        self.thread = None
+
+    def _loop(self):
+        while self.running:
+            now = time.monotonic()
+            healthy = True
+            for heart in self.hearts:
+                if not self._check(heart, now):
+                    healthy = False
+            if healthy != self.healthy:
+                self.healthy = healthy
+                if healthy:
+                    self.log.info("All loops beating again, feeding the systemd watchdog")
+            if self.healthy:
+                self._feed(now)
+            time.sleep(CHECK_INTERVAL)
+
+    def _feed(self, now):
+        if self.sd_interval is None:
+            return
+        if now - self.last_feed < self.sd_interval / 2:
+            return
+        if sd_notify('WATCHDOG=1'):
+            self.feeds += 1
+        self.last_feed = now
+
+    def _check(self, heart, now):
+        # Returns False when the loop is given up on
+        silence = heart.silence(now)
+        heart.max_silence = max(heart.max_silence, silence)
+        if silence < heart.get_deadline():
+            last_beat = heart.target.last_beat
+            if heart.stalled_since is not None and last_beat is not None and last_beat > heart.stalled_since:
+                self.log.info(f"{heart.name} loop recovered after {last_beat - heart.stalled_since:.1f} s")
+                heart.stalled_since = None
+            return True
+        if heart.stalled_since is None:
+            heart.stalled_since = now
+        heart.restarts = [t for t in heart.restarts if now - t < RESTART_WINDOW]
+        if len(heart.restarts) >= self.max_restarts:
+            if self.healthy:
+                self.log.critical(f"{heart.name} loop still stalled after {len(heart.restarts)} restarts, leaving it to systemd")
+            return False
+        self.log.error(f"{heart.name} loop stalled, no heartbeat for {silence:.1f} s, restarting it")
+        self.dump_stacks(heart.target.loop_thread)
+        heart.stalls += 1
+        heart.restarts.append(now)
+        heart.since = now
+        try:
+            heart.target.restart()
+        except Exception as e:
+            self.log.error(f"Failed to restart {heart.name} loop: {e}")
+        return True
+
+    def dump_stacks(self, stalled_thread=None):
+        '''
+        Log the stack of every thread, the stalled loop thread first.
+
+        Args:
+            stalled_thread (threading.Thread, optional): Thread of the stalled loop.
+        '''
+        frames = sys._current_frames()
+        threads = {thread.ident: thread for thread in threading.enumerate()}
+        idents = sorted(frames, key=lambda ident: stalled_thread is None or ident != stalled_thread.ident)
+        for ident in idents:
+            thread = threads.get(ident)
+            name = thread.name if thread else ident
+            stack = ''.join(traceback.format_stack(frames[ident]))
+            if stalled_thread is not None and ident == stalled_thread.ident:
+                self.log.error(f"Stalled thread {name}:\n{stack}")
+            else:
+                self.log.debug(f"Thread {name}:\n{stack}")
+
+    def get_stats(self):
+        '''
+        Get watchdog stats.
+
+        Returns:
+            dict: healthy, systemd watchdog timeout and feeds, and per loop
+                deadline, current and max silence, stalls and restarts.
+        '''
+        now = time.monotonic()
+        return {
+            'healthy': self.healthy,
+            'systemd_timeout': self.sd_interval,
+            'feeds': self.feeds,
+            'loops': {heart.name: heart.get_stats(now) for heart in self.hearts},
+        }
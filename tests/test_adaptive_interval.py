@@ -0,0 +1,81 @@
+import pytest
+
+from pipower5 import adaptive_interval
+from pipower5.adaptive_interval import AdaptiveInterval, PollState
+
+def make_data(plugged=True, power_source=0, charging=False, percentage=80, shutdown_percentage=10):
+    return {
+        'is_input_plugged_in': plugged,
+        'power_source': power_source,
+        'is_charging': charging,
+        'battery_percentage': percentage,
+        'shutdown_percentage': shutdown_percentage,
+    }
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(adaptive_interval.time, 'monotonic', lambda: now[0])
+    return now
+
+def settle(interval, clock, data, shutdown_request=0):
+    # Past the hold time with unchanged signals
+    interval.update(data, shutdown_request, 0)
+    clock[0] += interval.hold_time
+    return interval.update(data, shutdown_request, 0)
+
+def test_change_drops_to_min_interval(clock):
+    interval = AdaptiveInterval()
+    assert interval.update(make_data(), 0, 0) == interval.min_interval
+    clock[0] += 9.9
+    assert interval.update(make_data(), 0, 0) == interval.min_interval
+    clock[0] += 0.1
+    assert interval.update(make_data(), 0, 0) > interval.min_interval
+
+def test_mains_polls_at_battery_interval_without_interrupts(clock):
+    interval = AdaptiveInterval()
+    assert settle(interval, clock, make_data()) == 1
+    assert interval.state == PollState.MAINS
+    interval.interrupt_enabled = True
+    assert interval.update(make_data(), 0, 0) == 5
+
+def test_states(clock):
+    interval = AdaptiveInterval()
+    assert settle(interval, clock, make_data(plugged=False, power_source=1)) == 1
+    assert interval.state == PollState.BATTERY
+    assert settle(interval, clock, make_data(plugged=False, power_source=1, percentage=15)) == 0.5
+    assert interval.state == PollState.LOW_BATTERY
+    assert settle(interval, clock, make_data(plugged=False, power_source=1), shutdown_request=1) == 0.2
+    assert interval.state == PollState.SHUTDOWN_PENDING
+
+def test_low_battery_hysteresis(clock):
+    interval = AdaptiveInterval()
+    interval.update(make_data(plugged=False, power_source=1, percentage=19), 0, 0)
+    assert interval.state == PollState.LOW_BATTERY
+    # Inside the hysteresis band, stays low
+    interval.update(make_data(plugged=False, power_source=1, percentage=24), 0, 0)
+    assert interval.state == PollState.LOW_BATTERY
+    interval.update(make_data(plugged=False, power_source=1, percentage=25), 0, 0)
+    assert interval.state == PollState.BATTERY
+
+def test_button_resets_hold(clock):
+    interval = AdaptiveInterval()
+    settle(interval, clock, make_data())
+    assert interval.update(make_data(), 0, 1) == interval.min_interval
+
+def test_interval_is_clamped(clock):
+    interval = AdaptiveInterval(intervals={PollState.MAINS: 60}, max_interval=3)
+    interval.interrupt_enabled = True
+    assert settle(interval, clock, make_data()) == 3
+
+def test_bounds():
+    interval = AdaptiveInterval()
+    assert interval.check_bounds(max_interval=10) == (0.2, 10)
+    # Checking doesn't apply
+    assert interval.max_interval == 5
+    with pytest.raises(ValueError):
+        interval.check_bounds(min_interval=0)
+    with pytest.raises(ValueError):
+        interval.check_bounds(min_interval=6)
+    interval.set_bounds(0.5, 2)
+    assert (interval.min_interval, interval.max_interval) == (0.5, 2)
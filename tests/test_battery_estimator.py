@@ -0,0 +1,68 @@
+import math
+
+import pytest
+
+from pipower5.battery_estimator import BatteryEstimator
+
+def test_no_samples_is_unknown():
+    estimator = BatteryEstimator(1000)
+    assert estimator.time_to_empty(50) == (math.inf, math.inf, math.inf)
+    assert estimator.time_to_full(50) == (math.inf, math.inf, math.inf)
+
+def test_steady_discharge():
+    estimator = BatteryEstimator(1000)
+    for i in range(10):
+        estimator.update(-500, now=i)
+    assert estimator.mean == -500
+    assert estimator.std == 0
+    assert estimator.time_to_empty(50) == (1, 1, 1)
+    assert estimator.time_to_empty(50, floor=25) == (0.5, 0.5, 0.5)
+    assert estimator.time_to_full(50)[0] == math.inf
+
+def test_steady_charge():
+    estimator = BatteryEstimator(1000)
+    estimator.update(250, now=0)
+    assert estimator.time_to_full(75) == (1, 1, 1)
+    assert estimator.time_to_empty(75)[0] == math.inf
+
+def test_weight_follows_time():
+    estimator = BatteryEstimator(1000, time_constant=60)
+    estimator.update(-100, now=0)
+    estimator.update(-200, now=60)
+    assert estimator.mean == pytest.approx(-100 - 100 * (1 - math.exp(-1)))
+    # Two half steps weigh the same as one full step
+    split = BatteryEstimator(1000, time_constant=60)
+    split.update(-100, now=0)
+    split.update(-200, now=30)
+    split.update(-200, now=60)
+    assert split.mean == pytest.approx(estimator.mean)
+
+def test_direction_change_restarts():
+    estimator = BatteryEstimator(1000)
+    for i in range(5):
+        estimator.update(300, now=i)
+    estimator.update(-400, now=5)
+    assert estimator.mean == -400
+    assert estimator.variance == 0
+
+def test_idle_current_does_not_restart():
+    estimator = BatteryEstimator(1000)
+    estimator.update(-300, now=0)
+    estimator.update(5, now=60)
+    assert -300 < estimator.mean < 5
+    assert estimator.time_to_empty(50)[0] < math.inf
+
+def test_noisy_current_widens_the_interval():
+    estimator = BatteryEstimator(1000)
+    for i in range(100):
+        estimator.update(-400 if i % 2 else -600, now=i * 10)
+    estimate, low, high = estimator.time_to_empty(50)
+    assert estimator.std > 0
+    assert low < estimate < high
+
+def test_reset():
+    estimator = BatteryEstimator(1000)
+    estimator.update(-500, now=0)
+    estimator.reset()
+    assert estimator.samples == 0
+    assert estimator.time_to_empty(50)[0] == math.inf
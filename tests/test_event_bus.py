@@ -0,0 +1,134 @@
+import asyncio
+import threading
+
+from pipower5.event_bus import EventBus, UNBOUNDED
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def settle(bus):
+    # Let the subscriber tasks and executor calls finish
+    for _ in range(50):
+        await asyncio.sleep(0.01)
+        if all(subscriber.task is None for subscribers in bus.subscribers.values() for subscriber in subscribers):
+            return
+
+def test_delivers_in_order_to_every_subscriber():
+    async def main():
+        bus = EventBus()
+        got_async, got_sync = [], []
+
+        async def on_async(message):
+            got_async.append(message)
+
+        bus.subscribe('t', on_async)
+        bus.subscribe('t', got_sync.append)
+        bus.start(asyncio.get_running_loop())
+        for i in range(5):
+            bus.publish('t', i)
+        await settle(bus)
+        bus.stop()
+        return got_async, got_sync
+    got_async, got_sync = run(main())
+    assert got_async == [0, 1, 2, 3, 4]
+    assert got_sync == [0, 1, 2, 3, 4]
+
+def test_sync_handlers_run_off_the_loop():
+    async def main():
+        bus = EventBus()
+        threads = []
+        bus.subscribe('t', lambda message: threads.append(threading.current_thread()))
+        bus.start(asyncio.get_running_loop())
+        bus.publish('t', 1)
+        await settle(bus)
+        bus.stop()
+        return threads
+    assert run(main())[0] is not threading.current_thread()
+
+def test_full_queue_drops_oldest():
+    bus = EventBus()
+    subscriber = bus.subscribe('t', lambda message: None, max_queue=2)
+    for i in range(4):
+        bus.publish('t', i)
+    assert [message for _, message in subscriber.queue] == [2, 3]
+    assert subscriber.dropped == 2
+
+def test_unbounded_queue_never_drops():
+    bus = EventBus()
+    subscriber = bus.subscribe('t', lambda message: None, max_queue=UNBOUNDED)
+    for i in range(100):
+        bus.publish('t', i)
+    assert len(subscriber.queue) == 100
+    assert subscriber.dropped == 0
+
+def test_messages_before_start_are_kept():
+    async def main():
+        bus = EventBus()
+        got = []
+        bus.subscribe('t', got.append)
+        bus.publish('t', 'early')
+        bus.start(asyncio.get_running_loop())
+        await settle(bus)
+        bus.stop()
+        return got
+    assert run(main()) == ['early']
+
+def test_failing_handler_is_counted_and_others_go_on():
+    async def main():
+        bus = EventBus()
+        got = []
+
+        def fail(message):
+            raise RuntimeError('nope')
+
+        failing = bus.subscribe('t', fail)
+        bus.subscribe('t', got.append)
+        bus.start(asyncio.get_running_loop())
+        bus.publish('t', 1)
+        bus.publish('t', 2)
+        await settle(bus)
+        bus.stop()
+        return failing, got
+    failing, got = run(main())
+    assert failing.errors == 2
+    assert got == [1, 2]
+
+def test_detach_keeps_queued_messages_for_the_next_start():
+    async def main():
+        bus = EventBus()
+        got = []
+        release = asyncio.Event()
+
+        async def slow(message):
+            await release.wait()
+            got.append(message)
+
+        bus.subscribe('t', slow)
+        bus.start(asyncio.get_running_loop())
+        for i in range(3):
+            bus.publish('t', i)
+        await asyncio.sleep(0.01)
+        # Detached while the first message is being handled
+        tasks = bus.detach()
+        release.set()
+        await asyncio.gather(*tasks)
+        pending = [message for _, message in bus.subscribers['t'][0].queue]
+        bus.start(asyncio.get_running_loop())
+        await settle(bus)
+        bus.stop()
+        return pending, got
+    pending, got = run(main())
+    assert pending == [1, 2]
+    assert got == [0, 1, 2]
+
+def test_unsubscribe_and_stats():
+    def handler(message):
+        pass
+    bus = EventBus()
+    subscriber = bus.subscribe('t', handler)
+    assert bus.has_subscribers('t')
+    assert bus.get_stats()['t test_unsubscribe_and_stats.<locals>.handler']['pending'] == 0
+    bus.unsubscribe(subscriber)
+    assert not bus.has_subscribers('t')
+    bus.publish('t', 1)
+    assert len(subscriber.queue) == 0
@@ -0,0 +1,106 @@
+import threading
+
+import pytest
+
+from pipower5.power_loss_hooks import PowerLossHooks
+
+class Calls():
+    def __init__(self):
+        self.calls = []
+        self.done = threading.Event()
+
+    def __call__(self, name):
+        def call(since):
+            self.calls.append((name, since, threading.current_thread()))
+            self.done.set()
+        return call
+
+    def wait(self):
+        assert self.done.wait(2)
+        self.done.clear()
+
+@pytest.fixture
+def hooks():
+    hooks = PowerLossHooks()
+    yield hooks
+    hooks.close()
+
+def test_loss_fires_hooks_off_the_caller(hooks):
+    calls = Calls()
+    hooks.add('sync', calls('loss'))
+    hooks.lost(10.0)
+    calls.wait()
+    name, since, thread = calls.calls[0]
+    assert (name, since) == ('loss', 10.0)
+    assert thread is not threading.current_thread()
+    assert hooks.get_stats()['hooks']['sync']['fired'] == 1
+
+def test_repeated_loss_fires_once(hooks):
+    calls = Calls()
+    hooks.add('sync', calls('loss'))
+    hooks.lost(1.0)
+    hooks.lost(2.0)
+    calls.wait()
+    hooks.executor.shutdown(wait=True)
+    assert len(calls.calls) == 1
+    assert hooks.losses == 1
+
+def test_restore_before_confirm_cancels_off_the_caller(hooks):
+    calls = Calls()
+    hooks.add('sync', calls('loss'), calls('cancel'))
+    hooks.lost(1.0)
+    calls.wait()
+    # The loss call is done, the cancel must still not run on this thread
+    hooks.restored(2.0)
+    calls.wait()
+    name, since, thread = calls.calls[1]
+    assert (name, since) == ('cancel', 2.0)
+    assert thread is not threading.current_thread()
+    assert hooks.false_alarms == 1
+    assert hooks.get_stats()['hooks']['sync']['cancelled'] == 1
+
+def test_cancel_runs_after_a_slow_loss_call(hooks):
+    order = []
+    release = threading.Event()
+    cancelled = threading.Event()
+
+    def on_loss(since):
+        release.wait(2)
+        order.append('loss')
+
+    def on_cancel(since):
+        order.append('cancel')
+        cancelled.set()
+
+    hooks.add('slow', on_loss, on_cancel)
+    hooks.lost(1.0)
+    hooks.restored(2.0)
+    release.set()
+    assert cancelled.wait(2)
+    assert order == ['loss', 'cancel']
+
+def test_restore_after_confirm_does_not_cancel(hooks):
+    calls = Calls()
+    hooks.add('sync', calls('loss'), calls('cancel'))
+    hooks.lost(1.0)
+    calls.wait()
+    hooks.confirm()
+    hooks.restored(2.0)
+    hooks.executor.shutdown(wait=True)
+    assert [name for name, _, _ in calls.calls] == ['loss']
+    assert hooks.false_alarms == 0
+    # Ready for the next loss
+    assert hooks.pending is None
+
+def test_failing_hook_is_counted(hooks):
+    done = threading.Event()
+
+    def fail(since):
+        done.set()
+        raise RuntimeError('nope')
+
+    hooks.add('fail', fail)
+    hooks.lost(1.0)
+    assert done.wait(2)
+    hooks.executor.shutdown(wait=True)
+    assert hooks.get_stats()['hooks']['fail']['errors'] == 1
@@ -0,0 +1,83 @@
+import pytest
+
+from pipower5 import register_cache
+from pipower5.register_cache import RegisterCache, CachePolicy
+
+class Reader():
+    def __init__(self, value=1):
+        self.value = value
+        self.reads = 0
+
+    def __call__(self):
+        self.reads += 1
+        return self.value
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(register_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+def test_no_policy_always_reads():
+    cache = RegisterCache()
+    read = Reader()
+    cache.get('a', read)
+    cache.get('a', read)
+    assert read.reads == 2
+    assert cache.get_stats()['hits'] == 0
+
+def test_live_never_caches():
+    cache = RegisterCache()
+    cache.set_policy('a', CachePolicy.LIVE)
+    read = Reader()
+    cache.put('a', 5)
+    assert cache.get('a', read) == 1
+    assert cache.get('a', read) == 1
+    assert read.reads == 2
+
+def test_static_until_invalidated():
+    cache = RegisterCache()
+    cache.set_policy('a', CachePolicy.STATIC)
+    read = Reader(7)
+    assert cache.get('a', read) == 7
+    read.value = 8
+    assert cache.get('a', read) == 7
+    cache.invalidate('a')
+    assert cache.get('a', read) == 8
+    assert read.reads == 2
+    assert cache.get_stats()['registers']['a'] == {'hits': 1, 'misses': 2}
+
+def test_ttl_expires(clock):
+    cache = RegisterCache()
+    cache.set_policy('a', CachePolicy.TTL, ttl=10)
+    read = Reader()
+    cache.get('a', read)
+    clock[0] += 9.9
+    cache.get('a', read)
+    assert read.reads == 1
+    clock[0] += 0.2
+    cache.get('a', read)
+    assert read.reads == 2
+
+def test_put_stores_written_value(clock):
+    cache = RegisterCache()
+    cache.set_policy('a', CachePolicy.TTL, ttl=10)
+    cache.put('a', 42)
+    read = Reader()
+    assert cache.get('a', read) == 42
+    assert read.reads == 0
+
+def test_invalidate_all():
+    cache = RegisterCache()
+    cache.set_policy('a', CachePolicy.STATIC)
+    cache.set_policy('b', CachePolicy.STATIC)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.invalidate()
+    read = Reader(3)
+    assert cache.get('a', read) == 3
+    assert cache.get('b', read) == 3
+
+def test_ttl_policy_needs_ttl():
+    with pytest.raises(ValueError):
+        RegisterCache().set_policy('a', CachePolicy.TTL)
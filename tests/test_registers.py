@@ -0,0 +1,63 @@
+import struct
+from enum import IntEnum
+
+import pytest
+
+from pipower5.registers import Register, RegisterDecoder
+
+class Mode(IntEnum):
+    OFF = 0
+    ON = 1
+
+REGISTERS = {
+    'voltage': Register(0, width=2, unit='mV'),
+    'current': Register(2, width=2, signed=True, unit='mA'),
+    'mode': Register(4, enum=Mode),
+    'plugged': Register(5, enum=bool),
+    'capacity': Register(8, width=2, scale=10, unit='mAh'),
+    'version': Register(40, count=3),
+    'far': Register(60),
+}
+
+def test_decode_skips_gaps_and_converts():
+    decoder = RegisterDecoder(REGISTERS, ['capacity', 'voltage', 'current', 'mode', 'plugged'])
+    assert decoder.start == 0
+    assert decoder.length == 10
+    buffer = struct.pack('<Hh??xxH', 5100, -250, True, True, 320)
+    data = decoder.decode(buffer)
+    assert data == {'voltage': 5100, 'current': -250, 'mode': Mode.ON, 'plugged': True, 'capacity': 3200}
+    assert isinstance(data['mode'], Mode)
+
+def test_decode_offset_and_version():
+    decoder = RegisterDecoder(REGISTERS, ['version'])
+    assert decoder.decode(b'\xff' + bytes([1, 2, 3]), offset=1) == {'version': '1.2.3'}
+
+def test_decode_into_sets_attributes():
+    class Record():
+        voltage = None
+        current = None
+    decoder = RegisterDecoder(REGISTERS, ['voltage', 'current'])
+    record = Record()
+    assert decoder.decode_into(record, struct.pack('<Hh', 4000, 12)) is record
+    assert (record.voltage, record.current) == (4000, 12)
+
+def test_unknown_enum_value_raises():
+    decoder = RegisterDecoder(REGISTERS, ['mode'])
+    with pytest.raises(ValueError):
+        decoder.decode(bytes([7]))
+
+def test_overlapping_registers_raise():
+    registers = {'a': Register(0, width=2), 'b': Register(1)}
+    with pytest.raises(ValueError):
+        RegisterDecoder(registers, ['a', 'b'])
+
+def test_split_at_gaps_and_length():
+    decoder = RegisterDecoder(REGISTERS, list(REGISTERS))
+    assert decoder.split(max_gap=8) == [['voltage', 'current', 'mode', 'plugged', 'capacity'], ['version'], ['far']]
+    assert decoder.split(max_gap=100) == [list(decoder.names)]
+    assert decoder.split(max_gap=100, max_length=32) == [['voltage', 'current', 'mode', 'plugged', 'capacity'], ['version', 'far']]
+
+def test_format_value():
+    assert REGISTERS['voltage'].format_value(5000) == '5000 mV'
+    assert REGISTERS['mode'].format_value(Mode.ON) == '1 - ON'
+    assert Register(0).format_value(3) == '3'
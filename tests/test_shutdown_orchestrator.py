@@ -0,0 +1,79 @@
+import math
+import time
+import asyncio
+
+from pipower5.shutdown_orchestrator import ShutdownOrchestrator, MIN_BUDGET, MAX_BUDGET, RUNTIME_SHARE
+
+def test_budget_is_a_share_of_the_runtime():
+    orchestrator = ShutdownOrchestrator(get_remaining_runtime=lambda: 40)
+    assert orchestrator.get_budget() == 40 * RUNTIME_SHARE
+
+def test_budget_is_clamped():
+    assert ShutdownOrchestrator(get_remaining_runtime=lambda: 1).get_budget() == MIN_BUDGET
+    assert ShutdownOrchestrator(get_remaining_runtime=lambda: 3600).get_budget() == MAX_BUDGET
+    assert ShutdownOrchestrator(get_remaining_runtime=lambda: math.inf).get_budget() == MAX_BUDGET
+
+def test_budget_without_estimate():
+    assert ShutdownOrchestrator().get_budget() == MAX_BUDGET
+    assert ShutdownOrchestrator(get_remaining_runtime=lambda: None).get_budget() == MAX_BUDGET
+    assert ShutdownOrchestrator(get_remaining_runtime=lambda: math.nan).get_budget() == MAX_BUDGET
+
+def test_budget_estimate_failure():
+    def fail():
+        raise RuntimeError('no estimate')
+    assert ShutdownOrchestrator(get_remaining_runtime=fail).get_budget() == MAX_BUDGET
+
+def test_hooks_run_concurrently_with_status():
+    orchestrator = ShutdownOrchestrator()
+    reasons = []
+
+    def slow(reason):
+        time.sleep(0.2)
+        reasons.append(reason)
+
+    async def slow_async(reason):
+        await asyncio.sleep(0.2)
+
+    def stuck(reason):
+        time.sleep(1)
+
+    def fail(reason):
+        raise RuntimeError('nope')
+
+    def timeout(reason):
+        raise TimeoutError('still queued')
+
+    orchestrator.add_hook('slow', slow)
+    orchestrator.add_hook('slow_async', slow_async)
+    orchestrator.add_hook('stuck', stuck, deadline=0.3)
+    orchestrator.add_hook('fail', fail)
+    orchestrator.add_hook('timeout', timeout)
+    start = time.monotonic()
+    result = asyncio.run(orchestrator.run('low_battery'))
+    elapsed = time.monotonic() - start
+
+    assert reasons == ['low_battery']
+    # Not waiting for the stuck hook, and the slow ones ran side by side
+    assert elapsed < 0.6
+    hooks = result['hooks']
+    assert hooks['slow']['status'] == 'done'
+    assert hooks['slow_async']['status'] == 'done'
+    assert hooks['stuck']['status'] == 'timeout'
+    assert hooks['fail']['status'] == 'failed: nope'
+    assert hooks['timeout']['status'] == 'timeout'
+    assert result['budget'] == MAX_BUDGET
+    assert orchestrator.last_run is result
+
+def test_budget_caps_hook_deadlines():
+    orchestrator = ShutdownOrchestrator()
+    orchestrator.add_hook('stuck', lambda reason: time.sleep(1), deadline=30)
+    result = asyncio.run(orchestrator.run('low_battery', budget=0.2))
+    assert result['budget'] == 0.2
+    assert result['hooks']['stuck']['status'] == 'timeout'
+    assert result['time'] < 0.6
+
+def test_remove_hook():
+    orchestrator = ShutdownOrchestrator()
+    orchestrator.add_hook('a', lambda reason: None)
+    orchestrator.remove_hook('a')
+    assert asyncio.run(orchestrator.run('button'))['hooks'] == {}
@@ -0,0 +1,93 @@
+import pytest
+
+from pipower5 import state_machine
+from pipower5.state_machine import StateMachine, Region, State, Transition, ANY
+
+def plugged(data):
+    return data['plugged']
+
+def unplugged(data):
+    return not data['plugged']
+
+def make_power_region(fired, hold=2, repeat=None):
+    return Region('power', [
+        State('plugged', lambda data: fired.append('plugged')),
+        State('unplugged', lambda data: fired.append('unplugged'), repeat=repeat),
+    ], [
+        Transition(None, 'plugged', plugged),
+        Transition(None, 'unplugged', unplugged),
+        Transition('plugged', 'unplugged', unplugged, hold=hold),
+        Transition('unplugged', 'plugged', plugged, hold=hold),
+    ])
+
+def test_initial_transition_ignores_hold():
+    fired = []
+    region = make_power_region(fired)
+    transition = region.update({'plugged': False}, 0)
+    assert transition.key == 'initial->unplugged'
+    assert region.state == 'unplugged'
+    assert fired == ['unplugged']
+
+def test_hold_debounces():
+    fired = []
+    region = make_power_region(fired)
+    region.update({'plugged': True}, 0)
+    assert region.update({'plugged': False}, 1) is None
+    assert region.next_deadline() == 3
+    # A bounce restarts the hold
+    region.update({'plugged': True}, 2)
+    assert region.next_deadline() is None
+    region.update({'plugged': False}, 3)
+    assert region.update({'plugged': False}, 4.9) is None
+    assert region.update({'plugged': False}, 5).key == 'plugged->unplugged'
+    assert fired == ['plugged', 'unplugged']
+
+def test_repeat_fires_again_while_in_state():
+    fired = []
+    region = make_power_region(fired, repeat=10)
+    region.update({'plugged': False}, 0)
+    region.update({'plugged': False}, 9)
+    region.update({'plugged': False}, 10)
+    region.update({'plugged': False}, 15)
+    region.update({'plugged': False}, 20)
+    assert fired == ['unplugged'] * 3
+
+def test_transition_action_runs_before_state_action():
+    fired = []
+    region = Region('r', [State('a'), State('b', lambda data: fired.append('state'))], [
+        Transition(None, 'a', lambda data: True),
+        Transition('a', 'b', lambda data: data, action=lambda data: fired.append('transition')),
+    ])
+    region.update(False, 0)
+    region.update(True, 1)
+    assert fired == ['transition', 'state']
+
+def test_any_source_skips_target():
+    region = Region('r', [State('a'), State('b'), State('c')], [
+        Transition(ANY, 'c', lambda data: data == 'c'),
+    ])
+    assert [transition.key for transition in region.live['a']] == ['*->c']
+    assert region.live['c'] == []
+
+def test_unknown_state_raises():
+    with pytest.raises(ValueError):
+        Region('r', [State('a')], [Transition('a', 'b', lambda data: True)])
+
+def test_machine_updates_selected_regions_and_counts(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(state_machine.time, 'monotonic', lambda: now[0])
+    fired = []
+    other = Region('other', [State('x')], [Transition(None, 'x', lambda data: True)])
+    machine = StateMachine([make_power_region(fired), other])
+    machine.update({'plugged': True}, regions=['power'])
+    assert machine.state('power') == 'plugged'
+    assert machine.state('other') is None
+    machine.update({'plugged': False})
+    assert machine.next_deadline() == 2
+    now[0] = 2
+    machine.update({'plugged': False})
+    assert machine.state('power') == 'unplugged'
+    stats = machine.get_stats()
+    assert stats['regions']['power']['transitions']['plugged->unplugged']['count'] == 1
+    assert stats['regions']['power']['transitions']['plugged->unplugged']['dwell']['count'] == 1
+    assert stats['regions']['other']['state'] == 'x'